@@ -257,6 +257,7 @@ def _create_tables(app):
         from app_backend.model.rank_model import RankModel
         from app_backend.model.graph_model import GraphModel
         from app_backend.model.competition_model import CompetitionModel
+        from app_backend.model.upload_model import UploadModel
 
         db.create_all()
         logger.info('Database tables created successfully')
@@ -265,6 +266,23 @@ def _create_tables(app):
         raise
 
 
+def _backfill_uploads(app):
+    """
+    为改动前创建的任务补建提交记录，已全部补建时只执行一次查询。
+    多个进程同时启动时由锁串行执行，失败时不影响启动，可手动执行 python -m app_backend.utils.backfill_uploads
+    """
+    from redis.lock import Lock
+    from app_backend.model.upload_model import UploadModel
+
+    try:
+        with Lock(redis_client, 'upload_backfill_lock', timeout=600):
+            count = UploadModel.backfill()
+        if count:
+            logger.info(f'Backfilled {count} uploads for existing tasks')
+    except Exception as e:
+        logger.error(f'Failed to backfill uploads, run python -m app_backend.utils.backfill_uploads manually: {e}')
+
+
 def _create_super_admin(app):
     """Create super admin user if configured in environment variables."""
 
@@ -403,6 +421,8 @@ def create_app():
     with app.app_context():
         # Create database tables
         _create_tables(app)
+        # Backfill upload records for tasks created before the upload table existed
+        _backfill_uploads(app)
         # Create super admin user if configured
         _create_super_admin(app)
         # Create guest if configured
@@ -0,0 +1,3 @@
+from app_backend.analysis.bench.runner import main
+
+main()
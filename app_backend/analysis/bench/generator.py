@@ -0,0 +1,91 @@
+"""
+生成合成的mahimahi上行日志（--uplink-log），格式与TunnelParse解析的一致：
+    <ts> # <bytes>                    链路发送机会（容量）
+    <ts> + <bytes> [flow_id]          数据包进入队列
+    <ts> - <bytes> <delay> [flow_id]  数据包离开队列，delay为排队时延（ms）
+单flow时与mahimahi一致不写flow_id列。
+"""
+
+import numpy as np
+
+DELAY_DISTRIBUTIONS = ('exponential', 'uniform', 'constant', 'pareto')
+
+MTU_BYTES = 1504
+
+
+def _sample_delays(rng, distribution, mean_ms, size):
+    if distribution == 'exponential':
+        delays = rng.exponential(mean_ms, size)
+    elif distribution == 'uniform':
+        delays = rng.uniform(0, 2 * mean_ms, size)
+    elif distribution == 'constant':
+        delays = np.full(size, float(mean_ms))
+    elif distribution == 'pareto':
+        # 长尾分布，a=3时均值为 mean_ms
+        delays = (rng.pareto(3.0, size) + 1) * mean_ms * 2 / 3
+    else:
+        raise ValueError(f"Unknown delay distribution: {distribution}, expected one of {DELAY_DISTRIBUTIONS}")
+    return delays.astype(np.int64)
+
+
+def generate_uplink_log(path, duration_s=60, packet_rate=1000, flows=1, capacity_rate=None,
+                        delay_distribution='exponential', delay_mean_ms=50, loss_rate=0.01, seed=0,
+                        chunk_lines=200000):
+    """
+    生成合成日志
+    :param path: 日志保存路径
+    :param duration_s: 日志时长（秒）
+    :param packet_rate: 所有flow合计每秒进入队列的包数
+    :param flows: flow数量
+    :param capacity_rate: 每秒链路发送机会数，默认为packet_rate的1.25倍
+    :param delay_distribution: 排队时延分布，见DELAY_DISTRIBUTIONS
+    :param delay_mean_ms: 排队时延均值（ms）
+    :param loss_rate: 丢包率，被丢弃的包只有进入记录没有离开记录
+    :param seed: 随机数种子，相同参数生成的日志完全一致
+    :param chunk_lines: 每次写入的行数
+    :return: 生成的日志行数（不含注释行）
+    """
+    rng = np.random.default_rng(seed)
+    if capacity_rate is None:
+        capacity_rate = packet_rate * 1.25
+    base_ts = 1000
+    duration_ms = int(duration_s * 1000)
+
+    n_capacity = int(duration_s * capacity_rate)
+    capacity_ts = base_ts + np.sort(rng.integers(0, duration_ms, n_capacity))
+
+    n_packets = int(duration_s * packet_rate)
+    arrival_ts = base_ts + np.sort(rng.integers(0, duration_ms, n_packets))
+    packet_bytes = rng.choice([MTU_BYTES, MTU_BYTES, MTU_BYTES, 100], n_packets)
+    packet_flows = rng.integers(0, flows, n_packets) + 1
+    delivered = rng.random(n_packets) >= loss_rate
+    delays = _sample_delays(rng, delay_distribution, delay_mean_ms, int(delivered.sum()))
+    departure_ts = arrival_ts[delivered] + delays
+
+    # 按时间戳合并三类事件，时间戳相同时保持 容量、到达、离开 的顺序
+    ts = np.concatenate((capacity_ts, arrival_ts, departure_ts))
+    event = np.concatenate((np.zeros(n_capacity, dtype=np.int8), np.ones(n_packets, dtype=np.int8),
+                            np.full(departure_ts.size, 2, dtype=np.int8)))
+    num_bytes = np.concatenate((np.full(n_capacity, MTU_BYTES), packet_bytes, packet_bytes[delivered]))
+    delay = np.concatenate((np.zeros(n_capacity + n_packets, dtype=np.int64), delays))
+    flow = np.concatenate((np.zeros(n_capacity, dtype=np.int64), packet_flows, packet_flows[delivered]))
+    order = np.lexsort((event, ts))
+
+    with open(path, 'w') as f:
+        f.write("# mahimahi mm-link (synthetic) [bench]\n")
+        f.write(f"# init timestamp: {base_ts}\n")
+        f.write(f"# base timestamp: {base_ts}\n")
+        for start in range(0, order.size, chunk_lines):
+            idx = order[start:start + chunk_lines]
+            lines = []
+            for t, e, b, d, fl in zip(ts[idx].tolist(), event[idx].tolist(), num_bytes[idx].tolist(),
+                                      delay[idx].tolist(), flow[idx].tolist()):
+                if e == 0:
+                    lines.append(f"{t} # {b}")
+                elif e == 1:
+                    lines.append(f"{t} + {b} {fl}" if flows > 1 else f"{t} + {b}")
+                else:
+                    lines.append(f"{t} - {b} {d} {fl}" if flows > 1 else f"{t} - {b} {d}")
+            f.write('\n'.join(lines))
+            f.write('\n')
+    return int(order.size)
@@ -0,0 +1,193 @@
+"""
+TunnelParse基准测试，统计解析、绘图及评分计算耗时随日志长度的变化，结果保存为json报告，可在不同提交间对比。
+
+用法（在项目根目录执行，需要与后端相同的环境配置）：
+    python -m app_backend.analysis.bench --durations 30,120,600 --output bench.json
+    python -m app_backend.analysis.bench --output new.json --compare old.json
+
+每个用例（日志时长 x 解析引擎）在独立的子进程中执行，峰值内存（RSS）互不影响。
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+
+from app_backend.analysis.bench.generator import DELAY_DISTRIBUTIONS, generate_uplink_log
+from app_backend.analysis.score_evaluate import calculate_score
+from app_backend.analysis.tunnel_parse import PARSE_ENGINES, TunnelParse
+
+# 评分计算使用的评测用例配置，仅用于计时
+_SCORE_WEIGHTS = {'throughput': 0.35, 'loss': 0.3, 'delay': 0.35}
+
+
+def _peak_rss_mb():
+    # Linux下ru_maxrss单位为KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_case(log_path, engine, work_dir, repeat):
+    """在子进程中执行单个用例，返回各步骤的最短耗时（秒）及峰值内存（MB）"""
+    result = {'engine': engine}
+
+    def _best(func):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            value = func()
+            times.append(time.perf_counter() - start)
+        return min(times), value
+
+    # 仅评分：不保存逐包时延
+    result['parse_s'], tunnel_results = _best(
+        lambda: TunnelParse(tunnel_log=log_path, ms_per_bin=500, engine=engine, keep_delays=False).parse())
+    result['parse_peak_rss_mb'] = _peak_rss_mb()
+
+    result['score_s'], _ = _best(
+        lambda: calculate_score(tunnel_results['throughput'], tunnel_results['capacity'], tunnel_results['delay'],
+                                tunnel_results['loss'], 0.0, 20, _SCORE_WEIGHTS))
+
+    # 评分并保存逐包时延，与训练任务相同
+    result['parse_keep_delays_s'], _ = _best(
+        lambda: TunnelParse(tunnel_log=log_path, ms_per_bin=500, engine=engine, keep_delays=True).parse())
+
+    def _graph():
+        tunnel_graph = TunnelParse(tunnel_log=log_path, ms_per_bin=500, engine=engine,
+                                   throughput_graph=os.path.join(work_dir, f'{engine}.throughput.png'),
+                                   delay_graph=os.path.join(work_dir, f'{engine}.delay.png'))
+        tunnel_graph.parse()
+        start = time.perf_counter()
+        tunnel_graph.graph()
+        return time.perf_counter() - start
+
+    result['parse_and_graph_s'], result['graph_only_s'] = _best(_graph)
+    result['peak_rss_mb'] = _peak_rss_mb()
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(durations, packet_rate, flows, delay_distribution, delay_mean_ms, loss_rate, engines, repeat,
+                  seed):
+    """
+    生成各时长的日志并依次执行所有用例
+    :return: dict，json报告内容
+    """
+    import matplotlib
+    import numpy as np
+
+    report = {
+        'meta': {
+            'commit': _git_commit(),
+            'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'matplotlib': matplotlib.__version__,
+            'platform': platform.platform(),
+            'packet_rate': packet_rate,
+            'flows': flows,
+            'delay_distribution': delay_distribution,
+            'delay_mean_ms': delay_mean_ms,
+            'loss_rate': loss_rate,
+            'repeat': repeat,
+            'seed': seed,
+        },
+        'cases': [],
+    }
+    with tempfile.TemporaryDirectory(prefix='tunnel_parse_bench_') as work_dir:
+        for duration in durations:
+            log_path = os.path.join(work_dir, f'{duration:g}s.log')
+            start = time.perf_counter()
+            lines = generate_uplink_log(log_path, duration_s=duration, packet_rate=packet_rate, flows=flows,
+                                        delay_distribution=delay_distribution, delay_mean_ms=delay_mean_ms,
+                                        loss_rate=loss_rate, seed=seed)
+            generate_s = time.perf_counter() - start
+            log_mb = os.path.getsize(log_path) / 1024 / 1024
+            print(f"[bench] {duration:g}s log: {lines} lines, {log_mb:.1f} MB, generated in {generate_s:.2f}s",
+                  file=sys.stderr)
+
+            for engine in engines:
+                # 每个用例使用新的子进程，保证峰值内存只包含该用例
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+                    case = pool.submit(_run_case, log_path, engine, work_dir, repeat).result()
+                case.update({'name': f'{duration:g}s-{engine}', 'duration_s': duration, 'lines': lines,
+                             'log_mb': round(log_mb, 2)})
+                report['cases'].append(case)
+                print(f"[bench] {case['name']}: parse {case['parse_s']:.3f}s, "
+                      f"parse(keep delays) {case['parse_keep_delays_s']:.3f}s, graph {case['graph_only_s']:.3f}s, "
+                      f"peak RSS {case['peak_rss_mb']:.0f} MB", file=sys.stderr)
+            os.remove(log_path)
+    return report
+
+
+def compare_reports(old_report, new_report):
+    """
+    对比两份报告中同名用例的耗时和内存
+    :return: str，每个用例一行，括号内为相对旧报告的变化
+    """
+    metrics = ('parse_s', 'parse_keep_delays_s', 'graph_only_s', 'score_s', 'peak_rss_mb')
+    old_cases = {case['name']: case for case in old_report['cases']}
+    lines = [f"compare {old_report['meta'].get('commit')} -> {new_report['meta'].get('commit')}"]
+    for case in new_report['cases']:
+        old_case = old_cases.get(case['name'])
+        if old_case is None:
+            lines.append(f"{case['name']}: not in old report")
+            continue
+        items = []
+        for metric in metrics:
+            old_value, new_value = old_case.get(metric), case.get(metric)
+            if old_value is None or new_value is None:
+                continue
+            change = (new_value - old_value) / old_value * 100 if old_value else 0
+            items.append(f"{metric} {old_value:.3f} -> {new_value:.3f} ({change:+.1f}%)")
+        lines.append(f"{case['name']}: " + ', '.join(items))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app_backend.analysis.bench',
+                                     description='Benchmark TunnelParse on synthetic mahimahi uplink logs')
+    parser.add_argument('--durations', default='30,120,600', help='日志时长（秒），逗号分隔')
+    parser.add_argument('--packet-rate', type=int, default=1000, help='每秒进入队列的包数')
+    parser.add_argument('--flows', type=int, default=1, help='flow数量')
+    parser.add_argument('--delay-distribution', default='exponential', choices=DELAY_DISTRIBUTIONS)
+    parser.add_argument('--delay-mean-ms', type=float, default=50)
+    parser.add_argument('--loss-rate', type=float, default=0.01)
+    parser.add_argument('--engines', default=','.join(PARSE_ENGINES), help='解析引擎，逗号分隔')
+    parser.add_argument('--repeat', type=int, default=1, help='每个步骤重复次数，取最短耗时')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='json报告保存路径，不填则输出到标准输出')
+    parser.add_argument('--compare', help='与之前的json报告对比')
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(durations=[float(d) for d in args.durations.split(',')], packet_rate=args.packet_rate,
+                           flows=args.flows, delay_distribution=args.delay_distribution,
+                           delay_mean_ms=args.delay_mean_ms, loss_rate=args.loss_rate,
+                           engines=args.engines.split(','), repeat=args.repeat, seed=args.seed)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare_reports(json.load(f), report), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
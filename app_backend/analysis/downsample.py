@@ -0,0 +1,92 @@
+"""
+绘图前的降采样，将序列的点数限制在给定数量以内，使绘图耗时与日志长度无关。
+与固定步长抽样不同，以下方法都会保留序列中的极值（例如时延尖峰）。
+"""
+
+import numpy as np
+
+DOWNSAMPLER_MINMAX = 'minmax'
+DOWNSAMPLER_LTTB = 'lttb'
+
+
+def minmax(x, y, max_points):
+    """
+    将x轴等分为max_points/2个区间（相当于图像的像素列），每个区间保留y的最小值和最大值对应的点
+    :param x: 横坐标序列
+    :param y: 纵坐标序列，与x等长
+    :param max_points: 最多保留的点数
+    :return: (x, y) 降采样后的numpy数组，保持原有顺序
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if x.size <= max_points:
+        return x, y
+
+    n_buckets = max(max_points // 2, 1)
+    x_min = x.min()
+    x_range = x.max() - x_min
+    if x_range > 0:
+        buckets = np.minimum(((x - x_min) / x_range * n_buckets).astype(np.int64), n_buckets - 1)
+    else:
+        buckets = np.zeros(x.size, dtype=np.int64)
+
+    # 按(区间, y)排序后，每个区间的第一个点为最小值，最后一个点为最大值
+    order = np.lexsort((y, buckets))
+    sorted_buckets = buckets[order]
+    bounds = np.flatnonzero(np.diff(sorted_buckets)) + 1
+    first = np.concatenate(([0], bounds))
+    last = np.concatenate((bounds - 1, [order.size - 1]))
+    keep = np.unique(np.concatenate((order[first], order[last])))
+    return x[keep], y[keep]
+
+
+def lttb(x, y, max_points):
+    """
+    Largest-Triangle-Three-Buckets降采样，要求x递增。
+    每个区间选取与前一个已选点、下一区间均值构成的三角形面积最大的点，能较好地保留曲线形状和尖峰
+    :param x: 横坐标序列（递增）
+    :param y: 纵坐标序列，与x等长
+    :param max_points: 最多保留的点数，少于3时改用minmax
+    :return: (x, y) 降采样后的numpy数组
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if x.size <= max_points:
+        return x, y
+    if max_points < 3:
+        return minmax(x, y, max_points)
+
+    # 首尾两点固定保留，中间的点等分为max_points-2个区间
+    edges = np.linspace(1, x.size - 1, max_points - 1).astype(np.int64)
+    keep = np.empty(max_points, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = x.size - 1
+    prev = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < edges.size:
+            next_x = x[end:edges[i + 2]].mean()
+            next_y = y[end:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        areas = np.abs((x[prev] - next_x) * (y[start:end] - y[prev]) -
+                       (x[prev] - x[start:end]) * (next_y - y[prev]))
+        prev = start + int(np.argmax(areas))
+        keep[i + 1] = prev
+    return x[keep], y[keep]
+
+
+DOWNSAMPLERS = {
+    DOWNSAMPLER_MINMAX: minmax,
+    DOWNSAMPLER_LTTB: lttb,
+}
+
+
+def downsample(x, y, max_points, method=DOWNSAMPLER_MINMAX):
+    """
+    :param method: 降采样方法，DOWNSAMPLERS中的key
+    :return: (x, y) 点数不超过max_points的numpy数组
+    """
+    if method not in DOWNSAMPLERS:
+        raise ValueError(f"Unknown downsampler: {method}, expected one of {tuple(DOWNSAMPLERS)}")
+    return DOWNSAMPLERS[method](x, y, max_points)
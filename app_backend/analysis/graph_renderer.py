@@ -0,0 +1,139 @@
+"""
+性能图渲染，直接使用Agg画布绘图，不经过pyplot的全局状态。
+每个线程为每种图创建并复用自己的模板：Figure、坐标轴标签、网格等版式只在创建时设置一次，
+曲线、散点及阴影区域的artist创建后保留，之后每次绘制只替换数据、颜色及图例文字。
+多个绘图线程可并行绘制，互不影响。
+matplotlib在首次绘图时才导入，只评分不绘图的进程无需加载。
+"""
+
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+FIGURE_SIZE = (12, 6)
+LABEL_FONT_SIZE = 12
+
+_local = threading.local()
+
+
+class GraphTemplate(object):
+    """
+    可复用的性能图模板。每次绘制前调用begin()隐藏上次的artist，依次调用fill()、line()、scatter()
+    放入本次的数据，最后调用autoscale()按本次的数据重新计算坐标范围
+    """
+
+    def __init__(self, xlabel, ylabel):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        self.fig = Figure(figsize=FIGURE_SIZE)
+        FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+        self.ax.set_xlabel(xlabel, fontsize=LABEL_FONT_SIZE)
+        self.ax.set_ylabel(ylabel, fontsize=LABEL_FONT_SIZE)
+        self.ax.grid()
+
+        self._fills = []
+        self._lines = []
+        self._scatters = []
+        self._used = {'fill': 0, 'line': 0, 'scatter': 0}
+        # 本次绘制中带图例的artist，按放入的顺序
+        self.legend_items = []
+
+    def begin(self):
+        """开始一次绘制，隐藏上次使用的artist并恢复自动缩放"""
+        self.release()
+        self._used = {'fill': 0, 'line': 0, 'scatter': 0}
+        self.legend_items = []
+        self.ax.set_title('')
+        self.ax.set_autoscale_on(True)
+
+    def release(self):
+        """清空所有artist的数据并隐藏，不再引用上次绘制的数据"""
+        for fill in self._fills:
+            fill.set_verts([])
+            fill.set_visible(False)
+        for line in self._lines:
+            line.set_data([], [])
+            line.set_visible(False)
+        for scatter in self._scatters:
+            scatter.set_offsets(np.empty((0, 2)))
+            scatter.set_visible(False)
+        legend = self.ax.get_legend()
+        if legend is not None:
+            legend.remove()
+
+    def _next(self, kind, pool, create):
+        index = self._used[kind]
+        self._used[kind] += 1
+        if index == len(pool):
+            pool.append(create())
+        artist = pool[index]
+        artist.set_visible(True)
+        return artist
+
+    def fill(self, x, y, facecolor):
+        """y与0之间的阴影区域，与ax.fill_between(x, 0, y)相同"""
+        fill = self._next('fill', self._fills, lambda: self.ax.fill_between([], 0, []))
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        verts = np.concatenate(([[x[0], 0.0]], np.column_stack((x, y)), [[x[-1], 0.0]]))
+        fill.set_verts([verts])
+        fill.set_facecolor(facecolor)
+        return fill
+
+    def line(self, x, y, label, color, linestyle='solid'):
+        line = self._next('line', self._lines, lambda: self.ax.plot([], [])[0])
+        line.set_data(x, y)
+        line.set_color(color)
+        line.set_linestyle(linestyle)
+        line.set_label(label)
+        self.legend_items.append(line)
+        return line
+
+    def scatter(self, x, y, label, color, size=1, marker='.'):
+        scatter = self._next('scatter', self._scatters, lambda: self.ax.scatter([], [], s=size, marker=marker))
+        scatter.set_offsets(np.column_stack((x, y)))
+        scatter.set_color(color)
+        scatter.set_label(label)
+        self.legend_items.append(scatter)
+        return scatter
+
+    def autoscale(self):
+        """按本次放入的数据重新计算坐标范围，relim()不包含阴影区域和散点，需单独加入"""
+        self.ax.relim(visible_only=True)
+        for fill in self._fills[:self._used['fill']]:
+            for path in fill.get_paths():
+                self.ax.update_datalim(path.vertices)
+        for scatter in self._scatters[:self._used['scatter']]:
+            self.ax.update_datalim(scatter.get_offsets())
+        self.ax.autoscale_view()
+
+
+def _get_template(name, xlabel, ylabel):
+    templates = getattr(_local, 'templates', None)
+    if templates is None:
+        templates = _local.templates = {}
+
+    if name not in templates:
+        templates[name] = GraphTemplate(xlabel, ylabel)
+    return templates[name]
+
+
+@contextmanager
+def graph_template(name, xlabel, ylabel):
+    """
+    获取当前线程中名为name的模板，首次使用时创建，之后重复使用。
+    退出时清空各artist的数据，释放本次绘制的数据。
+    :param name: 图的名称，不同类型的图使用不同名称，例如 throughput、delay
+    :param xlabel: x轴标签，只在创建模板时设置
+    :param ylabel: y轴标签，只在创建模板时设置
+    :return: GraphTemplate
+    """
+    template = _get_template(name, xlabel, ylabel)
+    template.begin()
+    try:
+        yield template
+    finally:
+        template.release()
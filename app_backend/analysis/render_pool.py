@@ -0,0 +1,112 @@
+"""
+绘图进程池。解析日志和matplotlib绘图都是CPU密集型操作，在Dramatiq线程中执行会受GIL限制无法并行，
+这里交给独立的子进程执行，绘图任务线程只负责等待结果和更新数据库。
+"""
+
+import logging
+import os
+import resource
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from app_backend.analysis.tunnel_parse import TunnelParse
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _limit_memory(memory_limit_mb):
+    """子进程初始化：限制虚拟内存大小，超出时绘图抛出MemoryError，不影响其他进程"""
+    if memory_limit_mb > 0:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def render_task_graphs(result_path, parse_cache, graph_data_path, throughput_graph=None, delay_graph=None,
+                       downsampler=None, max_plot_points=None):
+    """
+    加载解析结果（不存在或不含时延序列时解析原始日志），保存性能图数据并绘制性能图，可在子进程中执行
+    :param result_path: 原始日志路径
+    :param parse_cache: 评分时保存的解析结果路径
+    :param graph_data_path: 性能图数据（json）保存路径
+    :param throughput_graph: 吞吐图保存路径，为None时不绘制
+    :param delay_graph: 时延图保存路径，为None时不绘制
+    :param downsampler: 降采样方法
+    :param max_plot_points: 每条序列最多绘制的点数
+    :return: str，解析结果来源，'cache' 或 'log'
+    """
+    kwargs = {'downsampler': downsampler, 'max_plot_points': max_plot_points}
+    kwargs = {key: value for key, value in kwargs.items() if value is not None}
+
+    tunnel_graph = None
+    source = 'cache'
+    if os.path.exists(parse_cache):
+        tunnel_graph = TunnelParse.load_parsed(parse_cache, throughput_graph=throughput_graph,
+                                               delay_graph=delay_graph, **kwargs)
+        # 仅含时延直方图的解析结果无法绘制时延图，回退到解析原始日志
+        if not tunnel_graph.keep_delays and os.path.exists(result_path):
+            tunnel_graph = None
+    if tunnel_graph is None:
+        source = 'log'
+        # 性能图数据中包含时延序列，无论是否绘制时延图都需要保留
+        tunnel_graph = TunnelParse(tunnel_log=result_path, throughput_graph=throughput_graph,
+                                   delay_graph=delay_graph, ms_per_bin=500, keep_delays=True, **kwargs)
+
+    tunnel_graph.save_graph_data(graph_data_path)
+    if throughput_graph or delay_graph:
+        tunnel_graph.graph()
+    return source
+
+
+def get_render_pool(processes, memory_limit_mb=0, max_tasks_per_child=None):
+    """
+    获取绘图进程池，首次调用时创建，同一进程内的所有绘图线程共用
+    :param processes: 子进程数量
+    :param memory_limit_mb: 每个子进程的虚拟内存上限（MB），0表示不限制
+    :param max_tasks_per_child: 每个子进程执行多少次绘图后重启，释放matplotlib缓存等占用的内存，None表示不重启，
+                                需要Python 3.11及以上，更低版本忽略此参数
+    :return: ProcessPoolExecutor
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            kwargs = {}
+            if max_tasks_per_child is not None:
+                if sys.version_info >= (3, 11):
+                    kwargs['max_tasks_per_child'] = max_tasks_per_child
+                else:
+                    logger.warning("max_tasks_per_child requires Python 3.11+, render processes will not be restarted")
+                    max_tasks_per_child = None
+            # 使用spawn启动子进程，避免fork时复制Dramatiq线程持有的锁及数据库连接
+            _pool = ProcessPoolExecutor(max_workers=processes, mp_context=get_context('spawn'),
+                                        initializer=_limit_memory, initargs=(memory_limit_mb,), **kwargs)
+            logger.info(f"Render process pool created with {processes} processes, "
+                        f"memory limit {memory_limit_mb} MB, max tasks per child {max_tasks_per_child}")
+        return _pool
+
+
+def submit_render(processes, memory_limit_mb, max_tasks_per_child, *args, **kwargs):
+    """
+    在绘图进程池中执行render_task_graphs并等待结果。
+    子进程异常退出（例如被系统杀死）导致进程池不可用时，丢弃该进程池，下次调用时重新创建
+    :return: render_task_graphs()的返回值
+    """
+    global _pool
+    pool = get_render_pool(processes, memory_limit_mb, max_tasks_per_child)
+    try:
+        return pool.submit(render_task_graphs, *args, **kwargs).result()
+    except BrokenProcessPool:
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        if sys.version_info >= (3, 9):
+            pool.shutdown(wait=False, cancel_futures=True)
+        else:
+            pool.shutdown(wait=False)
+        logger.error("Render process pool is broken, it will be recreated on next render")
+        raise
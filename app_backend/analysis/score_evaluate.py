@@ -8,10 +8,17 @@ logger = logging.getLogger(__name__)
 config = get_default_config()
 
 
-def evaluate_score(task: TaskModel, log_file):
-    # 评分
-    tunnel_graph = TunnelParse(tunnel_log=log_file, ms_per_bin=500)
+def evaluate_score(task: TaskModel, log_file, parse_cache=None, tunnel_graph=None):
+    # 评分，需要保存解析结果供绘图时才保留逐包时延，否则只统计直方图。
+    # 评测流程总会保存解析结果（绘图任务生成的性能图数据包含时延序列），只统计直方图仅用于不绘图的调用方
+    # 评测期间已增量解析日志时直接使用其结果
+    if tunnel_graph is None:
+        tunnel_graph = TunnelParse(tunnel_log=log_file, ms_per_bin=500, keep_delays=parse_cache is not None)
     tunnel_results = tunnel_graph.parse()
+    # 保存解析结果，绘图任务直接加载，无需再次解析日志
+    if parse_cache:
+        tunnel_graph.save_parsed(parse_cache)
+        logger.info(f"[task: {task.task_id}] Saved parsed tunnel log to {parse_cache}")
     throughput = tunnel_results['throughput']
     queueing_delay = tunnel_results['delay']
     capacity = tunnel_results['capacity']
@@ -22,6 +29,41 @@ def evaluate_score(task: TaskModel, log_file):
         logger.error(f"[task: {task.task_id}] Invalid tunnel results: delay({queueing_delay}), loss({tunnel_loss})")
         raise ValueError("未检测到任何流量，请检查代码或联系管理员确认评测用例配置是否正确。")
 
+    trace_conf = config.get_course_trace_config(task.cname, task.trace_name)
+    result = calculate_score(throughput, capacity, queueing_delay, tunnel_loss, task.loss_rate, task.delay,
+                             trace_conf['score_weights'])
+    score = result['score']
+    throughput_score = result['throughput_score']
+    loss_score = result['loss_score']
+    latency_score = result['delay_score']
+    efficiency = result['efficiency']
+    loss_rate = result['loss_rate']
+    delay_inflation = result['delay_inflation']
+    if loss_rate < 0:
+        logger.error(f"[task: {task.task_id}] Loss rate({loss_rate}) is negative, is this expected?")
+    logger.info(
+        f"[task: {task.task_id}] Calculated score: {score} (throughput_score: {throughput_score}, delay_score: {latency_score}, loss_score: {loss_score})" +
+        f"by efficiency: {efficiency}(throughput({throughput})/capacity({capacity})), "
+        f"delay_inflation: {delay_inflation}(queueing_delay({queueing_delay})/delay_conf({task.delay})), "
+        f"loss_rate: {loss_rate}(tunnel_loss({tunnel_loss})-loss_conf({task.loss_rate}))")
+    # 更新任务的分数
+    task.update(task_score=score, loss_score=loss_score, delay_score=latency_score, throughput_score=throughput_score)
+
+    return score
+
+
+def calculate_score(throughput, capacity, queueing_delay, tunnel_loss, loss_conf, delay_conf, score_weights):
+    """
+    由日志解析结果计算评分，不依赖任务和数据库
+    :param throughput: 平均吞吐量（Mbit/s）
+    :param capacity: 链路平均容量（Mbit/s）
+    :param queueing_delay: 95分位排队时延（ms）
+    :param tunnel_loss: 日志统计的丢包率
+    :param loss_conf: 评测用例配置的随机丢包率
+    :param delay_conf: 评测用例配置的单向传播时延（ms）
+    :param score_weights: 各项评分的权重，包含throughput、loss、delay
+    :return: dict，包含score、throughput_score、loss_score、delay_score及efficiency、loss_rate、delay_inflation
+    """
     # 1. 吞吐量效率评分 (0-100分)
     # 基于理论吞吐量的利用率
     efficiency = 0
@@ -35,9 +77,7 @@ def evaluate_score(task: TaskModel, log_file):
         throughput_score = 0
 
     # 2. 丢包控制评分 (0-100分)
-    loss_rate = tunnel_loss - task.loss_rate
-    if loss_rate < 0:
-        logger.error(f"[task: {task.task_id}] Loss rate({loss_rate}) is negative, is this expected?")
+    loss_rate = tunnel_loss - loss_conf
     if loss_rate <= 0.000001:
         loss_score = 100
     elif loss_rate >= 1:
@@ -50,8 +90,8 @@ def evaluate_score(task: TaskModel, log_file):
     # queueing_delay是排队时延，delay是单向传播延迟
     # 此处计算实际上只考虑的sender出方向
     delay_inflation = 2.0
-    if task.delay > 0:
-        delay_inflation = queueing_delay / task.delay
+    if delay_conf > 0:
+        delay_inflation = queueing_delay / delay_conf
     if delay_inflation <= 10:
         # delay_inflation at least 0
         latency_score = 20 + 80 * (10 - delay_inflation) / 10
@@ -59,15 +99,8 @@ def evaluate_score(task: TaskModel, log_file):
         latency_score = 100 * 2 / delay_inflation
 
     # 计算总分
-    trace_conf = config.get_course_trace_config(task.cname, task.trace_name)
-    score = trace_conf['score_weights']['throughput'] * throughput_score + trace_conf['score_weights'][
-        'loss'] * loss_score + trace_conf['score_weights']['delay'] * latency_score
-    logger.info(
-        f"[task: {task.task_id}] Calculated score: {score} (throughput_score: {throughput_score}, delay_score: {latency_score}, loss_score: {loss_score})" +
-        f"by efficiency: {efficiency}(throughput({throughput})/capacity({capacity})), "
-        f"delay_inflation: {delay_inflation}(queueing_delay({queueing_delay})/delay_conf({task.delay})), "
-        f"loss_rate: {loss_rate}(tunnel_loss({tunnel_loss})-loss_conf({task.loss_rate}))")
-    # 更新任务的分数
-    task.update(task_score=score, loss_score=loss_score, delay_score=latency_score, throughput_score=throughput_score)
-
-    return score
+    score = score_weights['throughput'] * throughput_score + score_weights['loss'] * loss_score + \
+        score_weights['delay'] * latency_score
+    return {'score': score, 'throughput_score': throughput_score, 'loss_score': loss_score,
+            'delay_score': latency_score, 'efficiency': efficiency, 'loss_rate': loss_rate,
+            'delay_inflation': delay_inflation}
@@ -1,168 +1,507 @@
 #!/usr/bin/env python
 
 import itertools
+import json
 import math
+import os
 import sys
 
-import matplotlib
-
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 import numpy as np
 
-
-def sample_data(data, sample_rate):
-    return data[::sample_rate]
+from app_backend.analysis.downsample import DOWNSAMPLER_MINMAX, downsample
+from app_backend.analysis.graph_renderer import graph_template
 
 
 def flip(items, ncol):
     return list(itertools.chain(*[items[i::ncol] for i in range(ncol)]))
 
 
-class TunnelParse(object):
-    def __init__(self, tunnel_log, throughput_graph=None, delay_graph=None,
-                 ms_per_bin=500):
-        self.total_duration = None
-        self.egress_tput = None
-        self.ingress_tput = None
-        self.avg_capacity = None
-        self.delays = None
-        self.delays_t = None
-        self.flows = None
-        self.tunnel_log = tunnel_log
-        self.throughput_graph = throughput_graph
-        self.delay_graph = delay_graph
+# 解析引擎：python为逐行解析的原始实现，numpy为按列加载后向量化计算的实现，两者结果一致
+PARSE_ENGINE_PYTHON = 'python'
+PARSE_ENGINE_NUMPY = 'numpy'
+PARSE_ENGINES = (PARSE_ENGINE_PYTHON, PARSE_ENGINE_NUMPY)
+
+# 日志事件类型，对应日志第二列的 '#'（链路容量）、'+'（到达）、'-'（离开）
+EVENT_CAPACITY = 0
+EVENT_ARRIVAL = 1
+EVENT_DEPARTURE = 2
+
+# 事件类型字节 -> 对应数字的字节，其余字节为0
+_EVENT_CODES = np.zeros(256, dtype=np.uint8)
+_EVENT_CODES[[ord('#'), ord('+'), ord('-')]] = [ord('0'), ord('1'), ord('2')]
+# 替换事件类型后，数值字段中允许出现的字节（数字、符号、小数点、指数及空白）
+_NUMERIC_BYTES = np.zeros(256, dtype=bool)
+_NUMERIC_BYTES[[ord(c) for c in '0123456789+-.eE']] = True
+_NUMERIC_BYTES[:ord(' ') + 1] = True
+
+
+def load_tunnel_log(tunnel_log):
+    """
+    将mahimahi日志加载为按列存放的数组，跳过以'#'开头的注释行及空行
+    :param tunnel_log: 日志路径
+    :return: (ts, event, num_bits, delay, flow)，delay仅对离开事件有效，其余行为0
+    """
+    return parse_tunnel_columns(np.fromfile(tunnel_log, dtype=np.uint8), tunnel_log)
+
+
+def parse_tunnel_columns(buf, source=None):
+    """
+    将mahimahi日志内容解析为按列存放的数组，跳过以'#'开头的注释行及空行
+    :param buf: 日志内容，uint8数组，由完整的行组成（最后一行可以没有换行符），不会被修改
+    :param source: 日志来源，用于错误信息
+    :return: (ts, event, num_bits, delay, flow)，delay仅对离开事件有效，其余行为0
+    """
+    if buf.size == 0 or buf[-1] != ord('\n'):
+        buf = np.append(buf, np.uint8(ord('\n')))
+
+    line_ends = np.flatnonzero(buf == ord('\n'))
+    line_starts = np.concatenate(([0], line_ends[:-1] + 1))
+
+    # 删除注释行（空行的首字节为换行符，不会被当作注释行），注释行通常只出现在文件头部
+    comment_lines = np.flatnonzero(buf[line_starts] == ord('#'))
+    if comment_lines.size:
+        keep = np.ones(line_starts.size, dtype=bool)
+        keep[comment_lines] = False
+        segments = []
+        seg_start = 0
+        for line in comment_lines:
+            segments.append(buf[seg_start:line_starts[line]])
+            seg_start = line_ends[line] + 1
+        segments.append(buf[seg_start:])
+        buf = np.concatenate(segments)
+        line_lengths = (line_ends - line_starts + 1)[keep]
+        line_ends = np.cumsum(line_lengths) - 1
+        line_starts = line_ends - line_lengths + 1
+    else:
+        buf = buf.copy()
+
+    # 统计每行的字段数，字段起始位置为前一字节是空白（空格、制表符、换行等）的非空白字节
+    is_ws = buf <= ord(' ')
+    token_starts = ~is_ws
+    token_starts[1:] &= is_ws[:-1]
+    token_pos = np.flatnonzero(token_starts)
+    if token_pos.size == 0:
+        # 空日志或只有注释行，np.fromstring对不含数据的缓冲区仍会返回非空数组，需在校验字段数之前返回
+        return (np.zeros(0, dtype=np.float64), np.zeros(0, dtype=np.int8), np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype=np.float64), np.zeros(0, dtype=np.int64))
+    tokens_per_line = np.diff(np.searchsorted(token_pos, np.append(line_starts, buf.size)))
+    tokens_per_line = tokens_per_line[tokens_per_line > 0]
+    if (tokens_per_line < 3).any():
+        raise ValueError(f"Malformed tunnel log: {source}")
+    row_starts = np.cumsum(tokens_per_line) - tokens_per_line
+
+    # 只将每行第二个字段（事件类型）替换为数字，便于整体按数值解析，其他字段中的符号保持不变
+    event_pos = token_pos[row_starts + 1]
+    event_codes = _EVENT_CODES[buf[event_pos]]
+    if (event_codes == 0).any() or not is_ws[event_pos + 1].all():
+        raise ValueError(f"Malformed tunnel log: {source}")
+    buf[event_pos] = event_codes
+    # np.fromstring遇到无法解析的字节时会提前结束，且不一定导致字段数不一致
+    if not _NUMERIC_BYTES[buf].all():
+        raise ValueError(f"Malformed tunnel log: {source}")
+
+    values = np.fromstring(buf.tobytes(), dtype=np.float64, sep=' ')
+    if values.size != tokens_per_line.sum():
+        raise ValueError(f"Malformed tunnel log: {source}")
+
+    ts = values[row_starts]
+    event = values[row_starts + 1].astype(np.int8)
+    num_bits = values[row_starts + 2].astype(np.int64) * 8
+
+    delay = np.zeros(ts.size, dtype=np.float64)
+    flow = np.zeros(ts.size, dtype=np.int64)
+    departure = event == EVENT_DEPARTURE
+    delay[departure] = values[row_starts[departure] + 3]
+    # 多流日志在行尾带有flow_id
+    with_flow = ((event == EVENT_ARRIVAL) & (tokens_per_line == 4)) | (departure & (tokens_per_line == 5))
+    flow[with_flow] = values[row_starts[with_flow] + tokens_per_line[with_flow] - 1].astype(np.int64)
+
+    return ts, event, num_bits, delay, flow
+
+
+def parse_cache_path(tunnel_log):
+    """解析结果缓存文件路径，与日志文件放在同一目录，例如 trace_a.log -> trace_a.parsed.npz"""
+    return os.path.splitext(tunnel_log)[0] + '.parsed.npz'
+
+
+def percentile_nearest(values, q=95):
+    return np.percentile(values, q, method='nearest')
+
+
+class DelayHistogram(object):
+    """
+    时延直方图，按时延值计数，不保存每个样本。
+    mahimahi记录的时延为整数毫秒，不同取值很少，内存占用与样本数无关。
+    percentile()与np.percentile(..., method='nearest')的结果完全一致。
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+
+    def __len__(self):
+        return self.total
+
+    def add(self, delay):
+        self.counts[delay] = self.counts.get(delay, 0) + 1
+        self.total += 1
+
+    def merge(self, other):
+        for delay, count in other.counts.items():
+            self.counts[delay] = self.counts.get(delay, 0) + count
+        self.total += other.total
+
+    def add_array(self, delays):
+        """一次加入一批时延样本，按不同的取值向量化计数"""
+        values, counts = np.unique(delays, return_counts=True)
+        for delay, count in zip(values.tolist(), counts.tolist()):
+            self.counts[delay] = self.counts.get(delay, 0) + count
+        self.total += int(delays.size)
+
+    def percentile(self, q=95):
+        if self.total == 0:
+            return None
+        # 与numpy的nearest方法相同：取排序后下标为 around((n - 1) * q / 100) 的样本
+        rank = int(np.around((self.total - 1) * (q / 100)))
+        seen = 0
+        for delay in sorted(self.counts):
+            seen += self.counts[delay]
+            if seen > rank:
+                return np.float64(delay)
+
+
+class TunnelLogAccumulator(object):
+    """
+    逐行解析mahimahi日志的累加器，保存按bin统计的比特数、首末时间戳及时延等中间状态。
+    供python解析引擎使用，一次性读入整个日志。
+    """
+
+    def __init__(self, ms_per_bin=500, keep_delays=True):
         self.ms_per_bin = ms_per_bin
-
-    def ms_to_bin(self, ts, first_ts):
-        return int((ts - first_ts) / self.ms_per_bin)
-
-    def bin_to_s(self, bin_id):
-        return bin_id * self.ms_per_bin / 1000.0
-
-    def parse_tunnel_log(self):
-        tunlog = open(self.tunnel_log)
+        self.keep_delays = keep_delays
 
         self.flows = {}
-        first_ts = None
-        capacities = {}
+        self.first_ts = None
+        self.capacities = {}
 
-        arrivals = {}
-        departures = {}
+        self.arrivals = {}
+        self.departures = {}
         self.delays_t = {}
         self.delays = {}
+        self.delay_hists = {}
+
+        self.first_capacity = None
+        self.last_capacity = None
+        self.first_arrival = {}
+        self.last_arrival = {}
+        self.first_departure = {}
+        self.last_departure = {}
+
+        self.total_first_departure = None
+        self.total_last_departure = None
+        self.total_arrivals = 0
+        self.total_departures = 0
+
+    def feed(self, line):
+        if line.startswith('#'):
+            return
 
-        first_capacity = None
-        last_capacity = None
-        first_arrival = {}
-        last_arrival = {}
-        first_departure = {}
-        last_departure = {}
-
-        total_first_departure = None
-        total_last_departure = None
-        total_arrivals = 0
-        total_departures = 0
-
-        while True:
-            line = tunlog.readline()
-            if not line:
-                break
-
-            if line.startswith('#'):
-                continue
-
-            items = line.split()
-            ts = float(items[0])
-            event_type = items[1]
-            num_bits = int(items[2]) * 8
+        items = line.split()
+        if not items:
+            return
+        ts = float(items[0])
+        event_type = items[1]
+        num_bits = int(items[2]) * 8
 
-            if first_ts is None:
-                first_ts = ts
+        if self.first_ts is None:
+            self.first_ts = ts
 
-            bin_id = self.ms_to_bin(ts, first_ts)
+        bin_id = int((ts - self.first_ts) / self.ms_per_bin)
 
-            if event_type == '#':
-                capacities[bin_id] = capacities.get(bin_id, 0) + num_bits
+        if event_type == '#':
+            self.capacities[bin_id] = self.capacities.get(bin_id, 0) + num_bits
 
-                if first_capacity is None:
-                    first_capacity = ts
+            if self.first_capacity is None:
+                self.first_capacity = ts
 
-                if last_capacity is None or ts > last_capacity:
-                    last_capacity = ts
-            elif event_type == '+':
-                if len(items) == 4:
-                    flow_id = int(items[-1])
-                else:
-                    flow_id = 0
+            if self.last_capacity is None or ts > self.last_capacity:
+                self.last_capacity = ts
+        elif event_type == '+':
+            if len(items) == 4:
+                flow_id = int(items[-1])
+            else:
+                flow_id = 0
 
-                self.flows[flow_id] = True
+            self.flows[flow_id] = True
 
-                if flow_id not in arrivals:
-                    arrivals[flow_id] = {}
-                    first_arrival[flow_id] = ts
+            if flow_id not in self.arrivals:
+                self.arrivals[flow_id] = {}
+                self.first_arrival[flow_id] = ts
 
-                if flow_id not in last_arrival:
-                    last_arrival[flow_id] = ts
-                else:
-                    if ts > last_arrival[flow_id]:
-                        last_arrival[flow_id] = ts
+            if flow_id not in self.last_arrival:
+                self.last_arrival[flow_id] = ts
+            else:
+                if ts > self.last_arrival[flow_id]:
+                    self.last_arrival[flow_id] = ts
 
-                old_value = arrivals[flow_id].get(bin_id, 0)
-                arrivals[flow_id][bin_id] = old_value + num_bits
+            old_value = self.arrivals[flow_id].get(bin_id, 0)
+            self.arrivals[flow_id][bin_id] = old_value + num_bits
 
-                total_arrivals += num_bits
-            elif event_type == '-':
-                if len(items) == 5:
-                    flow_id = int(items[-1])
-                else:
-                    flow_id = 0
+            self.total_arrivals += num_bits
+        elif event_type == '-':
+            if len(items) == 5:
+                flow_id = int(items[-1])
+            else:
+                flow_id = 0
 
-                self.flows[flow_id] = True
+            self.flows[flow_id] = True
 
-                if flow_id not in departures:
-                    departures[flow_id] = {}
-                    first_departure[flow_id] = ts
+            if flow_id not in self.departures:
+                self.departures[flow_id] = {}
+                self.first_departure[flow_id] = ts
 
-                if flow_id not in last_departure:
-                    last_departure[flow_id] = ts
-                else:
-                    if ts > last_departure[flow_id]:
-                        last_departure[flow_id] = ts
+            if flow_id not in self.last_departure:
+                self.last_departure[flow_id] = ts
+            else:
+                if ts > self.last_departure[flow_id]:
+                    self.last_departure[flow_id] = ts
 
-                old_value = departures[flow_id].get(bin_id, 0)
-                departures[flow_id][bin_id] = old_value + num_bits
+            old_value = self.departures[flow_id].get(bin_id, 0)
+            self.departures[flow_id][bin_id] = old_value + num_bits
 
-                total_departures += num_bits
+            self.total_departures += num_bits
 
-                # update total variables
-                if total_first_departure is None:
-                    total_first_departure = ts
-                if (total_last_departure is None or
-                        ts > total_last_departure):
-                    total_last_departure = ts
+            # update total variables
+            if self.total_first_departure is None:
+                self.total_first_departure = ts
+            if (self.total_last_departure is None or
+                    ts > self.total_last_departure):
+                self.total_last_departure = ts
 
-                # store delays in a list for each flow and sort later
-                delay = float(items[3])
+            # store delays in a list for each flow and sort later
+            delay = float(items[3])
+            if self.keep_delays:
                 if flow_id not in self.delays:
                     self.delays[flow_id] = []
                     self.delays_t[flow_id] = []
                 self.delays[flow_id].append(delay)
-                self.delays_t[flow_id].append((ts - first_ts) / 1000.0)
+                self.delays_t[flow_id].append((ts - self.first_ts) / 1000.0)
+            else:
+                # 仅评分时只统计直方图，不保存每个样本
+                if flow_id not in self.delay_hists:
+                    self.delay_hists[flow_id] = DelayHistogram()
+                self.delay_hists[flow_id].add(delay)
+
+
+class TunnelLogProgress(object):
+    """
+    评测过程中已解析部分的汇总统计，每批新解析的行只做一次向量化累加，时延只统计直方图，
+    snapshot()的开销与已解析的行数无关
+    """
+
+    def __init__(self):
+        self.first_ts = None
+        self.first_capacity = None
+        self.last_capacity = None
+        self.total_capacity = 0
+        self.total_arrivals = 0
+        self.total_departures = 0
+        self.total_first_departure = None
+        self.total_last_departure = None
+        self.delay_hist = DelayHistogram()
+
+    def update(self, ts, event, num_bits, delay, flow):
+        """
+        累加一批新解析的行
+        :param ts, event, num_bits, delay, flow: parse_tunnel_columns()的返回值
+        """
+        if ts.size == 0:
+            return
+        if self.first_ts is None:
+            self.first_ts = float(ts[0])
+
+        capacity = event == EVENT_CAPACITY
+        if capacity.any():
+            capacity_ts = ts[capacity]
+            if self.first_capacity is None:
+                self.first_capacity = self.last_capacity = float(capacity_ts[0])
+            self.last_capacity = max(self.last_capacity, float(capacity_ts.max()))
+            self.total_capacity += int(num_bits[capacity].sum())
+
+        self.total_arrivals += int(num_bits[event == EVENT_ARRIVAL].sum())
+
+        departure = event == EVENT_DEPARTURE
+        if departure.any():
+            departure_ts = ts[departure]
+            if self.total_first_departure is None:
+                self.total_first_departure = self.total_last_departure = float(departure_ts[0])
+            self.total_last_departure = max(self.total_last_departure, float(departure_ts.max()))
+            self.total_departures += int(num_bits[departure].sum())
+            self.delay_hist.add_array(delay[departure])
+
+    def snapshot(self):
+        """
+        当前已解析部分的汇总统计，用于评测过程中展示进度。
+        评测未结束时仍在链路中的包会被计入丢包，丢包率仅供参考
+        :return: dict，包含elapsed（秒）、throughput、capacity（Mbit/s）、delay（ms）、loss，无数据的项为None
+        """
+        elapsed = 0
+        if self.first_ts is not None and self.total_last_departure is not None:
+            elapsed = (self.total_last_departure - self.first_ts) / 1000.0
+
+        throughput = None
+        if self.total_first_departure is not None and self.total_last_departure > self.total_first_departure:
+            throughput = self.total_departures / (1000.0 * (self.total_last_departure - self.total_first_departure))
+
+        capacity = None
+        if self.first_capacity is not None and self.last_capacity > self.first_capacity:
+            capacity = self.total_capacity / (1000.0 * (self.last_capacity - self.first_capacity))
+
+        loss = None
+        if self.total_arrivals > 0:
+            loss = 1 - 1.0 * self.total_departures / self.total_arrivals
+
+        return {'elapsed': elapsed, 'throughput': throughput, 'capacity': capacity,
+                'delay': self.delay_hist.percentile(95), 'loss': loss}
+
+
+class TunnelLogFollower(object):
+    """
+    在mm-link写入日志的同时增量读取并解析，评测结束后调用finish()即可得到完整的解析结果，无需再从头读取日志。
+    新写入的行按列向量化解析，只保存紧凑的列数组，进度统计由TunnelLogProgress累加
+    """
+
+    def __init__(self, tunnel_graph):
+        """
+        :param tunnel_graph: 尚未解析的TunnelParse对象，finish()后其解析结果与parse_tunnel_log()一致
+        """
+        self.tunnel_graph = tunnel_graph
+        self.progress = TunnelLogProgress()
+        self._chunks = []
+        self._file = None
+        self._pending = b''
+
+    def _feed(self, data):
+        columns = parse_tunnel_columns(np.frombuffer(data, dtype=np.uint8), self.tunnel_graph.tunnel_log)
+        if columns[0].size:
+            self._chunks.append(columns)
+            self.progress.update(*columns)
+        return columns[0].size
+
+    def poll(self):
+        """
+        读取日志新写入的完整行，日志文件尚未创建时直接返回
+        :return: 本次解析的行数（不含注释行及空行）
+        """
+        if self._file is None:
+            if not os.path.exists(self.tunnel_graph.tunnel_log):
+                return 0
+            self._file = open(self.tunnel_graph.tunnel_log, 'rb')
+
+        data = self._pending + self._file.read()
+        # 最后一行可能尚未写完，留到下次读取
+        end = data.rfind(b'\n') + 1
+        self._pending = data[end:]
+        if end == 0:
+            return 0
+        return self._feed(data[:end])
+
+    def snapshot(self):
+        return self.progress.snapshot()
+
+    def finish(self):
+        """
+        读取剩余内容并完成解析，应在写日志的进程退出后调用
+        :return: 已完成解析的TunnelParse对象
+        """
+        self.poll()
+        if self._pending:
+            self._feed(self._pending)
+            self._pending = b''
+        self.close()
+        if self._chunks:
+            columns = [np.concatenate(column) for column in zip(*self._chunks)]
+        else:
+            columns = parse_tunnel_columns(np.zeros(0, dtype=np.uint8))
+        self._chunks = []
+        self.tunnel_graph._load_columns(*columns)
+        return self.tunnel_graph
 
-        tunlog.close()
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class TunnelParse(object):
+    def __init__(self, tunnel_log, throughput_graph=None, delay_graph=None,
+                 ms_per_bin=500, engine=PARSE_ENGINE_NUMPY, keep_delays=None,
+                 downsampler=DOWNSAMPLER_MINMAX, max_plot_points=20000):
+        """
+        :param keep_delays: 是否保存每个包的时延序列，仅绘制时延图时需要，默认在指定delay_graph时保存。
+                            不保存时（仅评分）两种解析引擎的时延百分位数都由直方图计算，结果相同。
+                            评测流程中评分后总会生成性能图数据（包含时延序列），因此始终保存；
+                            直方图模式只用于不绘图的场景，例如性能基准（bench）及不保存解析结果的评分
+        :param downsampler: 绘图时使用的降采样方法，见downsample.DOWNSAMPLERS
+        :param max_plot_points: 绘图时每条序列最多绘制的点数
+        """
+        if engine not in PARSE_ENGINES:
+            raise ValueError(f"Unknown parse engine: {engine}, expected one of {PARSE_ENGINES}")
+        self.total_duration = None
+        self.egress_tput = None
+        self.ingress_tput = None
+        self.avg_capacity = None
+        self.delays = None
+        self.delays_t = None
+        self.flows = None
+        self.tunnel_log = tunnel_log
+        self.throughput_graph = throughput_graph
+        self.delay_graph = delay_graph
+        self.ms_per_bin = ms_per_bin
+        self.engine = engine
+        self.keep_delays = delay_graph is not None if keep_delays is None else keep_delays
+        self.downsampler = downsampler
+        self.max_plot_points = max_plot_points
+
+    def ms_to_bin(self, ts, first_ts):
+        return int((ts - first_ts) / self.ms_per_bin)
+
+    def bin_to_s(self, bin_id):
+        return bin_id * self.ms_per_bin / 1000.0
+
+    def parse_tunnel_log(self):
+        if self.engine == PARSE_ENGINE_NUMPY:
+            self._parse_tunnel_log_numpy()
+        else:
+            self._parse_tunnel_log_python()
+
+    def _parse_tunnel_log_python(self):
+        acc = TunnelLogAccumulator(self.ms_per_bin, self.keep_delays)
+        with open(self.tunnel_log) as tunlog:
+            for line in tunlog:
+                acc.feed(line)
+        self._load_accumulator(acc)
+
+    def _load_accumulator(self, acc):
+        """由逐行累加的中间结果计算吞吐、时延、丢包等统计信息"""
+        self.flows = acc.flows
+        self.delays = acc.delays
+        self.delays_t = acc.delays_t
 
         us_per_bin = 1000.0 * self.ms_per_bin
+        capacities = acc.capacities
+        arrivals = acc.arrivals
+        departures = acc.departures
 
         self.avg_capacity = None
         self.link_capacity = []
         self.link_capacity_t = []
         if capacities:
             # calculate average capacity
-            if last_capacity == first_capacity:
+            if acc.last_capacity == acc.first_capacity:
                 self.avg_capacity = 0
             else:
-                delta = 1000.0 * (last_capacity - first_capacity)
+                delta = 1000.0 * (acc.last_capacity - acc.first_capacity)
                 self.avg_capacity = sum(capacities.values()) / delta
 
             # transform capacities into a list
@@ -183,6 +522,7 @@ class TunnelParse(object):
         self.loss_rate = {}
 
         total_delays = []
+        total_delay_hist = DelayHistogram()
 
         for flow_id in self.flows:
             self.ingress_tput[flow_id] = []
@@ -194,8 +534,8 @@ class TunnelParse(object):
 
             if flow_id in arrivals:
                 # calculate average ingress and egress throughput
-                first_arrival_ts = first_arrival[flow_id]
-                last_arrival_ts = last_arrival[flow_id]
+                first_arrival_ts = acc.first_arrival[flow_id]
+                last_arrival_ts = acc.last_arrival[flow_id]
 
                 if last_arrival_ts == first_arrival_ts:
                     self.avg_ingress[flow_id] = 0
@@ -211,8 +551,8 @@ class TunnelParse(object):
                     self.ingress_t[flow_id].append(self.bin_to_s(bin_id))
 
             if flow_id in departures:
-                first_departure_ts = first_departure[flow_id]
-                last_departure_ts = last_departure[flow_id]
+                first_departure_ts = acc.first_departure[flow_id]
+                last_departure_ts = acc.last_departure[flow_id]
 
                 if last_departure_ts == first_departure_ts:
                     self.avg_egress[flow_id] = 0
@@ -234,9 +574,11 @@ class TunnelParse(object):
             # calculate 95th percentile per-packet one-way delay
             self.percentile_delay[flow_id] = None
             if flow_id in self.delays:
-                self.percentile_delay[flow_id] = np.percentile(
-                    self.delays[flow_id], 95, interpolation='nearest')
+                self.percentile_delay[flow_id] = percentile_nearest(self.delays[flow_id])
                 total_delays += self.delays[flow_id]
+            elif flow_id in acc.delay_hists:
+                self.percentile_delay[flow_id] = acc.delay_hists[flow_id].percentile(95)
+                total_delay_hist.merge(acc.delay_hists[flow_id])
 
             # calculate loss rate for each flow
             if flow_id in arrivals and flow_id in departures:
@@ -248,12 +590,155 @@ class TunnelParse(object):
                     self.loss_rate[flow_id] = (
                             1 - 1.0 * flow_departures / flow_arrivals)
 
+        self.total_loss_rate = None
+        if acc.total_arrivals > 0:
+            self.total_loss_rate = 1 - 1.0 * acc.total_departures / acc.total_arrivals
+
+        # calculate total average throughput and 95th percentile delay
+        self.total_avg_egress = None
+        if acc.total_last_departure == acc.total_first_departure:
+            self.total_duration = 0
+            self.total_avg_egress = 0
+        else:
+            self.total_duration = acc.total_last_departure - acc.total_first_departure
+            self.total_avg_egress = acc.total_departures / (
+                    1000.0 * self.total_duration)
+
+        self.total_percentile_delay = None
+        if total_delays:
+            self.total_percentile_delay = percentile_nearest(total_delays)
+        elif total_delay_hist:
+            self.total_percentile_delay = total_delay_hist.percentile(95)
+
+    def _binned_series(self, bins, num_bits):
+        """按bin累加比特数，返回从最小bin到最大bin的连续序列 (bin_ids, Mbit/s)"""
+        us_per_bin = 1000.0 * self.ms_per_bin
+        min_bin = int(bins.min())
+        bin_bits = np.bincount(bins - min_bin, weights=num_bits)
+        bin_ids = np.arange(min_bin, min_bin + bin_bits.size)
+        return bin_ids, bin_bits / us_per_bin
+
+    def _bins_to_s(self, bin_ids):
+        return (bin_ids * self.ms_per_bin / 1000.0).tolist()
+
+    @staticmethod
+    def _avg_tput(ts, num_bits):
+        first_ts = float(ts[0])
+        last_ts = float(ts.max())
+        if last_ts == first_ts:
+            return 0
+        return int(num_bits.sum()) / (1000.0 * (last_ts - first_ts))
+
+    def _parse_tunnel_log_numpy(self):
+        self._load_columns(*load_tunnel_log(self.tunnel_log))
+
+    def _load_columns(self, ts, event, num_bits, delay, flow):
+        """由按列存放的日志数据计算吞吐、时延、丢包等统计信息"""
+
+        first_ts = float(ts[0]) if ts.size else 0.0
+        bins = ((ts - first_ts) / self.ms_per_bin).astype(np.int64)
+
+        capacity = event == EVENT_CAPACITY
+        arrival = event == EVENT_ARRIVAL
+        departure = event == EVENT_DEPARTURE
+
+        # 按首次出现的顺序记录flow，与逐行解析的dict插入顺序一致
+        flow_events = arrival | departure
+        flow_ids, first_idx = np.unique(flow[flow_events], return_index=True)
+        self.flows = {int(flow_id): True for flow_id in flow_ids[np.argsort(first_idx)]}
+
+        self.avg_capacity = None
+        self.link_capacity = []
+        self.link_capacity_t = []
+        if capacity.any():
+            self.avg_capacity = self._avg_tput(ts[capacity], num_bits[capacity])
+            bin_ids, tput = self._binned_series(bins[capacity], num_bits[capacity])
+            self.link_capacity = tput.tolist()
+            self.link_capacity_t = self._bins_to_s(bin_ids)
+
+        self.ingress_tput = {}
+        self.egress_tput = {}
+        self.ingress_t = {}
+        self.egress_t = {}
+        self.avg_ingress = {}
+        self.avg_egress = {}
+        self.percentile_delay = {}
+        self.loss_rate = {}
+        self.delays = {}
+        self.delays_t = {}
+        # 不保存时延序列（仅评分）时，时延百分位数由直方图计算
+        total_delay_hist = DelayHistogram()
+
+        for flow_id in self.flows:
+            self.ingress_tput[flow_id] = []
+            self.egress_tput[flow_id] = []
+            self.ingress_t[flow_id] = []
+            self.egress_t[flow_id] = []
+            self.avg_ingress[flow_id] = 0
+            self.avg_egress[flow_id] = 0
+
+            in_flow = flow == flow_id
+            flow_arrival = arrival & in_flow
+            flow_departure = departure & in_flow
+            has_arrivals = flow_arrival.any()
+            has_departures = flow_departure.any()
+
+            if has_arrivals:
+                self.avg_ingress[flow_id] = self._avg_tput(ts[flow_arrival], num_bits[flow_arrival])
+                bin_ids, tput = self._binned_series(bins[flow_arrival], num_bits[flow_arrival])
+                self.ingress_tput[flow_id] = tput.tolist()
+                self.ingress_t[flow_id] = self._bins_to_s(bin_ids)
+
+            if has_departures:
+                self.avg_egress[flow_id] = self._avg_tput(ts[flow_departure], num_bits[flow_departure])
+                bin_ids, tput = self._binned_series(bins[flow_departure], num_bits[flow_departure])
+                self.egress_tput[flow_id] = [0.0] + tput.tolist()
+                self.egress_t[flow_id] = self._bins_to_s(np.append(bin_ids[0], bin_ids + 1))
+
+            # calculate 95th percentile per-packet one-way delay
+            self.percentile_delay[flow_id] = None
+            if has_departures:
+                flow_delays = delay[flow_departure]
+                if self.keep_delays:
+                    self.percentile_delay[flow_id] = percentile_nearest(flow_delays)
+                    self.delays[flow_id] = flow_delays
+                    self.delays_t[flow_id] = (ts[flow_departure] - first_ts) / 1000.0
+                else:
+                    flow_delay_hist = DelayHistogram()
+                    flow_delay_hist.add_array(flow_delays)
+                    self.percentile_delay[flow_id] = flow_delay_hist.percentile(95)
+                    total_delay_hist.merge(flow_delay_hist)
+
+            # calculate loss rate for each flow
+            if has_arrivals and has_departures:
+                flow_arrivals = int(num_bits[flow_arrival].sum())
+                flow_departures = int(num_bits[flow_departure].sum())
+
+                self.loss_rate[flow_id] = None
+                if flow_arrivals > 0:
+                    self.loss_rate[flow_id] = (
+                            1 - 1.0 * flow_departures / flow_arrivals)
+
+        total_arrivals = int(num_bits[arrival].sum())
+        total_departures = int(num_bits[departure].sum())
+
         self.total_loss_rate = None
         if total_arrivals > 0:
             self.total_loss_rate = 1 - 1.0 * total_departures / total_arrivals
 
         # calculate total average throughput and 95th percentile delay
         self.total_avg_egress = None
+        self.total_percentile_delay = None
+        if departure.any():
+            total_first_departure = float(ts[departure][0])
+            total_last_departure = float(ts[departure].max())
+            if self.keep_delays:
+                self.total_percentile_delay = percentile_nearest(delay[departure])
+            else:
+                self.total_percentile_delay = total_delay_hist.percentile(95)
+        else:
+            total_first_departure = total_last_departure = None
+
         if total_last_departure == total_first_departure:
             self.total_duration = 0
             self.total_avg_egress = 0
@@ -262,10 +747,118 @@ class TunnelParse(object):
             self.total_avg_egress = total_departures / (
                     1000.0 * self.total_duration)
 
-        self.total_percentile_delay = None
-        if total_delays:
-            self.total_percentile_delay = np.percentile(
-                total_delays, 95, interpolation='nearest')
+    def save_parsed(self, path):
+        """
+        将解析后的中间数据（按bin统计的容量、吞吐序列及时延序列）保存为npz文件，供绘图任务复用，避免重复解析日志
+        :param path: npz文件路径
+        """
+        # 标量统计信息以json保存，flow_id转为字符串作为key
+        meta = {
+            'ms_per_bin': self.ms_per_bin,
+            'keep_delays': self.keep_delays,
+            'flows': list(self.flows),
+            'avg_capacity': self.avg_capacity,
+            'total_avg_egress': self.total_avg_egress,
+            'total_percentile_delay': self.total_percentile_delay,
+            'total_loss_rate': self.total_loss_rate,
+            'total_duration': self.total_duration,
+        }
+        for name in ('avg_ingress', 'avg_egress', 'percentile_delay', 'loss_rate'):
+            meta[name] = {str(flow_id): value for flow_id, value in getattr(self, name).items()}
+
+        arrays = {
+            'meta': np.array(json.dumps(meta, default=float)),
+            'link_capacity': np.asarray(self.link_capacity, dtype=np.float64),
+            'link_capacity_t': np.asarray(self.link_capacity_t, dtype=np.float64),
+        }
+        for flow_id in self.flows:
+            for name in ('ingress_tput', 'ingress_t', 'egress_tput', 'egress_t', 'delays', 'delays_t'):
+                series = getattr(self, name)
+                if flow_id in series:
+                    arrays[f'{name}_{flow_id}'] = np.asarray(series[flow_id], dtype=np.float64)
+
+        # 先写临时文件再重命名，避免绘图任务读到不完整的文件
+        tmp_path = path + '.tmp.npz'
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load_parsed(cls, path, throughput_graph=None, delay_graph=None, **kwargs):
+        """
+        从save_parsed()保存的npz文件恢复解析结果，无需原始日志即可绘图
+        :param path: npz文件路径
+        :param kwargs: 其他传给构造函数的绘图参数，例如downsampler、max_plot_points
+        :return: TunnelParse对象
+        """
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            tunnel_graph = cls(tunnel_log=None, throughput_graph=throughput_graph, delay_graph=delay_graph,
+                               ms_per_bin=meta['ms_per_bin'], keep_delays=meta['keep_delays'], **kwargs)
+            tunnel_graph.flows = {flow_id: True for flow_id in meta['flows']}
+            tunnel_graph.avg_capacity = meta['avg_capacity']
+            tunnel_graph.total_avg_egress = meta['total_avg_egress']
+            tunnel_graph.total_percentile_delay = meta['total_percentile_delay']
+            tunnel_graph.total_loss_rate = meta['total_loss_rate']
+            tunnel_graph.total_duration = meta['total_duration']
+            for name in ('avg_ingress', 'avg_egress', 'percentile_delay', 'loss_rate'):
+                setattr(tunnel_graph, name, {int(flow_id): value for flow_id, value in meta[name].items()})
+
+            tunnel_graph.link_capacity = data['link_capacity'].tolist()
+            tunnel_graph.link_capacity_t = data['link_capacity_t'].tolist()
+            for name in ('ingress_tput', 'ingress_t', 'egress_tput', 'egress_t'):
+                setattr(tunnel_graph, name,
+                        {flow_id: data[f'{name}_{flow_id}'].tolist() for flow_id in tunnel_graph.flows})
+            # 没有离开事件的flow不存在时延序列
+            for name in ('delays', 'delays_t'):
+                setattr(tunnel_graph, name, {flow_id: data[f'{name}_{flow_id}'] for flow_id in tunnel_graph.flows
+                                             if f'{name}_{flow_id}' in data})
+        return tunnel_graph
+
+    def graph_data(self):
+        """
+        性能图对应的数据，供前端自行绘图：链路容量、各flow的入口/出口吞吐序列及降采样后的时延序列
+        :return: dict，可直接序列化为json，flow_id转为字符串作为key
+        """
+
+        def _series(x, y, x_name, y_name):
+            x, y = self._downsample(x, y)
+            return {x_name: np.round(x, 4).tolist(), y_name: np.round(y, 4).tolist()}
+
+        data = {
+            'ms_per_bin': self.ms_per_bin,
+            'avg_capacity': self.avg_capacity,
+            'total_avg_egress': self.total_avg_egress,
+            'total_percentile_delay': self.total_percentile_delay,
+            'total_loss_rate': self.total_loss_rate,
+            'capacity': _series(self.link_capacity_t, self.link_capacity, 't', 'tput'),
+            'flows': {},
+        }
+        for flow_id in self.flows:
+            flow_data = {
+                'avg_ingress': self.avg_ingress.get(flow_id),
+                'avg_egress': self.avg_egress.get(flow_id),
+                'percentile_delay': self.percentile_delay.get(flow_id),
+                'loss_rate': self.loss_rate.get(flow_id),
+                'ingress': _series(self.ingress_t.get(flow_id, []), self.ingress_tput.get(flow_id, []), 't', 'tput'),
+                'egress': _series(self.egress_t.get(flow_id, []), self.egress_tput.get(flow_id, []), 't', 'tput'),
+            }
+            if flow_id in self.delays:
+                flow_data['delay'] = _series(self.delays_t[flow_id], self.delays[flow_id], 't', 'delay')
+            data['flows'][str(flow_id)] = flow_data
+        return data
+
+    def save_graph_data(self, path):
+        """
+        将graph_data()保存为紧凑的json文件
+        :param path: json文件路径
+        """
+        if self.flows is None:
+            self.parse_tunnel_log()
+        # 先写临时文件再重命名，避免接口读到不完整的文件
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.graph_data(), f, separators=(',', ':'), default=float)
+        os.replace(tmp_path, path)
 
     # def plot_throughput_graph(self):
     #     empty_graph = True
@@ -360,107 +953,107 @@ class TunnelParse(object):
     #     fig.set_size_inches(12, 6)
     #     fig.savefig(self.delay_graph, bbox_extra_artists=(lgd,),
     #                 bbox_inches='tight', pad_inches=0.2)
-    def plot_throughput_graph(self):
-        empty_graph = True
-        fig, ax = plt.subplots()
-
-        if self.link_capacity:
-            empty_graph = False
-            sampled_capacity_t = sample_data(self.link_capacity_t, 10)
-            sampled_capacity = sample_data(self.link_capacity, 10)
-            ax.fill_between(sampled_capacity_t, 0, sampled_capacity, facecolor='linen')
-
-        colors = ['b', 'g', 'r', 'y', 'c', 'm']
-        color_i = 0
-        for flow_id in self.flows:
-            color = colors[color_i]
-
-            if flow_id in self.ingress_tput and flow_id in self.ingress_t:
-                empty_graph = False
-                sampled_ingress_t = sample_data(self.ingress_t[flow_id], 10)
-                sampled_ingress_tput = sample_data(self.ingress_tput[flow_id], 10)
-                ax.plot(sampled_ingress_t, sampled_ingress_tput,
-                        label='Flow %s ingress (mean %.2f Mbit/s)'
-                              % (flow_id, self.avg_ingress.get(flow_id, 0)),
-                        color=color, linestyle='dashed')
-
-            if flow_id in self.egress_tput and flow_id in self.egress_t:
-                empty_graph = False
-                sampled_egress_t = sample_data(self.egress_t[flow_id], 10)
-                sampled_egress_tput = sample_data(self.egress_tput[flow_id], 10)
-                ax.plot(sampled_egress_t, sampled_egress_tput,
-                        label='Flow %s egress (mean %.2f Mbit/s)'
-                              % (flow_id, self.avg_egress.get(flow_id, 0)),
-                        color=color)
-
-            color_i += 1
-            if color_i == len(colors):
-                color_i = 0
-
-        if empty_graph:
-            sys.stderr.write('No valid throughput graph is generated\n')
-            return
+    def _downsample(self, x, y):
+        """将序列降采样到max_plot_points个点以内，保留极值，绘图耗时与日志长度无关"""
+        return downsample(x, y, self.max_plot_points, self.downsampler)
 
-        ax.set_xlabel('Time (s)', fontsize=12)
-        ax.set_ylabel('Throughput (Mbit/s)', fontsize=12)
-
-        if self.link_capacity and self.avg_capacity:
-            ax.set_title('Average capacity %.2f Mbit/s (shaded region)'
-                         % self.avg_capacity)
-
-        ax.grid()
-        handles, labels = ax.get_legend_handles_labels()
-        lgd = ax.legend(flip(handles, 2), flip(labels, 2),
-                        scatterpoints=1, bbox_to_anchor=(0.5, -0.1),
-                        loc='upper center', ncol=2, fontsize=12)
-
-        fig.set_size_inches(12, 6)
-        fig.savefig(self.throughput_graph, bbox_extra_artists=(lgd,),
-                    bbox_inches='tight', pad_inches=0.2)
-
-    def plot_delay_graph(self):
-        empty_graph = True
-        fig, ax = plt.subplots()
+    def plot_throughput_graph(self):
+        with graph_template('throughput', 'Time (s)', 'Throughput (Mbit/s)') as template:
+            empty_graph = True
 
-        max_delay = 0
-        colors = ['b', 'g', 'r', 'y', 'c', 'm']
-        color_i = 0
-        for flow_id in self.flows:
-            color = colors[color_i]
-            if flow_id in self.delays and flow_id in self.delays_t:
+            if self.link_capacity:
                 empty_graph = False
-                max_delay = max(max_delay, max(self.delays_t[flow_id]))
-
-                sampled_delays_t = sample_data(self.delays_t[flow_id], 10)
-                sampled_delays = sample_data(self.delays[flow_id], 10)
-                ax.scatter(sampled_delays_t, sampled_delays, s=1,
-                           color=color, marker='.',
-                           label='Flow %s (95th percentile %.2f ms)'
-                                 % (flow_id, self.percentile_delay.get(flow_id, 0)))
+                sampled_capacity_t, sampled_capacity = self._downsample(self.link_capacity_t, self.link_capacity)
+                template.fill(sampled_capacity_t, sampled_capacity, facecolor='linen')
+
+            colors = ['b', 'g', 'r', 'y', 'c', 'm']
+            color_i = 0
+            for flow_id in self.flows:
+                color = colors[color_i]
+
+                if flow_id in self.ingress_tput and flow_id in self.ingress_t:
+                    empty_graph = False
+                    sampled_ingress_t, sampled_ingress_tput = self._downsample(self.ingress_t[flow_id],
+                                                                               self.ingress_tput[flow_id])
+                    template.line(sampled_ingress_t, sampled_ingress_tput,
+                                  label='Flow %s ingress (mean %.2f Mbit/s)'
+                                        % (flow_id, self.avg_ingress.get(flow_id, 0)),
+                                  color=color, linestyle='dashed')
+
+                if flow_id in self.egress_tput and flow_id in self.egress_t:
+                    empty_graph = False
+                    sampled_egress_t, sampled_egress_tput = self._downsample(self.egress_t[flow_id],
+                                                                             self.egress_tput[flow_id])
+                    template.line(sampled_egress_t, sampled_egress_tput,
+                                  label='Flow %s egress (mean %.2f Mbit/s)'
+                                        % (flow_id, self.avg_egress.get(flow_id, 0)),
+                                  color=color)
 
                 color_i += 1
                 if color_i == len(colors):
                     color_i = 0
 
-        if empty_graph:
-            sys.stderr.write('No valid delay graph is generated\n')
-            return
+            if empty_graph:
+                sys.stderr.write('No valid throughput graph is generated\n')
+                return
 
-        ax.set_xlim(0, int(math.ceil(max_delay)))
-        ax.set_xlabel('Time (s)', fontsize=12)
-        # Per-packet one-way delay (ms)
-        ax.set_ylabel('queueing_delay (ms)', fontsize=12)
+            template.autoscale()
+            ax = template.ax
+            if self.link_capacity and self.avg_capacity:
+                ax.set_title('Average capacity %.2f Mbit/s (shaded region)'
+                             % self.avg_capacity)
 
-        ax.grid()
-        handles, labels = ax.get_legend_handles_labels()
-        lgd = ax.legend(flip(handles, 3), flip(labels, 3),
-                        scatterpoints=1, bbox_to_anchor=(0.5, -0.1),
-                        loc='upper center', ncol=3, fontsize=12,
-                        markerscale=5, handletextpad=0)
+            # 图例条目随flow数量和统计值变化，每次重新创建
+            handles = template.legend_items
+            labels = [handle.get_label() for handle in handles]
+            lgd = ax.legend(flip(handles, 2), flip(labels, 2),
+                            scatterpoints=1, bbox_to_anchor=(0.5, -0.1),
+                            loc='upper center', ncol=2, fontsize=12)
 
-        fig.set_size_inches(12, 6)
-        fig.savefig(self.delay_graph, bbox_extra_artists=(lgd,),
-                    bbox_inches='tight', pad_inches=0.2)
+            template.fig.savefig(self.throughput_graph, bbox_extra_artists=(lgd,),
+                                 bbox_inches='tight', pad_inches=0.2)
+
+    def plot_delay_graph(self):
+        # Per-packet one-way delay (ms)
+        with graph_template('delay', 'Time (s)', 'queueing_delay (ms)') as template:
+            empty_graph = True
+
+            max_delay = 0
+            colors = ['b', 'g', 'r', 'y', 'c', 'm']
+            color_i = 0
+            for flow_id in self.flows:
+                color = colors[color_i]
+                if flow_id in self.delays and flow_id in self.delays_t:
+                    empty_graph = False
+                    max_delay = max(max_delay, np.max(self.delays_t[flow_id]))
+
+                    sampled_delays_t, sampled_delays = self._downsample(self.delays_t[flow_id], self.delays[flow_id])
+                    template.scatter(sampled_delays_t, sampled_delays,
+                                     label='Flow %s (95th percentile %.2f ms)'
+                                           % (flow_id, self.percentile_delay.get(flow_id, 0)),
+                                     color=color)
+
+                    color_i += 1
+                    if color_i == len(colors):
+                        color_i = 0
+
+            if empty_graph:
+                sys.stderr.write('No valid delay graph is generated\n')
+                return
+
+            template.autoscale()
+            ax = template.ax
+            ax.set_xlim(0, int(math.ceil(max_delay)))
+
+            handles = template.legend_items
+            labels = [handle.get_label() for handle in handles]
+            lgd = ax.legend(flip(handles, 3), flip(labels, 3),
+                            scatterpoints=1, bbox_to_anchor=(0.5, -0.1),
+                            loc='upper center', ncol=3, fontsize=12,
+                            markerscale=5, handletextpad=0)
+
+            template.fig.savefig(self.delay_graph, bbox_extra_artists=(lgd,),
+                                 bbox_inches='tight', pad_inches=0.2)
 
     def statistics_string(self):
         if len(self.flows) == 1:
@@ -509,7 +1102,8 @@ class TunnelParse(object):
         return ret
 
     def parse(self):
-        self.parse_tunnel_log()
+        if self.flows is None:
+            self.parse_tunnel_log()
 
         tunnel_results = {'throughput': self.total_avg_egress, 'delay': self.total_percentile_delay,
                           'loss': self.total_loss_rate, 'duration': self.total_duration, 'capacity': self.avg_capacity,
@@ -532,7 +1126,9 @@ class TunnelParse(object):
         return tunnel_results
 
     def graph(self):
-        self.parse_tunnel_log()
+        # 通过load_parsed()加载的对象已包含解析结果，无需再读取日志
+        if self.flows is None:
+            self.parse_tunnel_log()
 
         if self.throughput_graph:
             self.plot_throughput_graph()
@@ -540,8 +1136,6 @@ class TunnelParse(object):
         if self.delay_graph:
             self.plot_delay_graph()
 
-        plt.close('all')
-
         tunnel_results = {'throughput': self.total_avg_egress, 'delay': self.total_percentile_delay,
                           'loss': self.total_loss_rate, 'duration': self.total_duration,
                           'stats': self.statistics_string()}
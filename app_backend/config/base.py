@@ -60,6 +60,77 @@ class BaseConfig:
         LOG_BACKUP_COUNT = int(_get_env_variable('LOG_BACKUP_COUNT'))
         LOG_FILENAME = _get_env_variable('LOG_FILENAME')
 
+    class Graph:
+        """性能图配置"""
+        # 吞吐量图的绘制方式：matplotlib 使用评分时已解析的结果在进程内绘制PNG；
+        # mm-throughput-graph 调用mahimahi自带工具重新解析日志生成SVG，仅作为备用
+        THROUGHPUT_GRAPH_RENDERER = os.getenv('THROUGHPUT_GRAPH_RENDERER', 'matplotlib')
+        # 绘图时的降采样方法（minmax 或 lttb），保留时延尖峰等极值
+        DOWNSAMPLER = os.getenv('GRAPH_DOWNSAMPLER', 'minmax')
+        # 每条曲线/散点序列最多绘制的点数，限制长日志的绘图耗时
+        MAX_PLOT_POINTS = int(os.getenv('GRAPH_MAX_PLOT_POINTS', 20000))
+        # 是否生成性能图图片，关闭后只生成供前端绘图的数据文件（/graph_get_graph_data），无需matplotlib绘图
+        RENDER_IMAGES = os.getenv('GRAPH_RENDER_IMAGES', 'true').lower() == 'true'
+        # 性能图数据接口的浏览器缓存时间（秒），数据生成后不会改变
+        DATA_CACHE_MAX_AGE = int(os.getenv('GRAPH_DATA_CACHE_MAX_AGE', 86400))
+        # 解析日志及绘图使用的子进程数量，绘图线程把CPU密集的工作交给子进程，不受GIL限制；0表示在绘图线程中直接执行
+        RENDER_PROCESSES = int(os.getenv('GRAPH_RENDER_PROCESSES', 2))
+        # 每个绘图子进程的虚拟内存上限（MB），0表示不限制
+        RENDER_MEMORY_LIMIT_MB = int(os.getenv('GRAPH_RENDER_MEMORY_LIMIT_MB', 2048))
+        # 每个绘图子进程执行多少次绘图后重启，释放内存
+        RENDER_TASKS_PER_CHILD = int(os.getenv('GRAPH_RENDER_TASKS_PER_CHILD', 20))
+
+    class CompileCache:
+        """编译缓存配置"""
+        # 是否启用编译缓存，相同代码及相同课程项目的提交直接复用编译结果
+        ENABLED = os.getenv('COMPILE_CACHE_ENABLED', 'true').lower() == 'true'
+        # 编译缓存目录，默认为 BASEDIR/compile_cache，建议与用户数据目录位于同一文件系统以便硬链接
+        DIR = os.getenv('COMPILE_CACHE_DIR') or os.path.join(_get_env_variable('BASEDIR'), 'compile_cache')
+        # 编译缓存总大小上限（MB），超出时删除最久未使用的编译结果
+        MAX_SIZE_MB = int(os.getenv('COMPILE_CACHE_MAX_SIZE_MB', 1024))
+
+    class CompileSandbox:
+        """编译沙箱配置"""
+        # 每个课程的编译沙箱数量，即同一课程最多同时编译的任务数，0表示不使用沙箱，在课程公共目录下串行编译
+        POOL_SIZE = int(os.getenv('COMPILE_SANDBOX_POOL_SIZE', 4))
+        # 编译沙箱目录，默认为 BASEDIR/build_sandbox，建议与课程目录位于同一文件系统以便写时复制
+        DIR = os.getenv('COMPILE_SANDBOX_DIR') or os.path.join(_get_env_variable('BASEDIR'), 'build_sandbox')
+
+    class Port:
+        """评测端口分配配置"""
+        # 评测可用的端口范围
+        RANGE_START = int(os.getenv('PORT_RANGE_START', 50000))
+        RANGE_END = int(os.getenv('PORT_RANGE_END', 65535))
+        # 端口租约时长（秒），任务运行期间每隔三分之一租约时长续租一次，worker崩溃后端口最多在两倍租约时长后回收
+        LEASE_SECONDS = int(os.getenv('PORT_LEASE_SECONDS', 60))
+
+    class TaskLog:
+        """任务日志配置"""
+        # 任务日志目录，默认为 BASEDIR/task_logs，每个任务的日志保存在独立的文件中
+        DIR = os.getenv('TASK_LOG_DIR') or os.path.join(_get_env_variable('BASEDIR'), 'task_logs')
+
+    class LogStream:
+        """任务日志流（SSE）配置"""
+        # 每个gunicorn进程同时保持的日志流连接数上限，每个连接占用一个线程，应小于 GUNICORN_THREADS
+        MAX_CONNECTIONS = int(os.getenv('LOG_STREAM_MAX_CONNECTIONS', 1))
+        # 每个日志流连接保持的时间（秒），结束后客户端自动重连
+        SECONDS = int(os.getenv('LOG_STREAM_SECONDS', 30))
+        # 连接数已满时，客户端重连的间隔（毫秒）
+        RETRY_MS = int(os.getenv('LOG_STREAM_RETRY_MS', 5000))
+
+    class Scheduler:
+        """评测任务调度配置"""
+        # 是否按用户公平调度评测任务，各用户的任务轮流运行，不启用时按编译完成的顺序运行
+        FAIR_SHARE = os.getenv('SCHEDULER_FAIR_SHARE', 'true').lower() == 'true'
+        # 公平调度时，每次提交的第一个任务是否优先于该用户的其他任务运行
+        FIRST_RUN_PRIORITY = os.getenv('SCHEDULER_FIRST_RUN_PRIORITY', 'true').lower() == 'true'
+        # 评测worker总线程数，用于估计排队任务的开始时间，与supervisor中cc_training队列的进程数、线程数一致
+        CONTEST_WORKERS = int(os.getenv('DRAMATIQ_PROCESSES', 4)) * int(os.getenv('DRAMATIQ_THREADS', 2))
+        # 估计运行时间时，每个trace保留最近多少次评测的运行时间
+        DURATION_SAMPLES = int(os.getenv('SCHEDULER_DURATION_SAMPLES', 20))
+        # 没有历史运行时间的trace的预计运行时间（秒）
+        DEFAULT_CONTEST_SECONDS = int(os.getenv('SCHEDULER_DEFAULT_CONTEST_SECONDS', 180))
+
     class Course:
         """课程配置，在对应的环境文件中定义"""
         ALL_CLASS = {}
@@ -0,0 +1,142 @@
+"""
+编译沙箱。每个课程维护POOL_SIZE个独立的编译目录，均为课程项目的写时复制克隆（文件系统不支持时为普通复制），
+保留已编译的目标文件。编译时获取任意一个空闲沙箱的锁，只需重新编译controller.cc并链接，
+不同沙箱中的编译可以并行进行，不再由课程公共目录的锁串行化。
+课程项目发生变化（指纹不同）时重新克隆沙箱。
+
+除controller.cc外的编译单元（src下的静态库及datagrump下的其他目标文件）预先编译，
+只在课程项目变化时重新编译，每次编译只需编译controller.cc并链接。
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+import time
+from contextlib import contextmanager
+
+from redis.lock import Lock
+
+from app_backend import redis_client, get_default_config
+from app_backend.jobs.cmd_runner import COMMAND_TIMEOUT
+from app_backend.jobs.compile_cache import project_fingerprint
+
+logger = logging.getLogger(__name__)
+config = get_default_config()
+
+# 沙箱中记录克隆时课程项目指纹的文件
+FINGERPRINT_FILE = '.project_fingerprint'
+# datagrump目录中记录预编译目标文件对应的课程项目指纹的文件
+PREBUILT_FILE = '.prebuilt_fingerprint'
+# 预编译的目标文件，与controller.cc无关，不受用户代码影响
+PREBUILT_OBJECTS = ('contest_message.o', 'sender.o', 'receiver.o')
+# 每次编译前删除的文件，make只会重新编译controller.cc并重新链接
+REBUILT_FILES = ('controller.o', 'sender', 'receiver')
+PREBUILD_TIMEOUT = 300
+# 编译锁的过期时间（秒），须大于持锁期间的预编译及make的超时时间之和，另留出克隆沙箱、移动编译结果的时间
+COMPILE_LOCK_TIMEOUT = PREBUILD_TIMEOUT + COMMAND_TIMEOUT + 120
+# 等待空闲沙箱（或课程公共目录的编译锁）的最长时间（秒），超时后编译失败，不再占用用户目录锁
+ACQUIRE_TIMEOUT = 300
+# 所有沙箱都被占用时，重新尝试获取锁的间隔（秒）
+ACQUIRE_INTERVAL = 0.5
+
+
+def _sandbox_dir(cname, slot):
+    return os.path.join(config.CompileSandbox.DIR, cname, str(slot))
+
+
+def _acquire_slot(cname, task_id):
+    """
+    获取一个空闲沙箱的锁，所有沙箱都被占用时等待，最多等待ACQUIRE_TIMEOUT秒
+    :return: (slot, lock)
+    :raise RuntimeError: 等待超时
+    """
+    locks = [Lock(redis_client, f'compile_slot_{cname}_{slot}', timeout=COMPILE_LOCK_TIMEOUT)
+             for slot in range(config.CompileSandbox.POOL_SIZE)]
+    logger.info(f'[task: {task_id}] Attempting to acquire one of {len(locks)} build sandboxes of {cname}')
+    deadline = time.monotonic() + ACQUIRE_TIMEOUT
+    while True:
+        for slot, lock in enumerate(locks):
+            if lock.acquire(blocking=False):
+                return slot, lock
+        if time.monotonic() >= deadline:
+            logger.error(f'[task: {task_id}] All build sandboxes of {cname} are busy after {ACQUIRE_TIMEOUT} seconds')
+            raise RuntimeError(f"All build sandboxes are busy after {ACQUIRE_TIMEOUT} seconds, please try again later")
+        time.sleep(ACQUIRE_INTERVAL)
+
+
+def _read_fingerprint(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def ensure_prebuilt(build_dir, fingerprint, task_id):
+    """
+    预编译目标文件与课程项目不一致时，重新编译src下的静态库及datagrump下除controller.cc外的目标文件，
+    并删除上次编译的controller.o及可执行文件
+    :param build_dir: datagrump目录，课程公共目录或沙箱中的目录
+    :param fingerprint: 课程项目指纹
+    :param task_id: 任务id，用于日志
+    """
+    stamp = os.path.join(build_dir, PREBUILT_FILE)
+    if _read_fingerprint(stamp) != fingerprint:
+        logger.info(f"[task: {task_id}] Course project changed, rebuilding prebuilt objects in {build_dir}")
+        cmd = f"make -C ../src && make clean && make {' '.join(PREBUILT_OBJECTS)}"
+        try:
+            subprocess.run(cmd, shell=True, cwd=build_dir, check=True, capture_output=True, text=True,
+                           timeout=PREBUILD_TIMEOUT)
+        except subprocess.CalledProcessError as e:
+            # 预编译失败时不写入指纹，本次编译由make补齐缺少的目标文件，下次编译重新预编译
+            logger.warning(f"[task: {task_id}] Prebuild failed in {build_dir}: {e.stdout}{e.stderr}")
+        except subprocess.TimeoutExpired:
+            logger.warning(f"[task: {task_id}] Prebuild timed out in {build_dir}")
+        else:
+            with open(stamp, 'w') as f:
+                f.write(fingerprint)
+    for name in REBUILT_FILES:
+        path = os.path.join(build_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _prepare_sandbox(sandbox_dir, course_project_dir, task_id):
+    """
+    沙箱不存在或课程项目已变化时，重新克隆课程项目，并准备好预编译的目标文件
+    :return: 沙箱中的datagrump目录
+    """
+    project_root = os.path.dirname(course_project_dir)
+    sandbox_project = os.path.join(sandbox_dir, os.path.basename(project_root))
+    fingerprint = project_fingerprint(course_project_dir)
+    if _read_fingerprint(os.path.join(sandbox_dir, FINGERPRINT_FILE)) != fingerprint:
+        logger.info(f"[task: {task_id}] Cloning course project {project_root} into build sandbox {sandbox_dir}")
+        shutil.rmtree(sandbox_dir, ignore_errors=True)
+        os.makedirs(sandbox_dir)
+        # -a 保留时间戳，make不会因为克隆而认为目标文件过期；--reflink=auto 在支持的文件系统上写时复制
+        subprocess.run(['cp', '-a', '--reflink=auto', project_root, sandbox_project], check=True)
+        # 克隆完成后才写入指纹，克隆中途失败的沙箱下次会重新克隆
+        with open(os.path.join(sandbox_dir, FINGERPRINT_FILE), 'w') as f:
+            f.write(fingerprint)
+    build_dir = os.path.join(sandbox_project, os.path.basename(course_project_dir))
+    ensure_prebuilt(build_dir, fingerprint, task_id)
+    return build_dir
+
+
+@contextmanager
+def build_sandbox(cname, course_project_dir, task_id):
+    """
+    获取一个空闲的编译沙箱，退出时释放。沙箱中只需执行make编译controller.cc并链接
+    :param cname: 课程名称
+    :param course_project_dir: 课程项目的datagrump目录
+    :param task_id: 任务id，用于日志
+    :return: 沙箱中的datagrump目录
+    """
+    slot, lock = _acquire_slot(cname, task_id)
+    try:
+        sandbox_dir = _sandbox_dir(cname, slot)
+        logger.info(f"[task: {task_id}] Acquired build sandbox: {sandbox_dir}")
+        yield _prepare_sandbox(sandbox_dir, course_project_dir, task_id)
+    finally:
+        lock.release()
@@ -1,9 +1,9 @@
 import logging
 import os
 import shutil
-import signal
 import subprocess
-from time import sleep
+import time
+from contextlib import contextmanager
 
 import dramatiq
 from dramatiq.brokers.redis import RedisBroker
@@ -13,52 +13,163 @@ from redis.lock import Lock
 from app_backend import db, redis_client, get_default_config
 from app_backend import get_app
 from app_backend.analysis.score_evaluate import evaluate_score
+from app_backend.analysis.tunnel_parse import TunnelParse, TunnelLogFollower, parse_cache_path
+from app_backend.jobs.build_sandbox import ACQUIRE_TIMEOUT, COMPILE_LOCK_TIMEOUT, build_sandbox, ensure_prebuilt
+from app_backend.jobs.cmd_runner import COMMAND_TIMEOUT, run_process
+from app_backend.jobs.compile_cache import compile_cache_key, fetch_binaries, store_binaries, project_fingerprint
 from app_backend.jobs.dramatiq_queue import DramatiqQueue
+from app_backend.jobs.fair_queue import push_task, pop_task, remove_task
+from app_backend.jobs.queue_eta import record_contest_start, record_contest_end
 from app_backend.jobs.graph_job import run_graph_task
 from app_backend.model.rank_model import RankModel
-from app_backend.model.task_model import TaskModel, TaskStatus, TASK_EXPIRE_TIME
+from app_backend.model.task_model import ACTIVE_TASK_STATUSES, TaskModel, TaskStatus, TASK_EXPIRE_TIME
 from app_backend.model.user_model import UserModel
-from app_backend.utils.utils import get_available_port, release_port, setup_logger
+from app_backend.utils.port_allocator import get_available_port, release_port
+from app_backend.utils.utils import setup_logger
 from app_backend.views.summary import reset_rank_cache
 
 # 设置日志记录器
 setup_logger()
 logger = logging.getLogger(__name__)
 config = get_default_config()
+# 评测运行期间读取日志的间隔及向任务日志写入进度的间隔（秒）
+CONTEST_POLL_INTERVAL = 1
+CONTEST_PROGRESS_INTERVAL = 10
 redis_broker = RedisBroker(url=config.Cache.FLASK_REDIS_URL)
 dramatiq.set_broker(redis_broker)
 
 
+# 20分钟超时（毫秒），此时间应大于cmd子进程的超时时间
+@dramatiq.actor(time_limit=1200000, max_retries=0, queue_name=DramatiqQueue.COMPILE.value)
+def run_compile_task(task_ids):
+    """
+    编译任务，同一次提交的多个trace任务在一条消息中编译，代码只编译一次，其余任务直接复用编译结果。
+    编译完成后将各任务发送到cc_training队列运行评测，评测进程不再因编译而被占用
+    :param task_ids: 任务ID列表
+    """
+    app = get_app()
+    with (app.app_context()):
+        try:
+            db.session.expire_all()  # 刷新会话
+            # 任务状态在发送消息前已提交为QUEUED，无需等待
+            first = True
+            for task_id in task_ids:
+                # 本次提交第一个编译成功的任务优先运行
+                if _compile_and_dispatch(task_id, first):
+                    first = False
+        finally:
+            db.session.remove()
+
+
+def _compile_and_dispatch(task_id, first=False):
+    """
+    编译单个任务的代码，编译成功后将任务发送到cc_training队列
+    :param task_id: 任务ID
+    :param first: 是否为本次提交的第一个任务
+    :return: 是否已发送到cc_training队列
+    """
+    task = None
+    try:
+        task = TaskModel.query.filter_by(task_id=task_id).first()
+        if not task:
+            logger.error(f"[task: {task_id}] Task not found")
+            return False
+
+        logger.info(f"[task: {task_id}] Start compile")
+        _check_if_task_can_run(task, TaskStatus.QUEUED)
+        course_project_dir, sender_path, receiver_path = _get_task_paths(task)
+
+        # 因为编译需要单独处理任务状态，所以没有直接抛出异常，抛出异常会导致任务状态变为ERROR
+        if not _compile_cc_file(task, course_project_dir, task.task_dir, sender_path, receiver_path):
+            logger.error(f"[task: {task_id}] compile cc file failed, task will not run")
+            return False
+
+        message = _dispatch_contest_task(task, first)
+        if message is None:
+            logger.warning(f"[task: {task_id}] Token enqueue failed but task was already taken by another token")
+            return True
+        logger.info(f"[task: {task_id}] Contest task enqueued with message ID: {message.message_id}")
+        return True
+    except TimeLimitExceeded as e:
+        logger.error(f"[task: {task_id}] Compile task timed out due to Dramatiq TimeLimit middleware")
+        err_msg = f"{type(e).__name__}\n{str(e)}\nCompile task timed out after 20 minutes, please contact admin."
+        # 编译结果可能被同一次提交的其他任务使用，不删除
+        _handle_exception(task_id, err_msg, task)
+    except Exception as e:
+        _handle_exception(task_id, f"{type(e).__name__}\n{str(e)}", task)
+    return False
+
+
+def _dispatch_contest_task(task, first):
+    """
+    将编译完成的任务发送到cc_training队列。公平调度时任务放入用户的子队列，队列中只发送一个令牌，
+    由run_next_cc_training_task在运行时决定运行哪个用户的任务
+    :return: Dramatiq消息；令牌发送失败但任务已被其他令牌取出运行时返回None
+    :raise Exception: 发送失败，任务已从子队列中移除
+    """
+    if not config.Scheduler.FAIR_SHARE:
+        return run_cc_training_task.send(task.task_id)
+    push_task(redis_client, task.task_id, task.user_id, first)
+    try:
+        return run_next_cc_training_task.send()
+    except Exception:
+        # 令牌发送失败时从子队列中移除任务，否则之后的令牌会取出这个已标记为ERROR的任务，
+        # 并使子队列中的任务始终比令牌多一个
+        if remove_task(redis_client, task.task_id, task.user_id):
+            raise
+        # 其他令牌已取出该任务运行，少一个令牌的是子队列中的其他任务，无法补发
+        logger.error(f"[task: {task.task_id}] Fair queue is now one token short")
+        return None
+
+
+def _get_task_paths(task):
+    """
+    :return: (课程的项目目录, sender路径, receiver路径)
+    """
+    # 课程的项目目录，公共目录
+    _config = config.get_course_config(task.cname)
+    course_project_dir = os.path.join(_config['path'], 'project', 'datagrump')
+    # 本次任务的提交目录
+    sender_path = os.path.join(task.task_dir, 'sender')
+    receiver_path = os.path.join(task.task_dir, 'receiver')
+    return course_project_dir, sender_path, receiver_path
+
+
+# 20分钟超时（毫秒），此时间应大于cmd子进程的超时时间
+@dramatiq.actor(time_limit=1200000, max_retries=0, queue_name=DramatiqQueue.CC_TRAINING.value)
+def run_next_cc_training_task():
+    """公平调度的令牌，按用户轮转顺序从用户子队列中取出一个任务运行"""
+    task_id = pop_task(redis_client)
+    if task_id is None:
+        logger.warning("No task in fair queue, contest token ignored")
+        return
+    _run_cc_training(task_id)
+
+
 # 20分钟超时（毫秒），此时间应大于cmd子进程的超时时间
 @dramatiq.actor(time_limit=1200000, max_retries=0, queue_name=DramatiqQueue.CC_TRAINING.value)
 def run_cc_training_task(task_id):
+    """直接运行指定的任务，不经过公平调度"""
+    _run_cc_training(task_id)
+
+
+def _run_cc_training(task_id):
     app = get_app()
     with (app.app_context()):
         try:
             db.session.expire_all()  # 刷新会话
-            # sleep to ensure task status is updated to QUEUED before running
-            sleep(2)
             task = TaskModel.query.filter_by(task_id=task_id).first()
             if not task:
                 logger.error(f"[task: {task_id}] Task not found")
                 return
 
             logger.info(f"[task: {task_id}] Start task")
-            _check_if_task_can_run(task)
+            _check_if_task_can_run(task, TaskStatus.COMPILED)
             user = UserModel.query.filter_by(user_id=task.user_id).first()
+            course_project_dir, sender_path, receiver_path = _get_task_paths(task)
 
-            # 课程的项目目录，公共目录
-            _config = config.get_course_config(task.cname)
-            course_project_dir = os.path.join(_config['path'], 'project', 'datagrump')
-            # 本次任务的提交目录
-            sender_path = os.path.join(task.task_dir, 'sender')
-            receiver_path = os.path.join(task.task_dir, 'receiver')
-
-            # 因为编译需要单独处理任务状态，所以没有直接抛出异常，抛出异常会导致任务状态变为ERROR
-            if not _compile_cc_file(task, course_project_dir, task.task_dir, sender_path,
-                                    receiver_path):
-                logger.error(f"[task: {task_id}] compile cc file failed, task will not run")
-                return
+            # 编译已在compile队列中完成，编译结果被删除时（例如同一次提交的其他任务出错）从编译缓存中恢复
+            _ensure_binaries(task, course_project_dir, sender_path, receiver_path)
 
             # 编译好后再创建task（trace）目录
             if not os.path.exists(task.task_dir):
@@ -69,9 +180,10 @@ def run_cc_training_task(task_id):
 
             running_port = get_available_port(redis_client)
             logger.info(f"[task: {task_id}] select port {running_port} for running")
-            _run_contest(task, course_project_dir, sender_path, receiver_path, result_path, running_port)
+            tunnel_graph = _run_contest(task, course_project_dir, sender_path, receiver_path, result_path,
+                                        running_port)
 
-            evaluate_score(task, result_path)
+            evaluate_score(task, result_path, parse_cache_path(result_path), tunnel_graph)
 
             # _graph(task, result_path)
 
@@ -90,7 +202,6 @@ def run_cc_training_task(task_id):
                 logger.info(f"[task: {task_id}] Graph task enqueued successfully with message ID: {message.message_id}")
                 task.update_task_log(
                     "性能图绘制任务已生成，请稍后再查询，高峰时期可能需要等待较长时间，等待期间，可从任务日志中查询最新进度。")
-            task.update()  # 写入日志
             logger.info(f"[task: {task_id}] Task completed successfully")
         except TimeLimitExceeded as e:
             # 处理 Dramatiq 的超时异常，此异常不在Exception中，需单独处理
@@ -124,15 +235,50 @@ def run_cc_training_task(task_id):
                 logger.error(f"[task: {task_id}] Error when finally cleanup: {str(e)}", exc_info=True)
 
 
-def _check_if_task_can_run(task: TaskModel):
-    assert task.task_status == TaskStatus.QUEUED, "Task status must be QUEUED to run"
+def _ensure_binaries(task, course_project_dir, sender_path, receiver_path):
+    """
+    确认编译好的sender和receiver存在，不存在时尝试从编译缓存中恢复，不改变任务状态
+    :raise RuntimeError: 编译结果不存在且无法从编译缓存中恢复
+    """
+    task_id = task.task_id
+    lock_name = f'task_dir_lock_{task.upload_id}'
+    with Lock(redis_client, lock_name, timeout=300):
+        if os.path.exists(sender_path) and os.path.exists(receiver_path):
+            return
+        logger.warning(f"[task: {task_id}] Sender and receiver not found in {task.task_dir}, restoring from compile cache")
+        if config.CompileCache.ENABLED:
+            cache_key = compile_cache_key(f'{task.task_dir}/{task.algorithm}.cc', course_project_dir)
+            if fetch_binaries(cache_key, sender_path, receiver_path, task_id):
+                return
+        raise RuntimeError("Compiled sender and receiver not found, they may have been removed by another failed task")
+
+
+def _check_if_task_can_run(task: TaskModel, expected_status: TaskStatus):
+    assert task.task_status == expected_status, f"Task status must be {expected_status.name} to run"
     assert not task.is_expired(), f"Task {task.task_id} is expired, task must run within {(TASK_EXPIRE_TIME / 3600):.1f} hours of creation"
 
 
+@contextmanager
+def _shared_project_dir(cname, course_project_dir, task_id):
+    """
+    未启用编译沙箱时，在课程公共目录下编译，编译期间对目录上锁。
+    与沙箱相同，复用预编译的目标文件，只编译controller.cc并链接
+    :return: 课程项目的datagrump目录
+    """
+    lock_name = f'compile_lock_{cname}'
+    # 等待超时时抛出LockError，不会无限期占用用户目录锁
+    lock = Lock(redis_client, lock_name, timeout=COMPILE_LOCK_TIMEOUT, blocking_timeout=ACQUIRE_TIMEOUT)
+    logger.info(f'[task: {task_id}] Attempting to acquire lock: {lock_name}')
+    with lock:
+        logger.info(f"[task: {task_id}] Acquired lock: {lock_name}, starting compilation")
+        ensure_prebuilt(course_project_dir, project_fingerprint(course_project_dir), task_id)
+        yield course_project_dir
+
+
 def _compile_cc_file(task, course_project_dir, task_dir, sender_path, receiver_path):
     """
-    编译CC文件，在公共目录下编译，编译前对目录上锁。
-    由于运行的主要瓶颈在运行评测上，编译一般只需要几秒，所以将编译放在公共目录下，简化代码逻辑，节省空间。
+    编译CC文件。启用编译沙箱时在空闲的沙箱中编译，多个任务可以并行编译；
+    否则在公共目录下编译，编译前对目录上锁。
     :param task: Task_model对象
     :return: bool, 是否编译成功
     """
@@ -144,7 +290,8 @@ def _compile_cc_file(task, course_project_dir, task_dir, sender_path, receiver_p
     # 添加用户锁是因为task会在不同用户之间交替执行，避免同一用户已有编译好的文件时，仍然需要等待公共目录的锁
     # 因为目录路径太长，upload_id等效，upload_id和目录一一对应
     lock_name = f'task_dir_lock_{task.upload_id}'
-    user_lock = Lock(redis_client, lock_name, timeout=300)
+    # 持锁期间可能等待编译锁并完成编译，过期时间须覆盖两者，否则锁过期后同一提交的其他任务会同时编译
+    user_lock = Lock(redis_client, lock_name, timeout=ACQUIRE_TIMEOUT + COMPILE_LOCK_TIMEOUT)
     logger.info(
         f'[task: {task_id}] try to find exist sender and receiver in {task_dir}, attempting to acquire user lock: {lock_name}')
     with user_lock:
@@ -164,24 +311,34 @@ def _compile_cc_file(task, course_project_dir, task_dir, sender_path, receiver_p
             task.update(task_status=TaskStatus.ERROR)
             return False
 
+        # 相同代码已在其他任务中编译过时，直接从编译缓存中取出，无需获取编译锁
+        cache_key = None
+        if config.CompileCache.ENABLED:
+            cache_key = compile_cache_key(f'{task_dir}/{task.algorithm}.cc', course_project_dir)
+            if fetch_binaries(cache_key, sender_path, receiver_path, task_id):
+                task.update_task_log("已有相同代码的编译结果，跳过编译。")
+                task.update(task_status=TaskStatus.COMPILED)
+                return True
+
         # 如果没有编译好的文件，开始编译
-        lock_name = f'compile_lock_{cname}'
-        lock = Lock(redis_client, lock_name, timeout=300)
-        logger.info(f'[task: {task_id}] Compiling CC file: {cc_file_name}, attempting to acquire lock: {lock_name}')
-        with lock:
+        if config.CompileSandbox.POOL_SIZE > 0:
+            # 在独立的编译沙箱中编译，多个任务可以并行编译
+            build_context = build_sandbox(cname, course_project_dir, task_id)
+        else:
+            build_context = _shared_project_dir(cname, course_project_dir, task_id)
+        with build_context as build_dir:
             task.update(task_status=TaskStatus.COMPILING)
-            logger.info(f"[task: {task_id}] Acquired lock: {lock_name}, starting compilation")
-            assert os.path.exists(course_project_dir) and os.path.exists(
-                task_dir), "Course project directory or task parent directory does not exist"
+            assert os.path.exists(build_dir) and os.path.exists(
+                task_dir), "Build directory or task parent directory does not exist"
 
-            # 将用户上传的文件拷贝到course_project_dir中，并直接覆盖已有的 controller.cc
+            # 将用户上传的文件拷贝到编译目录中，并直接覆盖已有的 controller.cc
             logger.info(
-                f"[task: {task_id}] Copying files from {task_dir} to {course_project_dir}, starting make with {task.algorithm}.cc")
-            shutil.copy(f'{task_dir}/{task.algorithm}.cc', f'{course_project_dir}/controller.cc')
+                f"[task: {task_id}] Copying files from {task_dir} to {build_dir}, starting make with {task.algorithm}.cc")
+            shutil.copy(f'{task_dir}/{task.algorithm}.cc', f'{build_dir}/controller.cc')
             # 执行make命令
-            result, output = run_cmd(f'cd {course_project_dir} && make clean && make', task_id, raise_exception=False)
+            result, output = run_cmd(f'cd {build_dir} && make', task_id, raise_exception=False)
             if not result:
-                logger.error(f"[task: {task_id}] make failed in {course_project_dir}, compilation failed")
+                logger.error(f"[task: {task_id}] make failed in {build_dir}, compilation failed")
                 # 如果编译失败，在任务目录创建一个文件，文件名为compile_failed，后续同cc_file的其他trace任务不用再重复编译
                 with open(compile_failed_file, 'w') as f:
                     pass
@@ -191,8 +348,10 @@ def _compile_cc_file(task, course_project_dir, task_dir, sender_path, receiver_p
 
             # 编译成功后，将sender和receiver移动到任务目录
             logger.info(f"[task: {task_id}] Moving sender and receiver to parent directory {task_dir}")
-            shutil.move(os.path.join(course_project_dir, 'sender'), sender_path)
-            shutil.move(os.path.join(course_project_dir, 'receiver'), receiver_path)
+            shutil.move(os.path.join(build_dir, 'sender'), sender_path)
+            shutil.move(os.path.join(build_dir, 'receiver'), receiver_path)
+            if cache_key:
+                store_binaries(cache_key, sender_path, receiver_path, task_id)
             task.update(task_status=TaskStatus.COMPILED)
             logger.info(f"[task: {task.task_id}] Compilation succeeded")
             return True
@@ -200,8 +359,9 @@ def _compile_cc_file(task, course_project_dir, task_dir, sender_path, receiver_p
 
 def _run_contest(task, course_project_dir, sender_path, receiver_path, result_path, running_port):
     """
-    运行竞赛脚本，执行编译好的CC文件
-    :return: bool, 是否运行成功
+    运行竞赛脚本，执行编译好的CC文件。
+    运行期间增量解析mm-link写入的日志，并定期将当前吞吐量、时延写入任务日志，评测结束后无需再从头解析日志
+    :return: 已完成解析的TunnelParse对象，增量解析失败时返回None，由评分时重新解析日志
     """
     task_id = task.task_id
     program_script = "./run-contest.sh"
@@ -216,12 +376,73 @@ def _run_contest(task, course_project_dir, sender_path, receiver_path, result_pa
     assert trace_conf is not None, f"Trace configuration for {task.cname} and {task.trace_name} not found"
     uplink_file = os.path.join(_config['trace_path'], trace_conf['uplink_file'])
     downlink_file = os.path.join(_config['trace_path'], trace_conf['downlink_file'])
-    _, output = run_cmd(
-        f"cd {course_project_dir} && {program_script} {running_port} {uplink_file} {downlink_file} {result_path} {sender_path} {receiver_path} {loss_rate} {buffer_size} {delay}",
-        task_id)
+
+    # 删除上次运行残留的日志，避免增量解析读到旧数据
+    if os.path.exists(result_path):
+        os.remove(result_path)
+    # 解析结果会缓存供绘图任务使用，性能图数据包含时延序列，与evaluate_score保存解析结果时相同，需要保留时延序列
+    follower = TunnelLogFollower(TunnelParse(tunnel_log=result_path, ms_per_bin=500, keep_delays=True))
+    last_progress_time = time.monotonic()
+
+    def _on_poll():
+        nonlocal follower, last_progress_time
+        if follower is None:
+            return
+        try:
+            follower.poll()
+            if time.monotonic() - last_progress_time >= CONTEST_PROGRESS_INTERVAL:
+                last_progress_time = time.monotonic()
+                task.update_task_log(_format_contest_progress(follower.snapshot()))
+        except Exception as e:
+            # 增量解析仅用于提前得到结果，失败时不影响评测，结束后重新解析完整日志
+            logger.warning(f"[task: {task_id}] Failed to follow tunnel log, fallback to full parse: {str(e)}",
+                           exc_info=True)
+            follower.close()
+            follower = None
+
+    # 记录正在运行的评测及运行时间，用于估计排队任务的开始时间
+    record_contest_start(redis_client, task_id, task.trace_name)
+    contest_start = time.monotonic()
+    duration = None
+    try:
+        _, output = run_cmd(
+            f"cd {course_project_dir} && {program_script} {running_port} {uplink_file} {downlink_file} {result_path} {sender_path} {receiver_path} {loss_rate} {buffer_size} {delay}",
+            task_id, on_poll=_on_poll, poll_interval=CONTEST_POLL_INTERVAL)
+        duration = time.monotonic() - contest_start
+    finally:
+        record_contest_end(redis_client, task_id, task.trace_name, duration)
+        if follower is not None:
+            follower.close()
     logger.info(f"[task: {task_id}] run-contest.sh completed successfully")
     task.update_task_log(f"Contest done, program logs:\n\n{output}")
 
+    if follower is None:
+        return None
+    try:
+        return follower.finish()
+    except Exception as e:
+        logger.warning(f"[task: {task_id}] Failed to finish following tunnel log, fallback to full parse: {str(e)}",
+                       exc_info=True)
+        return None
+
+
+def _format_contest_progress(snapshot):
+    """
+    将增量解析的汇总统计格式化为任务日志
+    :param snapshot: TunnelLogFollower.snapshot()的返回值
+    :return: str
+    """
+    progress = f"评测进行中，已运行 {snapshot['elapsed']:.1f} 秒"
+    if snapshot['throughput'] is not None:
+        progress += f"，当前平均吞吐量 {snapshot['throughput']:.2f} Mbit/s"
+    if snapshot['capacity']:
+        progress += f"（链路平均容量 {snapshot['capacity']:.2f} Mbit/s）"
+    if snapshot['delay'] is not None:
+        progress += f"，95分位排队时延 {snapshot['delay']:.3f} ms"
+    if snapshot['loss'] is not None:
+        progress += f"，丢包率 {max(snapshot['loss'], 0) * 100:.2f}%（含仍在链路中的包，仅供参考）"
+    return progress
+
 
 def _remove_binary_files(task_id, sender_path, receiver_path):
     """
@@ -240,6 +461,29 @@ def _remove_binary_files(task_id, sender_path, receiver_path):
         logger.info(f"[task: {task_id}] Removed receiver binary file: {receiver_path}")
 
 
+def _remove_unused_binary_files(task_id, task, sender_path, receiver_path):
+    """
+    出错的任务删除编译生成的二进制文件，同一次提交的其他任务仍在排队、编译或运行时保留，
+    这些任务已是COMPILED状态，不会再重新编译
+    :param task: TaskModel对象，为None时直接删除
+    """
+    if task is None:
+        _remove_binary_files(task_id, sender_path, receiver_path)
+        return
+    # 与_ensure_binaries使用同一把锁，检查和删除之间不会有其他任务开始使用二进制文件
+    with Lock(redis_client, f'task_dir_lock_{task.upload_id}', timeout=300):
+        active_tasks = TaskModel.query.filter(
+            TaskModel.upload_id == task.upload_id,
+            TaskModel.task_id != task_id,
+            TaskModel.task_status.in_(ACTIVE_TASK_STATUSES)
+        ).count()
+        if active_tasks:
+            logger.info(f"[task: {task_id}] Keeping sender and receiver, "
+                        f"{active_tasks} other tasks of upload {task.upload_id} still need them")
+            return
+        _remove_binary_files(task_id, sender_path, receiver_path)
+
+
 def _update_rank(task, user):
     """
     更新榜单
@@ -327,89 +571,59 @@ def _handle_exception(task_id, err_msg, task=None, sender_path=None, receiver_pa
         logger.error(f"[task: {task_id}] Task status updated to ERROR due to exception")
     # 删除编译生成的二进制文件，注意不在finally中删除，因为正常结束的任务不一定需要删除，其他任务可能会复用
     if sender_path and receiver_path:
-        _remove_binary_files(task_id, sender_path, receiver_path)
-    # 删除结果日志文件
-    if result_path and os.path.exists(result_path):
-        os.remove(result_path)
-        logger.info(f"[task: {task_id}] Removed result file: {result_path} due to exception")
+        _remove_unused_binary_files(task_id, task, sender_path, receiver_path)
+    # 删除结果日志文件及解析缓存
+    if result_path:
+        for path in (result_path, parse_cache_path(result_path)):
+            if os.path.exists(path):
+                os.remove(path)
+                logger.info(f"[task: {task_id}] Removed result file: {path} due to exception")
 
 
-def _force_kill_process_group(process, task_id):
+def run_cmd(cmd, task_id, raise_exception=True, on_poll=None, poll_interval=1, cancel_event=None):
     """
-    使用 SIGKILL 强制终止进程组
-    :param process: subprocess.Popen 对象
-    :param task_id: 任务ID
-    :return: None
+    :param on_poll: 可选，命令运行期间每隔poll_interval秒调用一次的回调，在当前线程中执行
+    :param cancel_event: 可选，threading.Event，被设置后终止命令并抛出CommandCancelled
     """
-    try:
-        logger.info(f"[task: {task_id}] Attempting to kill process group for PID: {process.pid}")
-        pgid = os.getpgid(process.pid)
-        os.killpg(pgid, signal.SIGKILL)
-        logger.info(f"[task: {task_id}] Process group killed successfully")
-    except ProcessLookupError:
-        logger.info(f"[task: {task_id}] Process group already terminated")
-    except Exception as e:
-        logger.error(f"[task: {task_id}] Failed to kill process group: {str(e)}")
-
-
-def run_cmd(cmd, task_id, raise_exception=True):
     logger.info(f"[task: {task_id}] Running command: {cmd}")
-    timeout = 300  # 设置超时时间为5分钟（300秒）
-    shell = True
-    commands_str = ""
+    timeout = COMMAND_TIMEOUT
+
+    if isinstance(cmd, list):
+        shell = False
+        commands_str = cmd[0]
+    else:
+        shell = True
+        # 如果是字符串，分割成多个命令，不显示具体参数给用户
+        commands = [c.strip().split()[0] for c in cmd.split('&&')]
+        commands_str = '; '.join(commands)
 
     try:
-        if isinstance(cmd, list):
-            shell = False
-            commands_str = cmd[0]
-        else:
-            # 如果是字符串，分割成多个命令，不显示具体参数给用户
-            commands = [c.strip().split()[0] for c in cmd.split('&&')]
-            commands_str = '; '.join(commands)
-
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            shell=shell,
-            preexec_fn=os.setsid  # 创建新的进程组
-        )
+        # 输出只保留开头和末尾部分，避免用户代码内的输出过多内容占用内存及影响系统日志
+        result = run_process(cmd, task_id, timeout, shell=shell, on_poll=on_poll, poll_interval=poll_interval,
+                             cancel_event=cancel_event)
+    except subprocess.TimeoutExpired:
+        # 超时时进程组已被终止
+        logger.error(f"[task: {task_id}] Command timed out after {timeout} seconds, process group terminated")
+        raise RuntimeError(f"Command timed out after {timeout} seconds: {commands_str}")
 
-        try:
-            stdout, stderr = process.communicate(timeout=timeout)
-            # 打印日志时限制输出长度，避免用户代码内的输出过多内容影响系统日志
-            logger.info(f"[task: {task_id}] Command output: \nstdout:\n{stdout[:6000]}\nstderr:\n{stderr[:6000]}\n")
-            # 脱敏处理输出中的路径和敏感命令参数
-            output = f"stdout:\n{stdout}\nstderr:\n{stderr}\n"
-
-            if process.returncode != 0:
-                logger.error(
-                    f"[task: {task_id}] Command failed with return code {process.returncode}")
-                if raise_exception:
-                    raise RuntimeError(f"Command failed: {commands_str}\n\n{output}")
-                return False, output
-
-            logger.info(f"[task: {task_id}] Command completed successfully")
-            return True, output
-
-        except subprocess.TimeoutExpired:
-            # 超时时，终止整个进程组
-            logger.error(f"[task: {task_id}] Command timed out after {timeout} seconds, terminating process group")
-            _force_kill_process_group(process, task_id)
-            raise RuntimeError(f"Command timed out after {timeout} seconds: {commands_str}")
+    logger.info(f"[task: {task_id}] Command finished ({result.resource_summary()}), output: \n"
+                f"stdout:\n{result.stdout}\nstderr:\n{result.stderr}\n")
+    # 脱敏处理输出中的路径和敏感命令参数
+    output = f"stdout:\n{result.stdout}\nstderr:\n{result.stderr}\n"
 
-    except Exception as e:
-        # 确保进程被终止
-        assert 'process' in locals(), "Process object not found, cannot terminate"
-        _force_kill_process_group(process, task_id)
-        # 抛出异常，保证任务状态正确更新
-        raise e
+    if result.returncode != 0:
+        logger.error(f"[task: {task_id}] Command failed with return code {result.returncode}")
+        if raise_exception:
+            raise RuntimeError(f"Command failed: {commands_str}\n\n{output}")
+        return False, output
+
+    logger.info(f"[task: {task_id}] Command completed successfully")
+    return True, output
 
 
 def enqueue_cc_task(task_id):
     """
-    将任务发送到队列
+    将任务发送到队列，任务先进入compile队列编译，编译完成后再进入cc_training队列运行评测
 
     Args:
         task_id (str): 任务ID
@@ -424,41 +638,49 @@ def enqueue_cc_task(task_id):
         }
     """
     logger.info(f"[task: {task_id}] Enqueueing task")
+    result = _send_compile_message([task_id])
+    result['task_id'] = task_id
+    return result
+
+
+def _send_compile_message(task_ids):
+    """
+    发送一条编译消息，包含task_ids中的所有任务
+    :return: dict，包含 success、message、message_id
+    """
     try:
         # 发送任务到队列
-        message = run_cc_training_task.send(task_id)
+        message = run_compile_task.send(task_ids)
 
         # 检查消息是否成功创建
         if message and hasattr(message, 'message_id'):
-            logger.info(f"[task: {task_id}] Successfully enqueued with message ID: {message.message_id}")
+            logger.info(f"Tasks {task_ids} successfully enqueued with message ID: {message.message_id}")
             return {
                 'success': True,
                 'message': 'Task successfully enqueued',
-                'message_id': message.message_id,
-                'task_id': task_id
+                'message_id': message.message_id
             }
         else:
-            logger.error(f"[task: {task_id}] Failed to enqueue: No message ID returned")
+            logger.error(f"Tasks {task_ids} failed to enqueue: No message ID returned")
             return {
                 'success': False,
                 'message': 'Failed to enqueue task: No message ID returned',
-                'message_id': None,
-                'task_id': task_id
+                'message_id': None
             }
 
     except Exception as e:
-        logger.error(f"[task: {task_id}] Failed to enqueue: {str(e)}", exc_info=True)
+        logger.error(f"Tasks {task_ids} failed to enqueue: {str(e)}", exc_info=True)
         return {
             'success': False,
             'message': str(e),
-            'message_id': None,
-            'task_id': task_id
+            'message_id': None
         }
 
 
 def enqueue_multiple_tasks(task_ids):
     """
-    批量发送多个任务到队列
+    批量发送多个任务到队列。所有任务放在同一条编译消息中，同一次提交的代码只编译一次，
+    编译完成后各任务分别进入cc_training队列
 
     Args:
         task_ids (list): 任务ID列表
@@ -478,8 +700,10 @@ def enqueue_multiple_tasks(task_ids):
     results = []
     failed_tasks = []
 
+    if task_ids:
+        send_result = _send_compile_message(task_ids)
     for task_id in task_ids:
-        result = enqueue_cc_task(task_id)
+        result = dict(send_result, task_id=task_id)
         results.append(result)
 
         if not result['success']:
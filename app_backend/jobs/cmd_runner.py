@@ -0,0 +1,226 @@
+"""
+子进程执行器。stdout和stderr由读取线程持续读出，只保留开头和末尾的一部分，用户程序输出再多也不会占用大量内存；
+运行期间定期采样进程组的CPU时间和内存占用，支持超时及通过threading.Event协作取消。
+"""
+
+import logging
+import os
+import select
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+# 每个输出流保留的开头和末尾字节数
+OUTPUT_HEAD_BYTES = 8 * 1024
+OUTPUT_TAIL_BYTES = 8 * 1024
+_READ_CHUNK = 64 * 1024
+# 读取线程检查是否需要停止的间隔（秒）
+_DRAIN_POLL_INTERVAL = 0.5
+# 命令结束后等待读取线程读完输出的最长时间（秒），超时说明有脱离进程组的后台进程仍持有输出管道
+READER_JOIN_TIMEOUT = 5
+# 编译、评测等命令的超时时间（秒）
+COMMAND_TIMEOUT = 300
+
+
+class CommandCancelled(RuntimeError):
+    """命令在运行期间被取消"""
+
+
+class BoundedOutput:
+    """只保留开头head_bytes和末尾tail_bytes字节的输出缓冲区，中间部分只记录字节数"""
+
+    def __init__(self, head_bytes=OUTPUT_HEAD_BYTES, tail_bytes=OUTPUT_TAIL_BYTES):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.head = bytearray()
+        self.tail = deque()
+        self.tail_size = 0
+        self.total = 0
+
+    def write(self, data):
+        self.total += len(data)
+        if len(self.head) < self.head_bytes:
+            n = self.head_bytes - len(self.head)
+            self.head += data[:n]
+            data = data[n:]
+        if not data:
+            return
+        self.tail.append(data)
+        self.tail_size += len(data)
+        # 丢弃超出末尾容量的旧数据
+        while self.tail_size - len(self.tail[0]) >= self.tail_bytes:
+            self.tail_size -= len(self.tail.popleft())
+
+    def text(self):
+        tail = b''.join(self.tail)[-self.tail_bytes:] if self.tail else b''
+        omitted = self.total - len(self.head) - len(tail)
+        head = self.head.decode(errors='replace')
+        tail = tail.decode(errors='replace')
+        if omitted > 0:
+            return f"{head}\n... [省略 {omitted} 字节] ...\n{tail}"
+        return head + tail
+
+
+class CommandResult:
+    """
+    命令执行结果
+    :param returncode: 退出码
+    :param stdout: 截断后的标准输出
+    :param stderr: 截断后的标准错误
+    :param wall_time: 运行时间（秒）
+    :param cpu_time: 进程组的用户态与内核态CPU时间之和（秒），为采样值，不含最后一次采样后退出的进程的增量
+    :param peak_rss: 进程组常驻内存之和的峰值（字节），为采样值
+    """
+
+    def __init__(self, returncode, stdout, stderr, wall_time, cpu_time, peak_rss):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.wall_time = wall_time
+        self.cpu_time = cpu_time
+        self.peak_rss = peak_rss
+
+    def resource_summary(self):
+        return (f"wall {self.wall_time:.1f}s, cpu {self.cpu_time:.1f}s, "
+                f"peak rss {self.peak_rss / 1024 / 1024:.1f} MB")
+
+
+class _GroupSampler:
+    """采样进程组（子进程及其所有后代）的CPU时间和内存占用"""
+
+    def __init__(self, pid):
+        try:
+            self.root = psutil.Process(pid)
+        except psutil.NoSuchProcess:
+            self.root = None
+        self.cpu_times = {}
+        self.peak_rss = 0
+
+    def sample(self):
+        if self.root is None:
+            return
+        try:
+            processes = [self.root] + self.root.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return
+        rss = 0
+        for p in processes:
+            try:
+                with p.oneshot():
+                    times = p.cpu_times()
+                    rss += p.memory_info().rss
+                self.cpu_times[(p.pid, p.create_time())] = times.user + times.system
+            except psutil.Error:
+                continue
+        self.peak_rss = max(self.peak_rss, rss)
+
+    @property
+    def cpu_time(self):
+        return sum(self.cpu_times.values())
+
+
+def kill_process_group(process, task_id):
+    """
+    使用 SIGKILL 强制终止进程组
+    :param process: subprocess.Popen 对象
+    :param task_id: 任务ID
+    :return: None
+    """
+    try:
+        logger.info(f"[task: {task_id}] Attempting to kill process group for PID: {process.pid}")
+        # 子进程通过setsid创建进程组，组ID即为子进程PID，子进程本身已退出时仍可终止组内的其他进程
+        os.killpg(process.pid, signal.SIGKILL)
+        logger.info(f"[task: {task_id}] Process group killed successfully")
+    except ProcessLookupError:
+        logger.info(f"[task: {task_id}] Process group already terminated")
+    except Exception as e:
+        logger.error(f"[task: {task_id}] Failed to kill process group: {str(e)}")
+
+
+def _drain(stream, output, stop):
+    """
+    读出管道中的输出直到EOF，stop被设置后不再等待，退出时关闭管道。
+    直接读取文件描述符，关闭管道不会与阻塞在读取中的缓冲流争用锁
+    """
+    fd = stream.fileno()
+    poller = select.poll()
+    poller.register(fd, select.POLLIN)
+    with stream:
+        while not stop.is_set():
+            if not poller.poll(_DRAIN_POLL_INTERVAL * 1000):
+                continue
+            chunk = os.read(fd, _READ_CHUNK)
+            if not chunk:
+                return
+            output.write(chunk)
+
+
+def run_process(cmd, task_id, timeout, shell=True, on_poll=None, poll_interval=1, cancel_event=None):
+    """
+    在新的进程组中运行命令并等待结束，超时、取消或当前线程被中断（例如Dramatiq超时）时终止整个进程组
+    :param cmd: 命令字符串或参数列表
+    :param task_id: 任务ID，用于日志
+    :param timeout: 超时时间（秒）
+    :param shell: 是否通过shell执行
+    :param on_poll: 可选，运行期间每隔poll_interval秒调用一次的回调，在当前线程中执行
+    :param poll_interval: 采样及回调的间隔（秒）
+    :param cancel_event: 可选，threading.Event，被设置后终止命令
+    :return: CommandResult
+    :raise subprocess.TimeoutExpired: 超过timeout秒仍未结束
+    :raise CommandCancelled: cancel_event被设置
+    """
+    start = time.monotonic()
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=shell,
+                               preexec_fn=os.setsid)  # 创建新的进程组
+    stdout, stderr = BoundedOutput(), BoundedOutput()
+    stop_readers = threading.Event()
+    readers = [threading.Thread(target=_drain, args=(process.stdout, stdout, stop_readers), daemon=True),
+               threading.Thread(target=_drain, args=(process.stderr, stderr, stop_readers), daemon=True)]
+    for reader in readers:
+        reader.start()
+    sampler = _GroupSampler(process.pid)
+    deadline = start + timeout
+    try:
+        while True:
+            sampler.sample()
+            try:
+                process.wait(timeout=max(min(poll_interval, deadline - time.monotonic()), 0))
+                break
+            except subprocess.TimeoutExpired:
+                if time.monotonic() >= deadline:
+                    raise subprocess.TimeoutExpired(cmd, timeout)
+            if cancel_event is not None and cancel_event.is_set():
+                raise CommandCancelled("Command cancelled")
+            if on_poll is not None:
+                on_poll()
+        for reader in readers:
+            reader.join(max(deadline - time.monotonic(), 0))
+        if any(reader.is_alive() for reader in readers):
+            # 命令已退出，但进程组中仍有后台进程持有输出管道
+            logger.warning(f"[task: {task_id}] Command exited but its process group still holds the output pipes")
+            kill_process_group(process, task_id)
+    except BaseException:
+        # 包括Dramatiq的TimeLimitExceeded等中断异常，确保不残留子进程
+        kill_process_group(process, task_id)
+        process.wait()
+        raise
+    finally:
+        reader_deadline = time.monotonic() + READER_JOIN_TIMEOUT
+        for reader in readers:
+            reader.join(max(reader_deadline - time.monotonic(), 0))
+        if any(reader.is_alive() for reader in readers):
+            # 脱离进程组的后台进程（例如自行setsid的守护进程）仍持有输出管道，不再等待其关闭
+            logger.warning(f"[task: {task_id}] Output pipes are still open after the process group was killed, "
+                           f"closing them")
+            stop_readers.set()
+            for reader in readers:
+                reader.join()
+
+    return CommandResult(process.returncode, stdout.text(), stderr.text(), time.monotonic() - start,
+                         sampler.cpu_time, sampler.peak_rss)
@@ -0,0 +1,171 @@
+"""
+编译缓存。学生经常重复提交完全相同的controller.cc，以源码内容和课程项目（其他源码、Makefile、编译器版本）
+的指纹作为key缓存编译出的sender和receiver，命中时直接硬链接到任务目录，无需获取编译锁重新编译。
+缓存目录按总大小淘汰最久未使用的条目。
+"""
+
+import functools
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import uuid
+
+from app_backend import get_default_config
+
+logger = logging.getLogger(__name__)
+config = get_default_config()
+
+BINARY_NAMES = ('sender', 'receiver')
+
+# 参与项目指纹计算的文件，编译产物（.o、.a及可执行文件）不参与
+_FINGERPRINT_EXTENSIONS = ('.cc', '.hh', '.h', '.am', '.ac')
+_FINGERPRINT_FILENAMES = ('Makefile',)
+
+
+@functools.lru_cache(maxsize=1)
+def _compiler_version():
+    try:
+        return subprocess.run(['g++', '--version'], capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.SubprocessError):
+        return ''
+
+
+def _fingerprint_files(project_root, controller):
+    """
+    :return: 参与项目指纹计算的文件 [(相对路径, 路径, 修改时间, 大小)]，按路径排序
+    """
+    files = []
+    for root, dirs, names in os.walk(project_root):
+        dirs.sort()
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            if path == controller or not (name.endswith(_FINGERPRINT_EXTENSIONS) or name in _FINGERPRINT_FILENAMES):
+                continue
+            stat = os.stat(path)
+            files.append((os.path.relpath(path, project_root), path, stat.st_mtime_ns, stat.st_size))
+    return files
+
+
+# 课程项目目录 -> (文件的相对路径、修改时间及大小, 指纹)，文件未变化时无需重新读取和计算哈希
+_fingerprint_cache = {}
+
+
+def project_fingerprint(course_project_dir):
+    """
+    课程项目的指纹，包含除controller.cc外的所有源码、Makefile及编译器版本，项目或编译环境变化时缓存自动失效。
+    每个目录的指纹按文件的修改时间和大小缓存在进程内，文件未变化时只需遍历目录，不再读取文件内容
+    :param course_project_dir: 课程项目的datagrump目录
+    :return: sha256十六进制字符串
+    """
+    project_root = os.path.dirname(course_project_dir)
+    controller = os.path.join(course_project_dir, 'controller.cc')
+    files = _fingerprint_files(project_root, controller)
+    signature = tuple((relpath, mtime, size) for relpath, _, mtime, size in files)
+    cached = _fingerprint_cache.get(project_root)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    digest = hashlib.sha256(_compiler_version().encode())
+    for relpath, path, _, _ in files:
+        digest.update(relpath.encode())
+        with open(path, 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    fingerprint = digest.hexdigest()
+    _fingerprint_cache[project_root] = (signature, fingerprint)
+    return fingerprint
+
+
+def compile_cache_key(cc_file, course_project_dir):
+    """
+    :param cc_file: 用户上传的cc文件
+    :param course_project_dir: 课程项目的datagrump目录
+    :return: 缓存key，源码和项目指纹的sha256
+    """
+    with open(cc_file, 'rb') as f:
+        source_digest = hashlib.sha256(f.read()).hexdigest()
+    return hashlib.sha256(f"{source_digest}:{project_fingerprint(course_project_dir)}".encode()).hexdigest()
+
+
+def _entry_dir(key):
+    return os.path.join(config.CompileCache.DIR, key)
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        # 跨文件系统等无法硬链接时复制
+        shutil.copy2(src, dst)
+
+
+def fetch_binaries(key, sender_path, receiver_path, task_id):
+    """
+    从缓存中取出编译结果，硬链接到sender_path和receiver_path
+    :return: bool，是否命中缓存
+    """
+    entry = _entry_dir(key)
+    targets = (sender_path, receiver_path)
+    try:
+        for name, target in zip(BINARY_NAMES, targets):
+            _link_or_copy(os.path.join(entry, name), target)
+        # 更新条目的修改时间，用于按最近使用时间淘汰
+        os.utime(entry)
+    except FileNotFoundError:
+        # 未命中或条目恰好被淘汰
+        for target in targets:
+            if os.path.exists(target):
+                os.remove(target)
+        return False
+    logger.info(f"[task: {task_id}] Compile cache hit: {key}")
+    return True
+
+
+def store_binaries(key, sender_path, receiver_path, task_id):
+    """
+    将编译结果放入缓存，并在缓存超过大小上限时淘汰最久未使用的条目。
+    缓存失败不影响任务，只记录日志
+    """
+    entry = _entry_dir(key)
+    if os.path.exists(entry):
+        return
+    tmp_entry = os.path.join(config.CompileCache.DIR, f".tmp-{uuid.uuid4().hex}")
+    try:
+        os.makedirs(tmp_entry)
+        for name, source in zip(BINARY_NAMES, (sender_path, receiver_path)):
+            shutil.copy2(source, os.path.join(tmp_entry, name))
+        # 先写入临时目录再重命名，其他任务不会读到不完整的条目
+        os.rename(tmp_entry, entry)
+        logger.info(f"[task: {task_id}] Stored compiled binaries in compile cache: {key}")
+    except OSError as e:
+        # 其他任务同时写入了相同的条目时重命名失败，属于正常情况
+        logger.warning(f"[task: {task_id}] Failed to store compiled binaries in compile cache: {str(e)}")
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        return
+    _evict(task_id)
+
+
+def _evict(task_id):
+    """缓存总大小超过上限时，按最近使用时间从旧到新删除条目"""
+    max_bytes = config.CompileCache.MAX_SIZE_MB * 1024 * 1024
+    entries = []
+    total = 0
+    with os.scandir(config.CompileCache.DIR) as it:
+        for item in it:
+            if item.name.startswith('.tmp-') or not item.is_dir():
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(item.path, name)) for name in BINARY_NAMES)
+                entries.append((item.stat().st_mtime, size, item.path))
+            except FileNotFoundError:
+                continue
+            total += size
+    if total <= max_bytes:
+        return
+    for _, size, path in sorted(entries):
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        logger.info(f"[task: {task_id}] Evicted compile cache entry: {path}")
+        if total <= max_bytes:
+            break
@@ -6,6 +6,8 @@ class DramatiqQueue(Enum):
     Enum representing different task queues.
     用到了任务队列的枚举类
     """
+    # 编译用户代码的任务队列，编译完成后将评测任务发送到cc_training队列
+    COMPILE = "compile"
     # 运行算法评测的任务队列
     CC_TRAINING = "cc_training"
     # 绘图任务队列
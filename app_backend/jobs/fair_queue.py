@@ -0,0 +1,160 @@
+"""
+评测任务的公平调度。编译完成的任务按用户放入Redis中的子队列，有待评测任务的用户按轮转顺序排成一个环，
+cc_training队列中的消息只作为"运行一个任务"的令牌，worker取到令牌时才从环首的用户取出一个任务运行，
+该用户仍有任务时排到环尾。一个用户提交再多任务，其他用户的任务最多等待（活跃用户数 - 1）个任务，
+而不是等待整个队列。
+
+每个用户有两个子队列：每次提交的第一个任务放入优先子队列，先于该用户的其他任务运行，
+用户提交新代码后能尽快看到第一个结果。
+"""
+
+import logging
+
+from app_backend import get_default_config
+
+logger = logging.getLogger(__name__)
+config = get_default_config()
+
+# 有待评测任务的用户，按轮转顺序排列
+ACTIVE_USERS_KEY = 'cc_fair_users'
+# 用户子队列的key前缀，优先子队列为 {前缀}first:{user_id}，普通子队列为 {前缀}tasks:{user_id}
+USER_QUEUE_PREFIX = 'cc_fair_'
+
+# KEYS: 活跃用户, 优先子队列, 普通子队列  ARGV: 用户id, 任务id, 是否放入优先子队列
+# 用户原本没有待评测任务时加入环尾，保证环中的用户都有任务、有任务的用户都在环中
+_PUSH_SCRIPT = """
+if redis.call('LLEN', KEYS[2]) + redis.call('LLEN', KEYS[3]) == 0 then
+    redis.call('RPUSH', KEYS[1], ARGV[1])
+end
+if ARGV[3] == '1' then
+    redis.call('RPUSH', KEYS[2], ARGV[2])
+else
+    redis.call('RPUSH', KEYS[3], ARGV[2])
+end
+return 1
+"""
+
+# KEYS: 活跃用户  ARGV: 子队列key前缀
+# 取出环首用户的一个任务，用户仍有任务时放回环尾
+_POP_SCRIPT = """
+while true do
+    local user = redis.call('LPOP', KEYS[1])
+    if not user then
+        return false
+    end
+    local first_key = ARGV[1] .. 'first:' .. user
+    local tasks_key = ARGV[1] .. 'tasks:' .. user
+    local task = redis.call('LPOP', first_key)
+    if not task then
+        task = redis.call('LPOP', tasks_key)
+    end
+    if task then
+        if redis.call('LLEN', first_key) + redis.call('LLEN', tasks_key) > 0 then
+            redis.call('RPUSH', KEYS[1], user)
+        end
+        return {user, task}
+    end
+end
+"""
+
+# KEYS: 活跃用户, 优先子队列, 普通子队列  ARGV: 用户id, 任务id
+# 从用户的子队列中移除任务，用户不再有任务时从环中移除
+_REMOVE_SCRIPT = """
+local removed = redis.call('LREM', KEYS[2], 0, ARGV[2]) + redis.call('LREM', KEYS[3], 0, ARGV[2])
+if removed > 0 and redis.call('LLEN', KEYS[2]) + redis.call('LLEN', KEYS[3]) == 0 then
+    redis.call('LREM', KEYS[1], 0, ARGV[1])
+end
+return removed
+"""
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _user_queue_keys(user_id):
+    return f'{USER_QUEUE_PREFIX}first:{user_id}', f'{USER_QUEUE_PREFIX}tasks:{user_id}'
+
+
+def push_task(redis_client, task_id, user_id, first=False):
+    """
+    将任务放入用户的子队列，之后需向cc_training队列发送一个令牌
+    :param redis_client: Redis客户端
+    :param task_id: 任务id
+    :param user_id: 用户id
+    :param first: 是否为本次提交的第一个任务，放入优先子队列
+    """
+    first_key, tasks_key = _user_queue_keys(user_id)
+    priority = first and config.Scheduler.FIRST_RUN_PRIORITY
+    redis_client.eval(_PUSH_SCRIPT, 3, ACTIVE_USERS_KEY, first_key, tasks_key, user_id, task_id,
+                      '1' if priority else '0')
+    logger.debug(f"[task: {task_id}] Pushed into fair queue of user {user_id}, priority: {priority}")
+
+
+def remove_task(redis_client, task_id, user_id):
+    """
+    从用户的子队列中移除任务，用于放入子队列后令牌发送失败时回退，保证子队列中的任务数与令牌数一致
+    :param redis_client: Redis客户端
+    :param task_id: 任务id
+    :param user_id: 用户id
+    :return: 是否移除，任务已被其他令牌取出时返回False
+    """
+    first_key, tasks_key = _user_queue_keys(user_id)
+    removed = redis_client.eval(_REMOVE_SCRIPT, 3, ACTIVE_USERS_KEY, first_key, tasks_key, user_id, task_id)
+    logger.debug(f"[task: {task_id}] Removed from fair queue of user {user_id}: {bool(removed)}")
+    return bool(removed)
+
+
+def pop_task(redis_client):
+    """
+    按用户轮转顺序取出下一个待评测的任务
+    :param redis_client: Redis客户端
+    :return: 任务id，没有待评测任务时返回None
+    """
+    result = redis_client.eval(_POP_SCRIPT, 1, ACTIVE_USERS_KEY, USER_QUEUE_PREFIX)
+    if not result:
+        return None
+    user_id, task_id = (_decode(item) for item in result)
+    logger.debug(f"[task: {task_id}] Popped from fair queue of user {user_id}")
+    return task_id
+
+
+def queue_snapshot(redis_client, user_id):
+    """
+    读取公平队列的快照，用于估计排队位置，一次Redis往返读取环，一次读取各用户的子队列长度
+    :param redis_client: Redis客户端
+    :param user_id: 用户id
+    :return: (环中各用户的待运行任务数，按轮转顺序排列的[(user_id, 任务数)], 该用户按运行顺序排列的待运行任务id列表)
+    """
+    users = [_decode(user) for user in redis_client.lrange(ACTIVE_USERS_KEY, 0, -1)]
+    pipe = redis_client.pipeline(transaction=False)
+    for user in users:
+        first_key, tasks_key = _user_queue_keys(user)
+        pipe.llen(first_key)
+        pipe.llen(tasks_key)
+    first_key, tasks_key = _user_queue_keys(user_id)
+    pipe.lrange(first_key, 0, -1)
+    pipe.lrange(tasks_key, 0, -1)
+    results = pipe.execute()
+    lengths = [(user, results[2 * i] + results[2 * i + 1]) for i, user in enumerate(users)]
+    user_tasks = [_decode(task_id) for task_id in results[-2] + results[-1]]
+    return lengths, user_tasks
+
+
+def tasks_ahead(lengths, user_id, index):
+    """
+    按轮转顺序，计算用户的第index个待运行任务（从0开始）之前会运行的任务数。
+    每一轮每个仍有任务的用户运行一个任务，环中排在该用户之前的用户在第index轮也先运行
+    :param lengths: queue_snapshot返回的[(user_id, 任务数)]，不在环中的用户视为排在环尾
+    :param user_id: 用户id
+    :param index: 任务在该用户子队列中的位置，可以超出当前长度，用于估计尚未编译完成的任务
+    :return: 之前会运行的任务数
+    """
+    ahead = index
+    before = True
+    for user, length in lengths:
+        if user == user_id:
+            before = False
+            continue
+        ahead += min(length, index + 1 if before else index)
+    return ahead
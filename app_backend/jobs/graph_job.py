@@ -6,9 +6,10 @@ from dramatiq.brokers.redis import RedisBroker
 from dramatiq.middleware import TimeLimitExceeded
 
 from app_backend import setup_logger, get_app
-from app_backend.analysis.tunnel_parse import TunnelParse
+from app_backend.analysis.render_pool import render_task_graphs, submit_render
+from app_backend.analysis.tunnel_parse import parse_cache_path
 from app_backend.jobs.dramatiq_queue import DramatiqQueue
-from app_backend.model.graph_model import GraphModel, GraphType
+from app_backend.model.graph_model import GraphModel, GraphType, get_graph_data_path
 from app_backend.model.task_model import TaskModel, TaskStatus
 from app_backend.model.user_model import *
 
@@ -111,34 +112,53 @@ def _graph(task, result_path):
     assert result_path is not None, "Result path must be provided for graph generation"
 
     throughput_graph_svg = os.path.join(task.task_dir, f"{task.trace_name}.throughput.svg")
+    throughput_graph_png = os.path.join(task.task_dir, f"{task.trace_name}.throughput.png")
     # delay_graph_svg = os.path.join(task.task_dir, f"{task.trace_name}.delay.svg")
     delay_graph_png = os.path.join(task.task_dir, f"{task.trace_name}.delay.png")
+    parse_cache = parse_cache_path(result_path)
 
     logger.info(f"[task: {task_id}] is generating graphs")
     graph_start_time = time.time()
-    run_cmd(f'mm-throughput-graph 500 {result_path} > {throughput_graph_svg}', task_id)
-    # run_cmd(f'mm-delay-graph {result_path} > {delay_graph_svg}', task_id)
-    # 另一个画图逻辑
-    tunnel_graph = TunnelParse(
-        tunnel_log=result_path,
-        throughput_graph=None,
-        delay_graph=delay_graph_png,
-        ms_per_bin=500)
-    tunnel_graph.graph()
+    graph_data_path = get_graph_data_path(task.task_dir, task.trace_name)
+    throughput_graph_path = None
+    render_throughput_graph = None
+    render_delay_graph = None
+    if config.Graph.RENDER_IMAGES:
+        # 默认由解析结果在进程内绘制吞吐图，配置为mm-throughput-graph且原始日志存在时才调用外部工具
+        if config.Graph.THROUGHPUT_GRAPH_RENDERER == 'mm-throughput-graph' and os.path.exists(result_path):
+            throughput_graph_path = throughput_graph_svg
+            run_cmd(f'mm-throughput-graph 500 {result_path} > {throughput_graph_svg}', task_id)
+        else:
+            throughput_graph_path = throughput_graph_png
+            render_throughput_graph = throughput_graph_png
+        # run_cmd(f'mm-delay-graph {result_path} > {delay_graph_svg}', task_id)
+        render_delay_graph = delay_graph_png
+
+    # 加载评分时保存的解析结果（不可用时解析原始日志），保存性能图数据，前端可直接据此绘图，并绘制性能图
+    render_args = (result_path, parse_cache, graph_data_path, render_throughput_graph, render_delay_graph,
+                   config.Graph.DOWNSAMPLER, config.Graph.MAX_PLOT_POINTS)
+    if config.Graph.RENDER_PROCESSES > 0:
+        source = submit_render(config.Graph.RENDER_PROCESSES, config.Graph.RENDER_MEMORY_LIMIT_MB,
+                               config.Graph.RENDER_TASKS_PER_CHILD, *render_args)
+    else:
+        source = render_task_graphs(*render_args)
+    logger.info(f"[task: {task_id}] Saved graph data to {graph_data_path}, parsed tunnel log loaded from {source}")
+
+    if config.Graph.RENDER_IMAGES:
+        logger.info(f"[task: {task_id}] Graph images generated: {throughput_graph_path}, {delay_graph_png}")
+        throughput_graph = GraphModel(task_id=task_id, graph_type=GraphType.THROUGHPUT,
+                                      graph_path=throughput_graph_path)
+        throughput_graph.insert()
+        delay_graph = GraphModel(task_id=task_id, graph_type=GraphType.DELAY,
+                                 graph_path=delay_graph_png)
+        delay_graph.insert()
     graph_end_time = time.time()
-    logger.info(
-        f"[task: {task_id}] Graphs generated successfully after {graph_end_time - graph_start_time:.2f} seconds: "
-        f"{throughput_graph_svg}, {delay_graph_png}")
-    throughput_graph = GraphModel(task_id=task_id, graph_type=GraphType.THROUGHPUT,
-                                  graph_path=throughput_graph_svg)
-    throughput_graph.insert()
-    delay_graph = GraphModel(task_id=task_id, graph_type=GraphType.DELAY,
-                             graph_path=delay_graph_png)
-    delay_graph.insert()
-    os.remove(result_path)
-    logger.info(f"[task: {task_id}] Removed result file: {result_path}")
+    logger.info(f"[task: {task_id}] Graphs generated successfully after {graph_end_time - graph_start_time:.2f} seconds")
+    for path in (result_path, parse_cache):
+        if os.path.exists(path):
+            os.remove(path)
+            logger.info(f"[task: {task_id}] Removed result file: {path}")
     task.update_task_log(f"性能图生成成功，耗时 {graph_end_time - graph_start_time:.2f} 秒。")
-    task.update()  # 写入日志
 
     logger.info(
         f"[task: {task_id}] Graph task completed successfully, inserted graphs into database")
@@ -178,7 +198,6 @@ def _svg2png(task, graph_id):
         f"[task: {task_id}] Converted delay graph SVG to PNG, svg removed, took {convert_end_time - convert_start_time:.2f} seconds.")
     task.update_task_log(
         f"{graph_type.value}性能图压缩成功，耗时 {convert_end_time - convert_start_time:.2f} 秒。")
-    task.update()  # 写入日志
 
     logger.info(
         f"[task: {task_id}] Graph converted successfully to PNG, graph_type: {graph_type.value}, path: {graph_png_path}")
@@ -195,4 +214,3 @@ def _handle_exception(task_id, err_msg, task=None):
     logger.error(f"[task: {task_id}] Graph task error: {task_error_log_content}", exc_info=True)
     if task:
         task.update_task_log(task_error_log_content)
-        task.update()
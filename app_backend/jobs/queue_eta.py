@@ -0,0 +1,152 @@
+"""
+排队位置及预计开始、结束时间的估计。评测worker记录每个trace最近若干次评测的运行时间及正在运行的评测，
+估计时根据公平队列快照计算任务前面的任务数，按各评测worker的空闲时间依次分配前面的任务。
+"""
+
+import heapq
+import logging
+import time
+
+from app_backend import get_default_config
+from app_backend.jobs.fair_queue import queue_snapshot, tasks_ahead
+from app_backend.model.task_model import TaskStatus
+
+logger = logging.getLogger(__name__)
+config = get_default_config()
+
+# 每个trace最近若干次评测的运行时间（秒），列表，新的在前
+TRACE_DURATION_PREFIX = 'trace_duration:'
+# 正在运行的评测，哈希表，task_id -> "开始时间戳 trace名称"
+RUNNING_CONTESTS_KEY = 'cc_running'
+# 超过评测任务超时时间（20分钟）仍未结束的记录视为worker异常退出残留的记录
+STALE_RUNNING_SECONDS = 1200
+
+
+def record_contest_start(redis_client, task_id, trace_name):
+    """记录开始运行的评测，记录失败只影响估计，不影响任务"""
+    try:
+        redis_client.hset(RUNNING_CONTESTS_KEY, task_id, f"{time.time()} {trace_name}")
+    except Exception as e:
+        logger.warning(f"[task: {task_id}] Failed to record contest start: {str(e)}")
+
+
+def record_contest_end(redis_client, task_id, trace_name, duration=None):
+    """
+    记录评测结束及运行时间，记录失败只影响估计，不影响任务
+    :param duration: 评测运行时间（秒），评测失败时为None，不计入历史运行时间
+    """
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hdel(RUNNING_CONTESTS_KEY, task_id)
+        if duration is not None:
+            key = f'{TRACE_DURATION_PREFIX}{trace_name}'
+            pipe.lpush(key, f"{duration:.1f}")
+            pipe.ltrim(key, 0, config.Scheduler.DURATION_SAMPLES - 1)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"[task: {task_id}] Failed to record contest end: {str(e)}")
+
+
+def _mean_durations(redis_client, trace_names):
+    """
+    :return: {trace名称: 最近若干次评测的平均运行时间}，没有记录的trace使用默认运行时间
+    """
+    trace_names = list(trace_names)
+    pipe = redis_client.pipeline(transaction=False)
+    for trace_name in trace_names:
+        pipe.lrange(f'{TRACE_DURATION_PREFIX}{trace_name}', 0, -1)
+    durations = {}
+    for trace_name, samples in zip(trace_names, pipe.execute()):
+        samples = [float(sample) for sample in samples]
+        durations[trace_name] = sum(samples) / len(samples) if samples else config.Scheduler.DEFAULT_CONTEST_SECONDS
+    return durations
+
+
+def _running_contests(redis_client):
+    """
+    :return: {task_id: (开始时间戳, trace名称)}
+    """
+    running = {}
+    stale = []
+    for task_id, value in redis_client.hgetall(RUNNING_CONTESTS_KEY).items():
+        task_id = task_id.decode() if isinstance(task_id, bytes) else task_id
+        value = value.decode() if isinstance(value, bytes) else value
+        started, trace_name = value.split(' ', 1)
+        if float(started) < time.time() - STALE_RUNNING_SECONDS:
+            stale.append(task_id)
+            continue
+        running[task_id] = (float(started), trace_name)
+    if stale:
+        logger.warning(f"Removing {len(stale)} stale running contest records")
+        redis_client.hdel(RUNNING_CONTESTS_KEY, *stale)
+    return running
+
+
+def _start_times(free_times, duration, positions):
+    """
+    依次将任务分配给最早空闲的worker，计算排在第position个的任务（从0开始）的开始时间
+    :param free_times: 各worker的空闲时间戳
+    :param duration: 前面每个任务的预计运行时间
+    :param positions: 需要计算开始时间的位置
+    :return: {position: 开始时间戳}
+    """
+    heap = list(free_times)
+    heapq.heapify(heap)
+    starts = {}
+    wanted = sorted(set(positions))
+    n = 0
+    for position in wanted:
+        while n < position:
+            heapq.heapreplace(heap, heap[0] + duration)
+            n += 1
+        starts[position] = heap[0]
+    return starts
+
+
+def estimate_tasks(redis_client, user_id, tasks):
+    """
+    估计用户任务的排队位置及预计开始、结束时间
+    :param redis_client: Redis客户端
+    :param user_id: 用户id
+    :param tasks: 用户未完成的任务，[(task_id, trace_name, task_status)]，按创建时间排列
+    :return: {task_id: {'position', 'estimated_start', 'estimated_finish'}}，
+             position为前面的任务数，正在运行的任务为None；时间为Unix时间戳（秒）
+    """
+    now = time.time()
+    running = _running_contests(redis_client)
+    lengths, queued_ids = queue_snapshot(redis_client, user_id)
+    durations = _mean_durations(redis_client, {trace_name for _, trace_name in running.values()} |
+                                {trace_name for _, trace_name, _ in tasks})
+    average = sum(durations.values()) / len(durations) if durations else config.Scheduler.DEFAULT_CONTEST_SECONDS
+
+    # 正在运行的评测预计结束时正在运行的worker空闲，其余worker当前空闲
+    running_finish = {task_id: max(started + durations[trace_name], now)
+                      for task_id, (started, trace_name) in running.items()}
+    idle_workers = max(config.Scheduler.CONTEST_WORKERS - len(running), 0)
+    free_times = list(running_finish.values()) + [now] * idle_workers
+    if not free_times:
+        free_times = [now]
+
+    # 已编译的任务按子队列中的位置计算，尚未编译完成的任务视为排在该用户子队列的末尾
+    queue_index = {task_id: index for index, task_id in enumerate(queued_ids)}
+    next_index = len(queued_ids)
+    positions = {}
+    for task_id, _, task_status in tasks:
+        if task_id in queue_index:
+            positions[task_id] = tasks_ahead(lengths, user_id, queue_index[task_id])
+        elif task_status in (TaskStatus.QUEUED, TaskStatus.COMPILING, TaskStatus.COMPILED):
+            positions[task_id] = tasks_ahead(lengths, user_id, next_index)
+            next_index += 1
+
+    # 前面的任务来自不同用户和trace，按各trace平均运行时间的平均值估计
+    starts = _start_times(free_times, average, positions.values())
+    estimates = {}
+    for task_id, trace_name, _ in tasks:
+        if task_id in running:
+            estimates[task_id] = {'position': None, 'estimated_start': running[task_id][0],
+                                  'estimated_finish': running_finish[task_id]}
+        elif task_id in positions:
+            start = starts[positions[task_id]]
+            estimates[task_id] = {'position': positions[task_id], 'estimated_start': start,
+                                  'estimated_finish': start + durations[trace_name]}
+    return estimates
@@ -38,3 +38,16 @@ class CompetitionModel(db.Model):
         if kwargs:
             query = query.filter_by(**kwargs)
         return query.scalar()
+
+    @classmethod
+    def count_by(cls, column, **kwargs):
+        """
+        使用一条GROUP BY查询按列分组统计报名数量。
+        :param column: 分组的列，例如 CompetitionModel.cname
+        :param kwargs: 过滤条件
+        :return: {列的值: 数量}，没有记录的值不在其中
+        """
+        query = db.session.query(column, func.count(cls.id))
+        if kwargs:
+            query = query.filter_by(**kwargs)
+        return dict(query.group_by(column).all())
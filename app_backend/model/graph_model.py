@@ -1,4 +1,5 @@
 import logging
+import os
 import uuid
 
 from sqlalchemy import func
@@ -16,6 +17,11 @@ class GraphType(Enum):
     DELAY = 'delay'
 
 
+def get_graph_data_path(task_dir, trace_name):
+    """性能图数据文件路径，与性能图保存在同一任务目录，由绘图任务生成"""
+    return os.path.join(task_dir, f"{trace_name}.graph.json")
+
+
 class GraphModel(db.Model):
     __tablename__ = 'graph'
     graph_id = db.Column(VARCHAR(36, charset='utf8mb4'), primary_key=True, default=lambda: str(uuid.uuid4()))
@@ -25,6 +31,11 @@ class GraphModel(db.Model):
     graph_path = db.Column(VARCHAR(255, charset='utf8mb4'), nullable=False)
     created_at = db.Column(db.DateTime, server_default=func.now(), nullable=False)
 
+    __table_args__ = (
+        # 按任务和图表类型查询图表
+        db.Index('ix_graph_task_type', 'task_id', 'graph_type'),
+    )
+
     def update(self, **kwargs):
         logger.debug(f"Updating graph {self.graph_id} for task {self.task_id} with parameters: {kwargs}")
         try:
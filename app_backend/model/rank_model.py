@@ -26,6 +26,13 @@ class RankModel(db.Model):
     updated_at = db.Column(db.DateTime, server_default=func.now(),
                            onupdate=func.now(), nullable=False)
 
+    __table_args__ = (
+        # 课程榜单
+        db.Index('ix_rank_cname', 'cname'),
+        # 用户在课程中的榜单记录（更新榜单）
+        db.Index('ix_rank_competition_id', 'competition_id'),
+    )
+
     def update(self, **kwargs):
         logger.debug(f"Updating rank for user {self.username} with parameters: {kwargs}")
         try:
@@ -13,6 +13,7 @@ from sqlalchemy.orm import deferred
 
 from app_backend import db, get_default_config
 from app_backend.security.bypass_decorators import admin_bypass
+from app_backend.utils.task_log import append_task_log, read_task_log
 
 logger = logging.getLogger(__name__)
 config = get_default_config()
@@ -31,7 +32,7 @@ class TaskStatus(Enum):
 
     @property
     def priority(self):
-        """获取状态优先级，数字越小优先级越高，用于to_history_dict()
+        """获取状态优先级，数字越小优先级越高，用于聚合提交记录（UploadModel）的状态
            状态优先级：compiled_failed > error > not_queued > compiled > compiling > running > queued > finished
         """
         priority_map = {
@@ -50,7 +51,7 @@ class TaskStatus(Enum):
     def get_valid_transitions(cls):
         """获取有效的状态转换"""
         return {
-            cls.QUEUED: [cls.COMPILING, cls.ERROR, cls.COMPILED],
+            cls.QUEUED: [cls.COMPILING, cls.ERROR, cls.COMPILED, cls.NOT_QUEUED],  # 入队失败时回退为NOT_QUEUED
             cls.COMPILING: [cls.COMPILED, cls.ERROR, cls.COMPILED_FAILED],
             cls.COMPILED: [cls.RUNNING, cls.ERROR],
             cls.RUNNING: [cls.FINISHED, cls.ERROR],
@@ -73,6 +74,8 @@ TASK_MODEL_ALGORITHM_MAX_LEN = 50
 TASK_MODEL_ERROR_LOG_MAX_LEN = 16777215  # 16MB, MySQL MEDIUMTEXT max length
 TASK_EXPIRE_TIME = 24 * 60 * 60  # 24 hours in seconds, used to check if task is expired
 TASK_ENQUEUE_TIME = 12 * 60 * 60  # 12 hours in seconds, used to check if task can be re-enqueued
+# 尚未运行完成的状态，编译完成后在公平队列中等待评测的任务仍计入用户的活跃提交
+ACTIVE_TASK_STATUSES = [TaskStatus.QUEUED, TaskStatus.COMPILING, TaskStatus.COMPILED, TaskStatus.RUNNING]
 
 
 def _sanitize_sensitive(_text):
@@ -91,7 +94,7 @@ def _sanitize_sensitive(_text):
 class TaskModel(db.Model):
     __tablename__ = 'task'
     task_id = db.Column(VARCHAR(36, charset='utf8mb4'), primary_key=True, default=lambda: str(uuid.uuid4()))
-    upload_id = db.Column(VARCHAR(36, charset='utf8mb4'), nullable=False)  # 标识是哪次提交, 后续upload应单独建表
+    upload_id = db.Column(VARCHAR(36, charset='utf8mb4'), nullable=False)  # 标识是哪次提交，提交记录见UploadModel
     loss_rate = db.Column(db.Float, nullable=False)  # 标识运行的环境,loss_rate
     buffer_size = db.Column(db.Integer, nullable=False)  # 标识运行的环境,buffer_size
     delay = db.Column(db.Integer, nullable=False)  # 标识运行的环境,delay
@@ -118,11 +121,23 @@ class TaskModel(db.Model):
     # TaskModel.query.filter_by(user_id=user.user_id, cname=cname)
     # 如果不确定，请将日志级别设置为debug（debug下默认打印query语句）或
     # 通过日志手动打印query语句检查是否不必要地加载了error_log
+    # 任务日志已改为保存在日志文件中（见app_backend/utils/task_log.py），新任务的error_log为空，
+    # 此列只保留改动前创建的任务的日志，读取完整日志时拼接在日志文件内容之前
     error_log = deferred(db.Column(MEDIUMTEXT(charset='utf8mb4'), nullable=False))  # 错误日志，默认不加载
     created_at = db.Column(db.DateTime, server_default=func.now(), nullable=False)
     updated_at = db.Column(db.DateTime, server_default=func.now(),
                            onupdate=func.now(), nullable=False)
 
+    # 已有数据库需执行 python -m app_backend.utils.db_indexes 创建新增的索引
+    __table_args__ = (
+        # 用户在课程中的任务，按状态筛选（上传数限制、排队位置）；前缀(user_id, cname)用于不按状态筛选的查询
+        db.Index('ix_task_user_cname_status', 'user_id', 'cname', 'task_status'),
+        # 同一次提交的任务（更新榜单、历史记录详情、提交记录聚合）
+        db.Index('ix_task_upload_id', 'upload_id'),
+        # 课程各状态的任务数统计
+        db.Index('ix_task_cname_status', 'cname', 'task_status'),
+    )
+
     def __repr__(self):
         return f'<Task {self.task_id}>'
 
@@ -137,6 +152,64 @@ class TaskModel(db.Model):
             db.session.rollback()
             raise
 
+    @classmethod
+    def save_all(cls, tasks):
+        """
+        在同一个事务中插入多个任务及其提交记录，只提交一次
+        :param tasks: TaskModel列表
+        """
+        from app_backend.model.upload_model import UploadModel  # 避免循环导入
+        logger.debug(f"Saving {len(tasks)} tasks in one transaction")
+        try:
+            db.session.add_all(tasks)
+            db.session.add_all(UploadModel.from_tasks(tasks))
+            db.session.commit()
+            logger.info(f"{len(tasks)} tasks saved successfully")
+        except Exception as e:
+            logger.error(f"Error saving {len(tasks)} tasks: {str(e)}", exc_info=True)
+            db.session.rollback()
+            raise
+
+    @classmethod
+    def bulk_update_status(cls, task_ids, from_status, to_status):
+        """
+        使用一条UPDATE语句将多个任务从from_status改为to_status，并追加状态变化日志，提交记录的聚合状态在同一事务中更新。
+        只更新当前状态仍为from_status的任务，已被其他进程修改状态的任务不受影响，也不追加日志。
+        :param task_ids: 任务id列表
+        :param from_status: 当前状态
+        :param to_status: 目标状态
+        :return: 实际更新的任务数
+        """
+        if not task_ids:
+            return 0
+        if not from_status.can_transition_to(to_status):
+            raise ValueError(f"Invalid status transition from {from_status.value} to {to_status.value}")
+        from app_backend.model.upload_model import UploadModel  # 避免循环导入
+        logger.info(f"Status of {len(task_ids)} tasks changing from {from_status.value} to {to_status.value}")
+        try:
+            upload_ids = db.session.query(cls.upload_id).filter(cls.task_id.in_(task_ids)).distinct()
+            uploads = UploadModel.lock([upload_id for upload_id, in upload_ids])
+            # 加锁读出仍为from_status的任务，提交前其他事务无法修改这些任务的状态，只为这些任务追加日志
+            changed_ids = [task_id for task_id, in db.session.query(cls.task_id).filter(
+                cls.task_id.in_(task_ids),
+                cls.task_status == from_status
+            ).with_for_update()]
+            if changed_ids:
+                cls.query.filter(cls.task_id.in_(changed_ids)).update({cls.task_status: to_status},
+                                                                      synchronize_session=False)
+                UploadModel.refresh(uploads)
+            db.session.commit()
+        except Exception as e:
+            logger.error(f"Error updating status of {len(task_ids)} tasks: {str(e)}", exc_info=True)
+            db.session.rollback()
+            raise
+        updated = len(changed_ids)
+        for task_id in changed_ids:
+            cls.append_log(task_id, f"Task status changing: {from_status.value} -> {to_status.value}")
+        if updated != len(task_ids):
+            logger.warning(f"Only {updated}/{len(task_ids)} tasks changed from {from_status.value} to {to_status.value}")
+        return updated
+
     @classmethod
     def count(cls, **kwargs):
         """
@@ -149,27 +222,58 @@ class TaskModel(db.Model):
             query = query.filter_by(**kwargs)
         return query.scalar()
 
-    def update_task_log(self, log_content):
+    @classmethod
+    def count_by_status(cls, **kwargs):
+        """
+        使用一条GROUP BY task_status查询统计各状态的任务数量，按课程筛选时只读取(cname, task_status)索引。
+        :param kwargs: 过滤条件，例如 cname='some_course'
+        :return: {TaskStatus: 任务数量}，包含所有状态
+        """
+        query = db.session.query(cls.task_status, func.count(cls.task_id))
+        if kwargs:
+            query = query.filter_by(**kwargs)
+        counts = dict(query.group_by(cls.task_status).all())
+        return {status: counts.get(status, 0) for status in TaskStatus}
+
+    @staticmethod
+    def append_log(task_id, log_content):
         """
-            更新任务日志，更新task对象的日志，到下一次调用TaskModel update时才写入数据库
+            追加任务日志，立即写入任务的日志文件，只需task_id，不需要加载任务
+            :param task_id: 任务id
             :param log_content: 日志内容
+            :return: 写入后的日志大小（字节）
             """
         log_content = _sanitize_sensitive(log_content)
-        self.error_log += f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {log_content}\n"
-        # 按 utf-8 编码后的字节长度判断
-        max_bytes = TASK_MODEL_ERROR_LOG_MAX_LEN
-        error_log_bytes = self.error_log.encode('utf-8')
-        if len(error_log_bytes) > max_bytes:
-            logger.warning(
-                f"[task: {self.task_id}] task log length {len(error_log_bytes)} bytes exceeds maximum length of {max_bytes} bytes, truncating.")
-            truncated = error_log_bytes[:max_bytes - 1000].decode('utf-8', errors='ignore')
-            self.error_log = truncated + '...\nlog is too long and has been truncated.\n'
+        return append_task_log(task_id, f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {log_content}\n",
+                               TASK_MODEL_ERROR_LOG_MAX_LEN)
+
+    def update_task_log(self, log_content):
+        """
+            更新任务日志，立即追加到任务的日志文件，不再读取和重写数据库中已有的日志，无需调用update写入
+            :param log_content: 日志内容
+            """
+        self.append_log(self.task_id, log_content)
         logger.info(f"[task: {self.task_id}] Task log updated successfully")
 
+    def read_log(self, since=None):
+        """
+            读取任务日志
+            :param since: 起始偏移量（字节），为上一次读取返回的偏移量，为None时读取完整日志（包括error_log列中改动前的日志）
+            :return: (日志内容, 下一次读取的偏移量)
+            """
+        if since is not None:
+            return read_task_log(self.task_id, since)
+        log, offset = read_task_log(self.task_id)
+        return self.error_log + log, offset
+
     def update(self, **kwargs):
+        from app_backend.model.upload_model import UploadModel  # 避免循环导入
         logger.debug(f"[task: {self.task_id}] Updating task with parameters: {kwargs}")
+        status_log = None
         try:
             with db.session.begin_nested():
+                # 状态或分数变化时同一事务中更新提交记录，先锁定提交记录再修改任务
+                uploads = UploadModel.lock([self.upload_id]) if kwargs.keys() & {'task_status', 'task_score'} else []
                 # 检查状态转换是否有效
                 if 'task_status' in kwargs:
                     current_status = self.task_status
@@ -178,16 +282,20 @@ class TaskModel(db.Model):
                         raise ValueError(f"Invalid status transition from {current_status.value} to {new_status.value}")
                     logger.info(
                         f"[task: {self.task_id}] Status changing from {current_status.value} to {new_status.value}")
-                    self.update_task_log(f"Task status changing: {current_status.value} -> {new_status.value}")
+                    # 提交成功后才写入任务日志，回滚时日志中不会出现未发生的状态变化
+                    status_log = f"Task status changing: {current_status.value} -> {new_status.value}"
 
                 for key, value in kwargs.items():
                     setattr(self, key, value)
+                UploadModel.refresh(uploads)
                 db.session.commit()
             logger.info(f"[task: {self.task_id}] Task updated successfully")
         except Exception as e:
             logger.error(f"[task: {self.task_id}] Error updating task: {str(e)}", exc_info=True)
             db.session.rollback()
             raise e
+        if status_log:
+            self.update_task_log(status_log)
 
     def delete(self):
         logger.info(f"[task: {self.task_id}] Deleting task")
@@ -249,32 +357,3 @@ class TaskModel(db.Model):
         time_diff = self.get_time_since_created_seconds()
         return time_diff < TASK_ENQUEUE_TIME
 
-
-def to_history_dict(tasks: list):
-    # 将tasks按upload_id聚合，score求和。状态优先级：error > not_queued > compiling > queued > running > finished
-    upload_id_dict = {}
-
-    for task in tasks:
-        if task.upload_id not in upload_id_dict:
-            upload_id_dict[task.upload_id] = {
-                "cname": task.cname,
-                "algorithm": task.algorithm,
-                "created_time": task.created_time,
-                "status": task.task_status.value,
-                "score": task.task_score,
-                "upload_id": task.upload_id,
-                'updated_at': task.updated_at,
-                'created_at': task.created_at,
-            }
-        else:
-            task_status = task.task_status
-            current_status = TaskStatus(upload_id_dict[task.upload_id]['status'])
-
-            # 如果新状态优先级更高，则更新状态
-            if task_status.priority < current_status.priority:
-                upload_id_dict[task.upload_id]['status'] = task_status.value
-            if task.updated_at > upload_id_dict[task.upload_id]['updated_at']:
-                upload_id_dict[task.upload_id]['updated_at'] = task.updated_at
-            upload_id_dict[task.upload_id]['score'] += task.task_score
-
-    return list(upload_id_dict.values())
@@ -0,0 +1,178 @@
+import logging
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import case, func
+from sqlalchemy.dialects.mysql import VARCHAR
+
+from app_backend import db
+from app_backend.model.task_model import TaskModel, TaskStatus
+
+logger = logging.getLogger(__name__)
+
+# 状态优先级 -> 状态，聚合时取优先级最高（数字最小）的状态
+_PRIORITY_STATUS = {status.priority: status for status in TaskStatus}
+
+
+def _aggregate_query():
+    """
+    按upload_id聚合任务的查询，只返回聚合后的每次提交一行，不加载任务对象
+    状态取优先级最高的任务状态，分数求和，updated_at取最近一次任务更新的时间
+    """
+    status_priority = case(*[(TaskModel.task_status == status, status.priority) for status in TaskStatus])
+    return db.session.query(
+        TaskModel.upload_id,
+        func.min(TaskModel.user_id),
+        func.min(TaskModel.cname),
+        func.min(TaskModel.competition_id),
+        func.min(TaskModel.algorithm),
+        func.min(TaskModel.created_time),
+        func.min(status_priority),
+        func.sum(TaskModel.task_score),
+        func.count(TaskModel.task_id),
+        func.max(TaskModel.updated_at),
+        func.min(TaskModel.created_at),
+    ).group_by(TaskModel.upload_id)
+
+
+class UploadModel(db.Model):
+    """
+    提交记录，每次提交一行，保存该次提交所有任务的聚合状态、总分及trace数，
+    在任务状态或分数变化的同一事务中更新，查询历史记录时无需加载和聚合任务
+    """
+    __tablename__ = 'upload'
+    upload_id = db.Column(VARCHAR(36, charset='utf8mb4'), primary_key=True)
+    user_id = db.Column(VARCHAR(36, charset='utf8mb4'), db.ForeignKey('student.user_id'), nullable=False)
+    cname = db.Column(VARCHAR(50, charset='utf8mb4'), nullable=False)
+    competition_id = db.Column(db.Integer, db.ForeignKey('competition.id'), nullable=False)
+    algorithm = db.Column(VARCHAR(50, charset='utf8mb4'), nullable=False)  # 算法名称
+    created_time = db.Column(db.DateTime, nullable=False)  # 上传时间
+    status = db.Column(db.Enum(TaskStatus), nullable=False)  # 所有任务中优先级最高的状态
+    score = db.Column(db.Float, nullable=False, default=0)  # 所有任务的分数之和
+    trace_count = db.Column(db.Integer, nullable=False)  # 任务（trace）数
+    created_at = db.Column(db.DateTime, server_default=func.now(), nullable=False)
+    updated_at = db.Column(db.DateTime, server_default=func.now(), nullable=False)  # 最近一次任务更新的时间
+
+    __table_args__ = (
+        # 历史记录按用户和课程筛选，按上传时间倒序分页
+        db.Index('ix_upload_user_cname_created_time', 'user_id', 'cname', 'created_time'),
+        # 每日提交数统计，按上传时间范围查询
+        db.Index('ix_upload_cname_created_time', 'cname', 'created_time'),
+        db.Index('ix_upload_created_time', 'created_time'),
+    )
+
+    def __repr__(self):
+        return f'<Upload {self.upload_id}>'
+
+    @classmethod
+    def from_tasks(cls, tasks):
+        """
+        根据新创建的任务构建提交记录，与任务在同一事务中插入
+        :param tasks: 同一次或多次提交的TaskModel列表
+        :return: UploadModel列表，每个upload_id一个
+        """
+        uploads = {}
+        for task in tasks:
+            upload = uploads.get(task.upload_id)
+            if upload is None:
+                uploads[task.upload_id] = cls(upload_id=task.upload_id, user_id=task.user_id, cname=task.cname,
+                                              competition_id=task.competition_id, algorithm=task.algorithm,
+                                              created_time=task.created_time, status=task.task_status,
+                                              score=task.task_score or 0, trace_count=1)
+                continue
+            if task.task_status.priority < upload.status.priority:
+                upload.status = task.task_status
+            upload.score += task.task_score or 0
+            upload.trace_count += 1
+        return list(uploads.values())
+
+    @classmethod
+    def from_aggregate(cls, row):
+        """根据_aggregate_query()的一行构建提交记录"""
+        upload = cls(upload_id=row[0])
+        upload.apply_aggregate(row)
+        return upload
+
+    def apply_aggregate(self, row):
+        (_, self.user_id, self.cname, self.competition_id, self.algorithm, self.created_time,
+         priority, score, self.trace_count, self.updated_at, self.created_at) = row
+        self.status = _PRIORITY_STATUS[priority]
+        self.score = score or 0
+
+    @classmethod
+    def lock(cls, upload_ids):
+        """
+        锁定提交记录（SELECT ... FOR UPDATE），须在修改任务之前调用，
+        同一次提交的任务的修改因此串行执行，聚合值不会丢失更新，也不会因先锁任务后锁提交记录而死锁
+        :param upload_ids: upload_id列表
+        :return: 按upload_id排序的UploadModel列表，改动前创建、尚未回填的提交不在其中
+        """
+        return cls.query.filter(cls.upload_id.in_(upload_ids)).order_by(cls.upload_id).with_for_update().all()
+
+    @classmethod
+    def refresh(cls, uploads):
+        """
+        重新聚合提交记录，在修改任务之后、提交事务之前调用，与任务的修改一起提交。
+        聚合使用加锁读，读取其他事务已提交的最新数据，而不是本事务开始时的快照
+        :param uploads: lock()返回的UploadModel列表
+        """
+        if not uploads:
+            return
+        by_id = {upload.upload_id: upload for upload in uploads}
+        rows = _aggregate_query().filter(TaskModel.upload_id.in_(by_id)).with_for_update(read=True).all()
+        for row in rows:
+            by_id[row[0]].apply_aggregate(row)
+
+    @classmethod
+    def daily_counts(cls, days, **kwargs):
+        """
+        使用一条GROUP BY DATE(created_time)的范围查询统计最近若干天每天的提交数，
+        created_time上的范围条件可以使用索引
+        :param days: 天数，包括今天
+        :param kwargs: 过滤条件，例如 cname='some_course'
+        :return: [(日期, 提交数)]，从今天开始倒序，没有提交的日期数量为0
+        """
+        today = date.today()
+        dates = [today - timedelta(days=i) for i in range(days)]
+        day = func.date(cls.created_time)
+        query = db.session.query(day, func.count(cls.upload_id)).filter(
+            cls.created_time >= datetime.combine(dates[-1], time.min))
+        if kwargs:
+            query = query.filter_by(**kwargs)
+        # MySQL返回date，SQLite返回字符串，统一按字符串匹配
+        counts = {str(d): count for d, count in query.group_by(day).all()}
+        return [(d, counts.get(str(d), 0)) for d in dates]
+
+    @classmethod
+    def backfill(cls, batch_size=500):
+        """
+        为改动前创建的任务补建提交记录，使用一条GROUP BY查询聚合尚无提交记录的任务，分批插入
+        :param batch_size: 每次提交插入的记录数
+        :return: 插入的记录数
+        """
+        existing = db.session.query(cls.upload_id)
+        rows = _aggregate_query().filter(TaskModel.upload_id.notin_(existing)).all()
+        logger.info(f"Backfilling {len(rows)} uploads")
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            try:
+                db.session.add_all([cls.from_aggregate(row) for row in batch])
+                db.session.commit()
+            except Exception as e:
+                logger.error(f"Error backfilling uploads: {str(e)}", exc_info=True)
+                db.session.rollback()
+                raise
+            logger.info(f"Backfilled {start + len(batch)}/{len(rows)} uploads")
+        return len(rows)
+
+    def to_history_dict(self):
+        return {
+            "cname": self.cname,
+            "algorithm": self.algorithm,
+            "created_time": self.created_time,
+            "status": self.status.value,
+            "score": self.score,
+            "trace_count": self.trace_count,
+            "upload_id": self.upload_id,
+            'updated_at': self.updated_at,
+            'created_at': self.created_at,
+        }
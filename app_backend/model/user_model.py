@@ -85,6 +85,19 @@ class UserModel(db.Model):
             query = query.filter_by(**kwargs)
         return query.scalar()
 
+    @classmethod
+    def count_by(cls, column, **kwargs):
+        """
+        使用一条GROUP BY查询按列分组统计用户数量。
+        :param column: 分组的列，例如 UserModel.role
+        :param kwargs: 过滤条件，例如 is_deleted=False
+        :return: {列的值: 用户数量}，没有用户的值不在其中
+        """
+        query = db.session.query(column, func.count(cls.user_id))
+        if kwargs:
+            query = query.filter_by(**kwargs)
+        return dict(query.group_by(column).all())
+
     def set_password(self, raw_password):
         self.password = hashlib.sha256(raw_password.encode('utf-8')).hexdigest()
         self.reset_user_auth_cache()
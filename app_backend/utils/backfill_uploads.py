@@ -0,0 +1,21 @@
+"""
+为改动前创建的任务补建提交记录（upload表）。后端启动时会自动执行，启动时补建失败（日志中有
+"Failed to backfill uploads"）时可手动执行，可重复执行，只补建缺少的记录。
+
+用法（在项目根目录执行，需要与后端相同的环境配置）：
+    python -m app_backend.utils.backfill_uploads
+"""
+
+from app_backend import create_app
+from app_backend.model.upload_model import UploadModel
+
+
+def main():
+    app = create_app()
+    with app.app_context():
+        count = UploadModel.backfill()
+    print(f"Backfilled {count} uploads")
+
+
+if __name__ == '__main__':
+    main()
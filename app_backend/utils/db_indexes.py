@@ -0,0 +1,131 @@
+"""
+数据库索引的迁移及查询计划检查。
+
+db.create_all()只创建不存在的表，不会为已有的表补建模型中新增的索引。部署新增索引的版本后执行一次：
+    python -m app_backend.utils.db_indexes
+只创建缺少的索引，可重复执行。
+
+检查热点查询的执行计划（MySQL EXPLAIN），存在全表扫描的查询时以非0状态码退出：
+    python -m app_backend.utils.db_indexes --explain
+数据量很少时优化器可能认为全表扫描更快，请在数据量接近生产环境的数据库上检查。
+
+在项目根目录执行，需要与后端相同的环境配置。
+"""
+
+import argparse
+import logging
+import sys
+from datetime import datetime
+
+from sqlalchemy import func, inspect, select, text
+
+from app_backend import create_app, db
+from app_backend.model.graph_model import GraphModel, GraphType
+from app_backend.model.rank_model import RankModel
+from app_backend.model.task_model import ACTIVE_TASK_STATUSES, TaskModel, TaskStatus
+from app_backend.model.upload_model import UploadModel
+
+logger = logging.getLogger(__name__)
+
+INDEXED_MODELS = [TaskModel, UploadModel, GraphModel, RankModel]
+
+
+def ensure_indexes():
+    """
+    为已有的表创建模型中定义但数据库中缺少的索引
+    :return: 创建的索引名称列表
+    """
+    inspector = inspect(db.engine)
+    created = []
+    for model in INDEXED_MODELS:
+        table = model.__table__
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            logger.info(f"Creating index {index.name} on {table.name}")
+            index.create(db.engine)
+            created.append(index.name)
+    return created
+
+
+def hot_queries():
+    """
+    热点查询，与视图和任务中的查询条件相同，参数为示例值
+    :return: [(名称, select语句)]
+    """
+    user_id = '00000000-0000-0000-0000-000000000000'
+    upload_id = '00000000-0000-0000-0000-000000000001'
+    task_id = '00000000-0000-0000-0000-000000000002'
+    cname = 'cname'
+    return [
+        ('task by user, cname and status',
+         select(TaskModel.upload_id).distinct().where(
+             TaskModel.user_id == user_id, TaskModel.cname == cname,
+             TaskModel.task_status.in_(ACTIVE_TASK_STATUSES))),
+        ('task by upload_id',
+         select(TaskModel.task_id).where(TaskModel.upload_id == upload_id)),
+        ('task count by cname and status',
+         select(func.count(TaskModel.task_id)).where(TaskModel.cname == cname,
+                                                     TaskModel.task_status == TaskStatus.FINISHED)),
+        ('upload history by user and cname',
+         select(UploadModel.upload_id).where(UploadModel.user_id == user_id, UploadModel.cname == cname)
+         .order_by(UploadModel.created_time.desc()).limit(20)),
+        ('upload daily count by cname',
+         select(func.date(UploadModel.created_time), func.count(UploadModel.upload_id))
+         .where(UploadModel.cname == cname, UploadModel.created_time >= datetime(2000, 1, 1))
+         .group_by(func.date(UploadModel.created_time))),
+        ('graph by task and type',
+         select(GraphModel.graph_id).where(GraphModel.task_id == task_id,
+                                           GraphModel.graph_type == GraphType.THROUGHPUT)),
+        ('rank by cname',
+         select(RankModel.rank_id).where(RankModel.cname == cname)),
+        ('rank by competition_id',
+         select(RankModel.rank_id).where(RankModel.competition_id == 1)),
+    ]
+
+
+def full_scans(plan):
+    """
+    :param plan: MySQL EXPLAIN的结果行（字典）
+    :return: 全表扫描（type为ALL）的表名列表
+    """
+    return [row['table'] for row in plan if row.get('type') == 'ALL']
+
+
+def explain_hot_queries():
+    """
+    使用EXPLAIN检查热点查询的执行计划
+    :return: {查询名称: 全表扫描的表名列表}，只包含存在全表扫描的查询
+    """
+    problems = {}
+    for name, statement in hot_queries():
+        sql = statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+        plan = [dict(row._mapping) for row in db.session.execute(text(f"EXPLAIN {sql}"))]
+        tables = full_scans(plan)
+        steps = [f"{row['table']}({row['type']}, key={row['key']})" for row in plan]
+        print(f"{name}: {', '.join(steps)}")
+        if tables:
+            problems[name] = tables
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="创建缺少的索引，或检查热点查询的执行计划")
+    parser.add_argument('--explain', action='store_true', help="检查热点查询是否存在全表扫描")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if not args.explain:
+            created = ensure_indexes()
+            print(f"Created {len(created)} indexes: {', '.join(created)}")
+            return
+        problems = explain_hot_queries()
+    for name, tables in problems.items():
+        print(f"Full table scan in '{name}': {', '.join(tables)}", file=sys.stderr)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+评测端口分配。空闲端口保存在Redis集合中，分配时通过一个Lua脚本原子地弹出端口并写入租约（有序集合，分数为到期时间），
+只需一次Redis往返。任务运行期间由后台线程续租，任务结束后归还端口；
+worker崩溃导致租约到期的端口由回收线程放回空闲集合。
+"""
+
+import logging
+import socket
+import threading
+import time
+
+from app_backend import get_default_config
+
+logger = logging.getLogger(__name__)
+config = get_default_config()
+
+FREE_PORTS_KEY = 'port_free'
+PORT_LEASES_KEY = 'port_leases'
+# 记录空闲集合对应的端口范围，范围变化或Redis数据丢失时重新初始化空闲集合
+PORT_RANGE_KEY = 'port_range'
+
+# KEYS: 空闲集合, 租约, 端口范围  ARGV: 起始端口, 结束端口, 租约时长（秒）
+_ALLOCATE_SCRIPT = """
+local range = ARGV[1] .. '-' .. ARGV[2]
+if redis.call('GET', KEYS[3]) ~= range then
+    redis.call('DEL', KEYS[1])
+    local batch = {}
+    for port = tonumber(ARGV[1]), tonumber(ARGV[2]) do
+        if not redis.call('ZSCORE', KEYS[2], port) then
+            batch[#batch + 1] = port
+            if #batch == 1000 then
+                redis.call('SADD', KEYS[1], unpack(batch))
+                batch = {}
+            end
+        end
+    end
+    if #batch > 0 then
+        redis.call('SADD', KEYS[1], unpack(batch))
+    end
+    redis.call('SET', KEYS[3], range)
+end
+local port = redis.call('SPOP', KEYS[1])
+if not port then
+    return false
+end
+local now = redis.call('TIME')
+redis.call('ZADD', KEYS[2], tonumber(now[1]) + tonumber(ARGV[3]), port)
+return port
+"""
+
+# KEYS: 空闲集合, 租约  ARGV: 端口  只归还仍持有租约的端口，已被回收的端口不会重复放入空闲集合
+_RELEASE_SCRIPT = """
+if redis.call('ZREM', KEYS[2], ARGV[1]) == 1 then
+    redis.call('SADD', KEYS[1], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+# KEYS: 空闲集合, 租约  ARGV: 起始端口, 结束端口  不在当前端口范围内的端口只删除租约
+_RECLAIM_SCRIPT = """
+local now = redis.call('TIME')
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now[1])
+for _, port in ipairs(expired) do
+    redis.call('ZREM', KEYS[2], port)
+    local p = tonumber(port)
+    if p >= tonumber(ARGV[1]) and p <= tonumber(ARGV[2]) then
+        redis.call('SADD', KEYS[1], port)
+    end
+end
+return #expired
+"""
+
+_heartbeats = {}
+_heartbeats_lock = threading.Lock()
+_reclaimer = None
+
+
+def _port_range():
+    return config.Port.RANGE_START, config.Port.RANGE_END
+
+
+def _bindable(port):
+    """端口未被Redis以外的程序占用，注：receiver绑定的是ipv6地址"""
+    with socket.socket(socket.AF_INET6, socket.SOCK_DGRAM) as s:
+        try:
+            s.bind(("", port))
+            return True
+        except OSError as e:
+            logger.warning(f"Port {port} maybe in use, error msg: {str(e)}")
+            return False
+
+
+def _heartbeat(port, redis_client, stop_event):
+    """定期续租，直到端口归还"""
+    interval = max(config.Port.LEASE_SECONDS / 3, 1)
+    while not stop_event.wait(interval):
+        try:
+            now = int(redis_client.time()[0])
+            # xx=True 只更新已有的租约，租约已被回收时不重新占用
+            redis_client.zadd(PORT_LEASES_KEY, {port: now + config.Port.LEASE_SECONDS}, xx=True)
+            if redis_client.zscore(PORT_LEASES_KEY, port) is None:
+                logger.error(f"Lease of port {port} has been reclaimed while still in use")
+                return
+        except Exception as e:
+            logger.warning(f"Failed to renew lease of port {port}: {str(e)}")
+
+
+def _reclaim_loop(redis_client):
+    while True:
+        try:
+            reclaimed = reclaim_expired_ports(redis_client)
+            if reclaimed:
+                logger.warning(f"Reclaimed {reclaimed} ports with expired leases")
+        except Exception as e:
+            logger.warning(f"Failed to reclaim expired ports: {str(e)}")
+        time.sleep(config.Port.LEASE_SECONDS)
+
+
+def _ensure_reclaimer(redis_client):
+    """每个进程启动一个回收线程，回收脚本是原子的，多个进程同时回收不会冲突"""
+    global _reclaimer
+    with _heartbeats_lock:
+        if _reclaimer is None:
+            _reclaimer = threading.Thread(target=_reclaim_loop, args=(redis_client,), name='port-reclaimer',
+                                          daemon=True)
+            _reclaimer.start()
+
+
+def reclaim_expired_ports(redis_client):
+    """
+    将租约已到期的端口放回空闲集合
+    :return: 回收的端口数
+    """
+    start, end = _port_range()
+    return redis_client.eval(_RECLAIM_SCRIPT, 2, FREE_PORTS_KEY, PORT_LEASES_KEY, start, end)
+
+
+def get_available_port(redis_client):
+    """
+    分配一个空闲端口并持有租约，运行期间自动续租，使用完毕后需调用release_port归还
+    :param redis_client: Redis客户端
+    :return: 端口号
+    """
+    _ensure_reclaimer(redis_client)
+    start, end = _port_range()
+    while True:
+        port = redis_client.eval(_ALLOCATE_SCRIPT, 3, FREE_PORTS_KEY, PORT_LEASES_KEY, PORT_RANGE_KEY,
+                                 start, end, config.Port.LEASE_SECONDS)
+        if port is None:
+            logger.error(f"No available ports found in range {start}-{end}")
+            raise Exception("No available port")
+        port = int(port)
+        # 被其他程序占用的端口保留租约不续租，到期后由回收线程放回空闲集合，期间不会再被分配
+        if _bindable(port):
+            break
+
+    stop_event = threading.Event()
+    with _heartbeats_lock:
+        _heartbeats[port] = stop_event
+    threading.Thread(target=_heartbeat, args=(port, redis_client, stop_event), name=f'port-heartbeat-{port}',
+                     daemon=True).start()
+    logger.info(f"Found and allocated port {port}")
+    return port
+
+
+def release_port(port, redis_client):
+    """
+    停止续租并将端口归还空闲集合
+    :param port: 端口号
+    :param redis_client: Redis客户端
+    """
+    with _heartbeats_lock:
+        stop_event = _heartbeats.pop(port, None)
+    if stop_event:
+        stop_event.set()
+    logger.debug(f"Releasing lease of port {port}")
+    if redis_client.eval(_RELEASE_SCRIPT, 2, FREE_PORTS_KEY, PORT_LEASES_KEY, port):
+        logger.info(f"Successfully released port {port}")
+    else:
+        logger.warning(f"Port {port} has no lease, it may have been reclaimed")
@@ -0,0 +1,84 @@
+"""
+任务日志存储。每个任务的日志保存在独立的文件中，只追加写入，追加一条日志只需一次write，
+不再读取、重新编码并写回数据库中的整段日志；文件大小即为下一次读取的偏移量，读取时可从指定偏移量开始，只返回新增部分。
+日志文件按task_id存放，只知道task_id时也能写入日志。
+每次追加后通过Redis发布新的日志大小，日志流接口据此推送新增的日志，无需轮询。
+"""
+
+import logging
+import os
+
+from app_backend import get_default_config, redis_client
+
+logger = logging.getLogger(__name__)
+config = get_default_config()
+
+TRUNCATED_MARK = '...\nlog is too long and has been truncated.\n'.encode('utf-8')
+
+
+def task_log_path(task_id):
+    """日志文件按task_id的前两位分目录存放，避免单个目录中文件过多"""
+    return os.path.join(config.TaskLog.DIR, task_id[:2], f'{task_id}.log')
+
+
+def task_log_channel(task_id):
+    """日志追加通知的Redis频道，消息内容为追加后的日志大小"""
+    return f'task_log:{task_id}'
+
+
+def _publish(task_id, size):
+    try:
+        redis_client.publish(task_log_channel(task_id), size)
+    except Exception as e:
+        # 通知失败只影响日志流的实时性，日志已写入
+        logger.warning(f"[task: {task_id}] Failed to publish task log notification: {str(e)}")
+
+
+def append_task_log(task_id, content, max_bytes):
+    """
+    追加任务日志，日志超过max_bytes时截断，之后的日志不再写入
+    :param task_id: 任务id
+    :param content: 日志内容
+    :param max_bytes: 日志文件的最大字节数
+    :return: 写入后的日志大小（字节），即下一次读取的偏移量
+    """
+    path = task_log_path(task_id)
+    data = content.encode('utf-8')
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        size = os.fstat(fd).st_size
+        # 未截断的日志不超过max_bytes - len(TRUNCATED_MARK)，写入截断标记后一定超过这个大小，
+        # 截断时按UTF-8字符边界丢弃的字节使文件可能略小于max_bytes，不能以max_bytes判断
+        if size > max_bytes - len(TRUNCATED_MARK):
+            # 已截断
+            return size
+        if size + len(data) > max_bytes - len(TRUNCATED_MARK):
+            logger.warning(
+                f"[task: {task_id}] task log length exceeds maximum length of {max_bytes} bytes, truncating.")
+            room = max(max_bytes - len(TRUNCATED_MARK) - size, 0)
+            data = data[:room].decode('utf-8', errors='ignore').encode('utf-8') + TRUNCATED_MARK
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+    _publish(task_id, size + len(data))
+    return size + len(data)
+
+
+def read_task_log(task_id, since=0):
+    """
+    读取任务日志
+    :param task_id: 任务id
+    :param since: 起始偏移量（字节），为上一次读取返回的偏移量
+    :return: (日志内容, 下一次读取的偏移量)
+    """
+    try:
+        with open(task_log_path(task_id), 'rb') as f:
+            f.seek(since)
+            data = f.read()
+    except FileNotFoundError:
+        return '', since
+    return data.decode('utf-8', errors='replace'), since + len(data)
@@ -1,7 +1,6 @@
 import logging
 import os
 import random
-import socket
 import string
 from logging.config import dictConfig
 
@@ -14,42 +13,6 @@ from app_backend import get_default_config
 logger = logging.getLogger(__name__)
 
 
-def get_available_port(redis_client):
-    logger.debug("Searching for available port")
-    port = 50000
-    max_port = 65535
-    while port <= max_port:
-        lock_name = f"port_lock_{port}"
-        logger.debug(f"Attempting to acquire Redis lock for port {port}")
-        # 设置过期时间为600秒，单个task的运行时间一般不会超过600秒，如果超过，则应调大此值
-        result = redis_client.set(lock_name, "locked", nx=True, ex=600)
-
-        if result:
-            logger.debug(f"Successfully acquired Redis lock for port {port}")
-            # 注：receiver绑定的是ipv6地址
-            with socket.socket(socket.AF_INET6, socket.SOCK_DGRAM) as s:
-                try:
-                    s.bind(("", port))
-                    s.close()  # 释放端口
-                    logger.info(f"Found and allocated port {port}")
-                    return port
-                except OSError as e:
-                    logger.warning(f"Port {port} maybe in use, trying next port, error msg: {str(e)}")
-                    port += 1
-        else:
-            logger.debug(f"Failed to acquire Redis lock for port {port}, trying next port")
-            port += 1
-    logger.error("No available ports found in range 50000-65535")
-    raise Exception("No available port")
-
-
-def release_port(port, redis_client):
-    lock_name = f"port_lock_{port}"
-    logger.debug(f"Releasing Redis lock for port {port}")
-    redis_client.delete(lock_name)
-    logger.info(f"Successfully released port {port}")
-
-
 def setup_logger():
     """
     设置日志记录器
@@ -193,6 +193,12 @@ class UserChangeRealInfoSchema(BaseModel):
         return CommonValidators.validate_real_name(v)
 
 
+class HistoryRecordsSchema(BaseModel):
+    """获取历史记录列表请求参数验证"""
+    page: Optional[int] = Field(default=None, ge=1, description="页码，不传时返回全部记录（兼容不分页的旧版前端）")
+    size: int = Field(default=20, ge=1, le=100, description="每页大小，仅在传入page时生效")
+
+
 class HistoryDetailSchema(BaseModel):
     """获取历史记录详情请求参数验证"""
     upload_id: str = Field(..., description="上传ID")
@@ -205,6 +211,7 @@ class HistoryDetailSchema(BaseModel):
 class TaskLogSchema(BaseModel):
     """获取任务日志参数校验"""
     task_id: str = Field(..., description="任务ID")
+    since: Optional[int] = Field(None, ge=0, description="起始偏移量（字节），为上一次返回的offset，不传时返回完整日志")
 
 
 class EnqueueTaskSchema(BaseModel):
@@ -236,6 +243,15 @@ class GraphSchema(BaseModel):
         return CommonValidators.validate_not_empty(v, "task_id")
 
 
+class GraphDataSchema(BaseModel):
+    """获取性能图数据请求参数验证"""
+    task_id: str = Field(..., description="任务ID")
+
+    @field_validator('task_id')
+    def validate_task_id(cls, v):
+        return CommonValidators.validate_not_empty(v, "task_id")
+
+
 class FileUploadSchema(BaseModel):
     """文件上传请求参数验证"""
     file: Optional[object] = Field(None, description="上传的文件")
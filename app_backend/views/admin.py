@@ -2,7 +2,7 @@ import logging
 import os
 import platform
 import time
-from datetime import date, datetime, timedelta
+from datetime import datetime
 
 import psutil
 from flask import Blueprint, Response, stream_with_context, current_app
@@ -14,7 +14,7 @@ from app_backend import db
 from app_backend import get_default_config
 from app_backend.model.competition_model import CompetitionModel
 from app_backend.model.task_model import TaskModel
-from app_backend.model.task_model import TaskStatus
+from app_backend.model.upload_model import UploadModel
 from app_backend.model.user_model import UserModel, UserRole
 from app_backend.security.admin_decorators import admin_required
 from app_backend.validators.decorators import validate_request, get_validated_data
@@ -434,50 +434,45 @@ def get_tasks():
     )
 
 
+# 每日提交数统计的天数（包括今天）
+DAILY_SUBMISSION_DAYS = 10
+
+
+def _task_stats(**kwargs):
+    """
+    各状态的任务数、总任务数及每日提交数，每项统计只需一条GROUP BY查询
+    :param kwargs: 过滤条件，例如 cname='some_course'
+    """
+    task_stats = {status.value: count for status, count in TaskModel.count_by_status(**kwargs).items()}
+    task_stats['total'] = sum(task_stats.values())
+    # 每日提交数从提交记录表统计，每次提交一行，无需对任务的upload_id去重
+    daily_counts = UploadModel.daily_counts(DAILY_SUBMISSION_DAYS, **kwargs)
+    task_stats['today_submit'] = daily_counts[0][1]
+    task_stats['daily_submissions'] = [{'date': day.strftime('%Y-%m-%d'), 'count': count}
+                                       for day, count in daily_counts]
+    return task_stats
+
+
 @cache.memoize(timeout=30)
 def _get_general_stats():
     """获取通用统计信息的缓存函数（不依赖课程）"""
+    deleted_counts = UserModel.count_by(UserModel.is_deleted)
     user_stats = {
-        'total_users': UserModel.count(is_deleted=False),
-        'deleted_users': UserModel.count(is_deleted=True)
+        'total_users': deleted_counts.get(False, 0),
+        'deleted_users': deleted_counts.get(True, 0)
     }
 
     # 任务状态统计（所有课程）
-    all_course_task_stats = {
-        'total': TaskModel.count(),
-        # 计算今日提交数（通过统计今天创建的不同upload_id数量）
-        'today_submit': db.session.query(db.func.count(db.func.distinct(TaskModel.upload_id))).filter(
-            db.func.date(TaskModel.created_time) == date.today()
-        ).scalar()
-    }
-    for status in TaskStatus:
-        count = TaskModel.count(task_status=status)
-        all_course_task_stats[status.value] = count
-
-    # 添加过去10天每天的提交数量（所有课程）
-    daily_submissions = []
-    for i in range(10):
-        target_date = date.today() - timedelta(days=i)
-        daily_count = db.session.query(db.func.count(db.func.distinct(TaskModel.upload_id))).filter(
-            db.func.date(TaskModel.created_time) == target_date
-        ).scalar()
-        daily_submissions.append({
-            'date': target_date.strftime('%Y-%m-%d'),
-            'count': daily_count
-        })
-    all_course_task_stats['daily_submissions'] = daily_submissions
+    all_course_task_stats = _task_stats()
 
     # 比赛参与统计
-    competition_stats = {}
-    for course_name in config.Course.CNAME_LIST:
-        participant_count = CompetitionModel.count(cname=course_name)
-        competition_stats[course_name] = participant_count
+    participant_counts = CompetitionModel.count_by(CompetitionModel.cname)
+    competition_stats = {course_name: participant_counts.get(course_name, 0)
+                         for course_name in config.Course.CNAME_LIST}
 
     # 角色统计（仅统计未删除用户）
-    role_stats = {}
-    for role in UserRole:
-        count = UserModel.count(role=role, is_deleted=False)
-        role_stats[role.value] = count
+    role_counts = UserModel.count_by(UserModel.role, is_deleted=False)
+    role_stats = {role.value: role_counts.get(role, 0) for role in UserRole}
 
     logger.debug("General stats fetched successfully")
 
@@ -493,36 +488,7 @@ def _get_general_stats():
 def _get_course_specific_stats(cname):
     """根据课程名称获取课程特定统计信息的缓存函数"""
     # 本课程任务统计
-    current_course_task_stats = {}
-
-    # 统计当前课程各状态的任务数量
-    for status in TaskStatus:
-        count = TaskModel.count(cname=cname, task_status=status)
-        current_course_task_stats[status.value] = count
-
-    # 统计当前课程的总任务数
-    current_course_task_stats['total'] = TaskModel.count(cname=cname)
-
-    # 统计当前课程今日提交数
-    current_course_task_stats['today_submit'] = db.session.query(
-        db.func.count(db.func.distinct(TaskModel.upload_id))).filter(
-        TaskModel.cname == cname,
-        db.func.date(TaskModel.created_time) == date.today()
-    ).scalar()
-
-    # 添加过去10天每天的提交数量（当前课程）
-    current_course_daily_submissions = []
-    for i in range(10):
-        target_date = date.today() - timedelta(days=i)
-        daily_count = db.session.query(db.func.count(db.func.distinct(TaskModel.upload_id))).filter(
-            TaskModel.cname == cname,
-            db.func.date(TaskModel.created_time) == target_date
-        ).scalar()
-        current_course_daily_submissions.append({
-            'date': target_date.strftime('%Y-%m-%d'),
-            'count': daily_count
-        })
-    current_course_task_stats['daily_submissions'] = current_course_daily_submissions
+    current_course_task_stats = _task_stats(cname=cname)
     logger.debug(f"Course-specific stats for {cname} fetched successfully")
     return {
         'current_course_task_stats': current_course_task_stats
@@ -5,10 +5,10 @@ from flask import Blueprint
 from flask_jwt_extended import jwt_required, get_jwt, current_user
 
 from app_backend import get_default_config
-from app_backend.model.graph_model import GraphModel
+from app_backend.model.graph_model import GraphModel, get_graph_data_path
 from app_backend.model.task_model import TaskModel
 from app_backend.validators.decorators import validate_request, get_validated_data
-from app_backend.validators.schemas import GraphSchema
+from app_backend.validators.schemas import GraphSchema, GraphDataSchema
 from app_backend.vo.http_response import HttpResponse
 
 graph_bp = Blueprint('graph', __name__)
@@ -24,24 +24,11 @@ def get_graph():
     task_id = data.task_id
     graph_type = data.graph_type
     user = current_user
-    cname = get_jwt().get('cname')
 
-    # 管理员可查询所有课程的图
-    if current_user.is_admin():
-        logger.debug(f"Admin {current_user.username} requesting graph for task {task_id}, type {graph_type}")
-        task = TaskModel.query.filter_by(task_id=task_id).first()
-    # 普通用户保证只能查询当前课程（比赛）的图
-    else:
-        logger.debug(f"User {user.username} requesting graph for task {task_id}, type {graph_type}")
-        task = TaskModel.query.filter_by(task_id=task_id, cname=cname).first()
-
-    if not task:
-        logger.warning(f"Graph request failed: Task not found for task_id {task_id}")
-        return HttpResponse.not_found("任务不存在")
-    # 判断性能图是否被屏蔽
-    if not config.is_trace_available(cname, task.trace_name):
-        logger.warning(f"Graph request blocked for task {task_id}, type {graph_type} by user {user.username}")
-        return HttpResponse.fail("此性能图已被屏蔽，比赛结束后可查看")
+    logger.debug(f"User {user.username} requesting graph for task {task_id}, type {graph_type}")
+    task, error_response = _get_graph_task(task_id)
+    if error_response:
+        return error_response
 
     # 性能图所有用户都可查询，无需验证user_id
     logger.debug(f"Graph request for task {task_id}, type {graph_type} by user {user.username}")
@@ -56,3 +43,55 @@ def get_graph():
         return HttpResponse.not_found("图片不存在或已被删除")
     logger.debug(f"Sending graph file: {graph.graph_path}")
     return HttpResponse.send_attachment_file(graph.graph_path)
+
+
+@graph_bp.route("/graph_get_graph_data", methods=["GET"])
+@jwt_required()
+@validate_request(GraphDataSchema)
+def get_graph_data():
+    """
+    获取性能图数据（json），包含链路容量、各flow的入口/出口吞吐序列及降采样后的时延序列，供前端绘图。
+    数据由绘图任务生成后不再改变，响应带有ETag和Cache-Control头，浏览器重复请求时返回304
+    """
+    data = get_validated_data(GraphDataSchema)
+    task_id = data.task_id
+    user = current_user
+
+    logger.debug(f"User {user.username} requesting graph data for task {task_id}")
+    task, error_response = _get_graph_task(task_id)
+    if error_response:
+        return error_response
+
+    graph_data_path = get_graph_data_path(task.task_dir, task.trace_name)
+    if not os.path.exists(graph_data_path):
+        logger.warning(f"Graph data not found for task_id {task_id}, path={graph_data_path}")
+        return HttpResponse.not_found("性能图数据不存在，可能仍在后台生成中，请稍后再试")
+    logger.debug(f"Sending graph data file: {graph_data_path}")
+    return HttpResponse.send_cached_file(graph_data_path, mimetype='application/json',
+                                         max_age=config.Graph.DATA_CACHE_MAX_AGE)
+
+
+def _get_graph_task(task_id):
+    """
+    查询可查看性能图的任务
+    :param task_id: 任务ID
+    :return: (task, None)；任务不存在或性能图被屏蔽时返回 (None, 错误响应)
+    """
+    user = current_user
+    cname = get_jwt().get('cname')
+
+    # 管理员可查询所有课程的图
+    if current_user.is_admin():
+        task = TaskModel.query.filter_by(task_id=task_id).first()
+    # 普通用户保证只能查询当前课程（比赛）的图
+    else:
+        task = TaskModel.query.filter_by(task_id=task_id, cname=cname).first()
+
+    if not task:
+        logger.warning(f"Graph request failed: Task not found for task_id {task_id}")
+        return None, HttpResponse.not_found("任务不存在")
+    # 判断性能图是否被屏蔽
+    if not config.is_trace_available(cname, task.trace_name):
+        logger.warning(f"Graph request blocked for task {task_id} by user {user.username}")
+        return None, HttpResponse.fail("此性能图已被屏蔽，比赛结束后可查看")
+    return task, None
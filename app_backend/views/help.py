@@ -7,7 +7,7 @@ from flask_jwt_extended import jwt_required, get_jwt
 
 from app_backend import cache
 from app_backend import get_default_config
-from app_backend.model.task_model import TaskStatus
+from app_backend.model.task_model import ACTIVE_TASK_STATUSES
 from app_backend.views.admin import _get_course_specific_stats
 from app_backend.vo.http_response import HttpResponse
 
@@ -130,8 +130,9 @@ def _get_queue_status(cname):
     course_specific_stats = _get_course_specific_stats(cname)
     all_stats = course_specific_stats['current_course_task_stats']
     total_tasks = 0
-    for status in [TaskStatus.QUEUED.value, TaskStatus.COMPILING.value, TaskStatus.RUNNING.value]:
-        total_tasks += all_stats.get(status, 0)
+    # 编译完成后在公平队列中等待运行的任务为COMPILED状态，同样计入
+    for status in ACTIVE_TASK_STATUSES:
+        total_tasks += all_stats.get(status.value, 0)
 
     # 匹配区间
     if total_tasks < 10:
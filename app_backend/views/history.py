@@ -3,9 +3,11 @@ import logging
 from flask import Blueprint
 from flask_jwt_extended import jwt_required, get_jwt, current_user
 
-from app_backend.model.task_model import TaskModel, to_history_dict
+from app_backend import db
+from app_backend.model.task_model import TaskModel
+from app_backend.model.upload_model import UploadModel
 from app_backend.validators.decorators import validate_request, get_validated_data
-from app_backend.validators.schemas import HistoryDetailSchema
+from app_backend.validators.schemas import HistoryDetailSchema, HistoryRecordsSchema
 from app_backend.vo.http_response import HttpResponse
 
 history_bp = Blueprint('history', __name__)
@@ -14,17 +16,36 @@ logger = logging.getLogger(__name__)
 
 @history_bp.route("/history_get_history_records", methods=["GET"])
 @jwt_required()
+@validate_request(HistoryRecordsSchema)
 def return_history_records():
+    data = get_validated_data(HistoryRecordsSchema)
     user = current_user
     cname = get_jwt().get('cname')
-    logger.debug(f"History records request for user {user.username} in competition {cname}")
+    logger.debug(f"History records request for user {user.username} in competition {cname}, page: {data.page}")
 
-    query = TaskModel.query.filter_by(user_id=user.user_id, cname=cname)
+    # 提交记录中已保存聚合后的状态和分数，按(user_id, cname, created_time)索引分页查询，与任务数无关
+    query = UploadModel.query.filter_by(user_id=user.user_id, cname=cname)
     logger.debug(f"History records query: {query}")
-    history_records = query.all()
-    records = to_history_dict(history_records)
-    logger.debug(f"Found {len(records)} history records for user {user.username}")
-    return HttpResponse.ok(history=records)
+    if data.page is None:
+        # 未传入page时与改动前一致，返回全部记录，不返回分页信息
+        history_records = query.order_by(UploadModel.created_time.desc()).all()
+        records = [record.to_history_dict() for record in history_records]
+        logger.debug(f"Found {len(records)} history records for user {user.username}")
+        return HttpResponse.ok(history=records)
+
+    total = query.with_entities(db.func.count(UploadModel.upload_id)).scalar()
+    history_records = query.order_by(UploadModel.created_time.desc()) \
+        .offset((data.page - 1) * data.size) \
+        .limit(data.size) \
+        .all()
+    records = [record.to_history_dict() for record in history_records]
+    logger.debug(f"Found {len(records)}/{total} history records for user {user.username}")
+    return HttpResponse.ok(history=records, pagination={
+        'page': data.page,
+        'size': data.size,
+        'total': total,
+        'pages': (total + data.size - 1) // data.size
+    })
 
 
 @history_bp.route("/history_get_history_record_detail", methods=["POST"])
@@ -1,14 +1,19 @@
+import json
 import logging
+import threading
+import time
 import uuid
 from datetime import datetime
-from flask import Blueprint
+from flask import Blueprint, Response, request
 from flask_jwt_extended import jwt_required, get_jwt, current_user
 
-from app_backend import get_default_config, cache
-from app_backend.jobs.cctraining_job import enqueue_cc_task
+from app_backend import get_default_config, cache, redis_client
+from app_backend.jobs.cctraining_job import enqueue_cc_task, enqueue_multiple_tasks
+from app_backend.jobs.queue_eta import estimate_tasks
 from app_backend.model.competition_model import CompetitionModel
-from app_backend.model.task_model import TaskModel, TaskStatus, TASK_ENQUEUE_TIME
+from app_backend.model.task_model import TaskModel, TaskStatus, TASK_ENQUEUE_TIME, ACTIVE_TASK_STATUSES
 from app_backend.security.bypass_decorators import admin_bypass
+from app_backend.utils.task_log import read_task_log, task_log_channel
 from app_backend.utils.utils import generate_random_string
 from app_backend.utils.utils import get_record_by_permission
 from app_backend.validators.decorators import validate_request, get_validated_data
@@ -19,19 +24,23 @@ from app_backend.vo.http_response import HttpResponse
 task_bp = Blueprint('task', __name__)
 logger = logging.getLogger(__name__)
 config = get_default_config()
+# 日志流没有新日志时发送注释保持连接的间隔（秒）
+LOG_STREAM_KEEPALIVE = 10
+# 日志流连接会一直占用一个gunicorn线程，限制每个进程同时保持的连接数
+_log_stream_slots = threading.BoundedSemaphore(config.LogStream.MAX_CONNECTIONS)
 
 
 @admin_bypass
 def _check_upload_not_exceeds_limit(user, cname, max_active_uploads_per_user):
     """
-    检查用户当前课程处于运行中或者队列中的任务数量，同一个upload_id只算一次
+    检查用户当前课程处于运行中或者队列中（包括编译中及编译完成等待评测）的任务数量，同一个upload_id只算一次
     如果没超过，返回True，表示可以继续上传，否则返回False
     """
     running_or_queued_uploads = (
         TaskModel.query.filter(
             TaskModel.user_id == user.user_id,
             TaskModel.cname == cname,
-            TaskModel.task_status.in_([TaskStatus.RUNNING, TaskStatus.QUEUED])
+            TaskModel.task_status.in_(ACTIVE_TASK_STATUSES)
         )
         .with_entities(TaskModel.upload_id).distinct().count()
     )
@@ -81,7 +90,7 @@ def upload_project_file():
     # 构建task,按trace和env构建多个task
     task_ids = []
 
-    enqueue_results = []  # 收集所有入队结果
+    enqueue_traces = {}  # 需要入队的任务，task_id -> trace_name
     failed_tasks = []  # 记录失败的任务
     competition_id = (CompetitionModel.query.filter_by(cname=cname, user_id=user.user_id)
                       .first().id)
@@ -94,39 +103,48 @@ def upload_project_file():
     competition_remaining_time = config.get_competition_remaining_time(cname)
     allow_select_trace = (
             competition_remaining_time >= _config.get("force_all_traces_before_seconds", 3 * 24 * 60 * 60))
+    tasks = []
     for trace_name, trace_conf in _config['trace'].items():
         loss = trace_conf['loss_rate']
         buffer_size = trace_conf['buffer_size']
         delay = trace_conf['delay']
-        # 同一次上传对应的任务文件放在同一目录
-        task = TaskModel(user_id=user.user_id, task_status=TaskStatus.NOT_QUEUED, created_time=now_str,
-                         cname=cname, competition_id=competition_id, task_dir=upload_dir,
-                         algorithm=algorithm, trace_name=trace_name, upload_id=upload_id,
-                         loss_rate=loss, buffer_size=buffer_size, delay=delay, error_log='')
-
-        # 保存任务到数据库
-        task.save()
-        task_ids.append(task.task_id)
+        # 同一次上传对应的任务文件放在同一目录；预先生成task_id，提交后读取task_id无需逐个重新加载任务
+        task_id = str(uuid.uuid4())
+        tasks.append(TaskModel(task_id=task_id, user_id=user.user_id, task_status=TaskStatus.NOT_QUEUED,
+                               created_time=now_str, cname=cname, competition_id=competition_id,
+                               task_dir=upload_dir, algorithm=algorithm, trace_name=trace_name,
+                               upload_id=upload_id, loss_rate=loss, buffer_size=buffer_size, delay=delay,
+                               error_log=''))
+        task_ids.append(task_id)
         logger.debug(
-            f"[task: {task.task_id}] Created task for trace {trace_name}, loss {loss}, buffer {buffer_size}")
+            f"[task: {task_id}] Created task for trace {trace_name}, loss {loss}, buffer {buffer_size}")
 
-        # 发送任务到队列并检查结果
         if allow_select_trace and trace_name not in trace_list:
             continue  # 如果trace不在用户选择的列表中，跳过此trace
-        enqueue_result = enqueue_cc_task(task.task_id)
-        enqueue_results.append(enqueue_result)
+        enqueue_traces[task_id] = trace_name
 
+    # 在同一个事务中保存所有任务
+    TaskModel.save_all(tasks)
+    # 先提交QUEUED状态再入队，worker取到消息时一定能看到QUEUED状态，入队失败时回退为NOT_QUEUED；
+    # 状态变化使用一条UPDATE语句完成
+    TaskModel.bulk_update_status(list(enqueue_traces), TaskStatus.NOT_QUEUED, TaskStatus.QUEUED)
+    # 同一次提交的所有任务在一条消息中发送到编译队列，代码只编译一次
+    enqueue_summary = enqueue_multiple_tasks(list(enqueue_traces))
+    enqueue_results = enqueue_summary['results']
+    for enqueue_result in enqueue_results:
+        task_id = enqueue_result['task_id']
         if not enqueue_result['success']:
             failed_tasks.append({
-                'task_id': task.task_id,
-                'trace_name': trace_name,
+                'task_id': task_id,
+                'trace_name': enqueue_traces[task_id],
                 'error': enqueue_result['message']
             })
-            logger.error(f"[task: {task.task_id}] Failed to enqueue: {enqueue_result['message']}")
+            logger.error(f"[task: {task_id}] Failed to enqueue: {enqueue_result['message']}")
         else:
-            task.update(task_status=TaskStatus.QUEUED)
             logger.info(
-                f"[task: {task.task_id}] Successfully enqueued with message ID: {enqueue_result['message_id']}")
+                f"[task: {task_id}] Successfully enqueued with message ID: {enqueue_result['message_id']}")
+    TaskModel.bulk_update_status([task['task_id'] for task in failed_tasks], TaskStatus.QUEUED,
+                                 TaskStatus.NOT_QUEUED)
 
     # 统计入队结果
     successful_enqueues = sum(1 for result in enqueue_results if result['success'])
@@ -170,8 +188,124 @@ def get_task_log():
     if not task.log_permission():
         logger.warning(f"Task log request: User {current_user.username} has no permission for task {task_id}")
         return HttpResponse.forbidden("无权限访问该任务日志")
-    logger.info(f"User {current_user.username} fetched log for task {task_id}")
-    return HttpResponse.ok(log=task.error_log)
+    # 传入since时只返回上一次读取之后新增的日志
+    log, offset = task.read_log(data.since)
+    logger.info(f"User {current_user.username} fetched log for task {task_id} since {data.since}")
+    return HttpResponse.ok(log=log, offset=offset)
+
+
+def _sse_event(log, offset, retry=None):
+    """SSE事件，id为日志偏移量，客户端重连时通过Last-Event-ID带回"""
+    event = f"id: {offset}\n"
+    if retry is not None:
+        event += f"retry: {retry}\n"
+    return event + f"data: {json.dumps({'log': log, 'offset': offset}, ensure_ascii=False)}\n\n"
+
+
+def _task_log_events(task_id, prefix, since):
+    """
+    日志流，先推送since之后的日志，之后每次收到日志追加通知时只推送新增的日志。
+    连接保持LogStream.SECONDS秒后结束，客户端（EventSource）自动重连并通过Last-Event-ID从上次的偏移量继续
+    :param task_id: 任务id
+    :param prefix: 第一次推送时拼接在日志文件内容之前的内容（error_log列中改动前的日志）
+    :param since: 起始偏移量
+    """
+    # 在生成器中获取连接名额，客户端在开始读取前断开时不会占用名额
+    if not _log_stream_slots.acquire(blocking=False):
+        # 连接数已满，推送一次日志后结束，客户端稍后重连，相当于降级为低频轮询
+        log, offset = read_task_log(task_id, since)
+        yield _sse_event(prefix + log, offset, retry=config.LogStream.RETRY_MS)
+        return
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    try:
+        # 先订阅再读取，订阅前追加的日志也不会遗漏
+        pubsub.subscribe(task_log_channel(task_id))
+        log, offset = read_task_log(task_id, since)
+        yield _sse_event(prefix + log, offset)
+        deadline = time.monotonic() + config.LogStream.SECONDS
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if pubsub.get_message(timeout=min(LOG_STREAM_KEEPALIVE, remaining)) is None:
+                yield ": keepalive\n\n"
+                continue
+            log, offset = read_task_log(task_id, offset)
+            if log:
+                yield _sse_event(log, offset)
+    finally:
+        pubsub.close()
+        _log_stream_slots.release()
+
+
+# 任务日志流接口（Server-Sent Events），任务运行期间只推送新增的日志
+@task_bp.route("/task_stream_log", methods=["GET"])
+@jwt_required()
+@validate_request(TaskLogSchema)
+def stream_task_log():
+    data = get_validated_data(TaskLogSchema)
+    task_id = data.task_id
+    task = TaskModel.query.filter_by(task_id=task_id).first()
+    if not task:
+        logger.warning(f"Task log stream request: Task {task_id} not found")
+        return HttpResponse.not_found("任务不存在")
+    # 权限校验
+    if not task.log_permission():
+        logger.warning(f"Task log stream request: User {current_user.username} has no permission for task {task_id}")
+        return HttpResponse.forbidden("无权限访问该任务日志")
+    since = data.since
+    # EventSource自动重连时通过Last-Event-ID带回上次收到的偏移量
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    if last_event_id.isdigit():
+        since = int(last_event_id)
+    # 未传入偏移量时推送完整日志，包括error_log列中改动前的日志
+    prefix = task.error_log if since is None else ''
+    logger.info(f"User {current_user.username} streaming log for task {task_id} since {since}")
+    # 生成器中不访问数据库，请求上下文结束后数据库会话即可释放
+    return Response(_task_log_events(task_id, prefix, since or 0), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@cache.memoize(timeout=5)
+def _queue_eta_cache(user_id, cname):
+    """估计用户当前课程未完成任务的排队位置及预计开始、结束时间，短时间缓存，避免频繁轮询"""
+    tasks = (
+        TaskModel.query.filter(
+            TaskModel.user_id == user_id,
+            TaskModel.cname == cname,
+            TaskModel.task_status.in_(ACTIVE_TASK_STATUSES)
+        )
+        .order_by(TaskModel.created_at)
+        .with_entities(TaskModel.task_id, TaskModel.upload_id, TaskModel.trace_name, TaskModel.task_status)
+        .all()
+    )
+    estimates = estimate_tasks(redis_client, user_id,
+                               [(task.task_id, task.trace_name, task.task_status) for task in tasks])
+    queue = []
+    for task in tasks:
+        estimate = estimates.get(task.task_id)
+        queue.append({
+            'task_id': task.task_id,
+            'upload_id': task.upload_id,
+            'trace_name': task.trace_name,
+            'task_status': task.task_status.value,
+            'position': estimate['position'] if estimate else None,
+            'estimated_start': int(estimate['estimated_start']) if estimate else None,
+            'estimated_finish': int(estimate['estimated_finish']) if estimate else None,
+        })
+    return queue
+
+
+# 获取未完成任务的排队位置及预计开始、结束时间接口
+@task_bp.route("/task_get_queue_eta", methods=["GET"])
+@jwt_required()
+def get_queue_eta():
+    if not config.Scheduler.FAIR_SHARE:
+        return HttpResponse.fail("未启用公平调度，无法估计排队时间")
+    cname = get_jwt().get('cname')
+    queue = _queue_eta_cache(current_user.user_id, cname)
+    logger.debug(f"User {current_user.username} fetched queue eta for course {cname}: {len(queue)} tasks")
+    return HttpResponse.ok(queue=queue)
 
 
 @cache.memoize(timeout=60)
@@ -222,12 +356,13 @@ def enqueue_task():
     if task.task_status != TaskStatus.NOT_QUEUED:
         logger.info(f"Enqueue task: Task {task_id} status is {task.task_status}, not NOT_QUEUED")
         return HttpResponse.fail("该任务已入队或已运行，无需重复入队")
-    # 入队
+    # 入队，先提交QUEUED状态再发送消息，入队失败时回退为NOT_QUEUED
+    task.update(task_status=TaskStatus.QUEUED)
     enqueue_result = enqueue_cc_task(task.task_id)
     if enqueue_result['success']:
-        task.update(task_status=TaskStatus.QUEUED)
         logger.info(f"Task {task_id} successfully enqueued")
         return HttpResponse.ok()
     else:
+        task.update(task_status=TaskStatus.NOT_QUEUED)
         logger.error(f"Task {task_id} failed to enqueue: {enqueue_result['message']}")
         return HttpResponse.fail(f"任务入队失败: {enqueue_result['message']}")
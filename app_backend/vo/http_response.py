@@ -199,3 +199,20 @@ class HttpResponse:
             flask.Response: 以附件形式发送的文件响应
         """
         return send_file(file, mimetype=mimetype, as_attachment=True)
+
+    @staticmethod
+    def send_cached_file(file, mimetype=None, max_age=None):
+        """
+        发送内容不会改变的文件，附带ETag和Cache-Control头，浏览器重复请求时返回304
+        Args:
+            file (str): 文件路径
+            mimetype (str): 文件的MIME类型
+            max_age (int): 浏览器缓存时间（秒）
+        Returns:
+            flask.Response: 文件响应
+        """
+        resp = send_file(file, mimetype=mimetype, conditional=True, etag=True, max_age=max_age)
+        # 数据仅对登录用户可见，不允许代理服务器缓存
+        resp.cache_control.public = False
+        resp.cache_control.private = True
+        return resp
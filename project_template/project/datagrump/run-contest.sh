@@ -45,14 +45,27 @@ if [ -z "$receiver_pid" ]; then
     exit 1
 fi
 
-# Wait for a short moment to ensure receiver starts properly
-sleep 2
-
-# 检查 receiver 是否正常启动
-if ! ps -p "$receiver_pid" > /dev/null; then
-    echo [$(date "+%Y-%m-%d %H:%M:%S")] "Receiver process failed to start (PID: $receiver_pid). Check for port conflicts or other errors."
-    exit 1
-fi
+# 等待 receiver 绑定 UDP 端口后再启动 sender，/proc/net/udp(6) 中本地地址的端口为4位十六进制
+# 最多等待 receiver_ready_timeout 秒，receiver 提前退出时立即失败
+receiver_ready_timeout=10
+port_hex=$(printf ':%04X' "$running_port")
+receiver_ready() {
+    awk -v port="$port_hex" 'FNR > 1 && substr($2, length($2) - 4) == port { found = 1; exit } END { exit !found }' \
+        /proc/net/udp /proc/net/udp6 2>/dev/null
+}
+wait_deadline=$(($(date +%s) + receiver_ready_timeout))
+until receiver_ready; do
+    # 检查 receiver 是否正常启动
+    if ! ps -p "$receiver_pid" > /dev/null; then
+        echo [$(date "+%Y-%m-%d %H:%M:%S")] "Receiver process failed to start (PID: $receiver_pid). Check for port conflicts or other errors."
+        exit 1
+    fi
+    if [ "$(date +%s)" -ge "$wait_deadline" ]; then
+        echo [$(date "+%Y-%m-%d %H:%M:%S")] "Receiver did not bind port $running_port within ${receiver_ready_timeout}s."
+        exit 1
+    fi
+    sleep 0.05
+done
 
 # prefix=$(dirname $(which mm-link))
 # tracedir="$prefix/../share/mahimahi/traces"
@@ -21,6 +21,7 @@ parse_supervisor_config() {
         "%(ENV_DRAMATIQ_PROCESSES)s:$DRAMATIQ_PROCESSES"
         "%(ENV_DRAMATIQ_THREADS)s:$DRAMATIQ_THREADS"
         "%(ENV_DRAMATIQ_THREADS_GRAPH)s:$DRAMATIQ_THREADS_GRAPH"
+        "%(ENV_DRAMATIQ_THREADS_COMPILE)s:$DRAMATIQ_THREADS_COMPILE"
         "%(ENV_LOG_DIR)s:$LOG_DIR"
     )
 
@@ -141,7 +142,7 @@ display_config() {
     echo "  APP_ENV  = $APP_ENV"
     echo "  LOG_DIR  = $LOG_DIR"
     echo "  GUNICORN = $GUNICORN_ADDRESS(WORKERS:$GUNICORN_WORKERS, THREADS:$GUNICORN_THREADS)"
-    echo "  DRAMATIQ = (CC_TRAINING: P-$DRAMATIQ_PROCESSES T-$DRAMATIQ_THREADS, GRAPH: P-1 T-$DRAMATIQ_THREADS_GRAPH)"
+    echo "  DRAMATIQ = (COMPILE: P-1 T-$DRAMATIQ_THREADS_COMPILE, CC_TRAINING: P-$DRAMATIQ_PROCESSES T-$DRAMATIQ_THREADS, GRAPH: P-1 T-$DRAMATIQ_THREADS_GRAPH)"
 
     parse_supervisor_config "$CONFIG"
 }